@@ -66,10 +66,10 @@ def find_exits_for_rotunda(room, wall_count):
     exits = set()
     for wall in room['walls']:
         wall_tuple = (wall['x'], wall['y'], wall['dir']['x'], wall['dir']['y'])
-        if wall_count.get(wall_tuple, 0) > 1:
+        if wall_count.get(wall_tuple + (wall['level'],), 0) > 1:
             direction = determine_direction(wall)
             exits.add(direction)
-    room['exits'] = list(exits)
+    room['exits'] = sorted(exits)
 
 # Remove duplicate walls where rooms intersect
 def remove_duplicate_walls(rooms):
@@ -1,257 +1,325 @@
 import os
+import sys
 import json
-from collections import deque
+from collections import defaultdict, deque
 import random
 
+from pipeline_log import StageTimer, get_logger
+from room_lookup import TileRoomMap
+
+log = get_logger('add-stories')
+
 # Directory containing the JSON files
 directory = '.'
 
-def find_bridges(rooms, doors):
-    print("Starting ramp detection...")
+class RoomGraph:
+    """
+    Room adjacency graph of one layout, plus the per-room state the story passes work on.
 
-    # Initialize all rooms as unvisited and clear previous types and stories
-    for room in rooms:
-        room.pop('type', None)  # Remove any existing 'type'
-        room.pop('story', None)  # Remove any existing 'story'
-        room.pop('ramp_info', None)  # Remove any existing 'ramp_info'
-        room['type'] = None  # Initialize 'type' as None
-        room['story'] = None  # Initialize 'story' as None
-        room['ramp_info'] = None  # Initialize 'ramp_info' as None
-        print(f"Cleared 'type', 'story', and 'ramp_info' for room at ({room['x']}, {room['y']}).")
+    Adjacency comes from an edge-keyed spatial index: every unit wall segment on a room's
+    boundary is hashed by its position, so two rooms are adjacent exactly when they share a
+    segment key. The graph is built once per file in O(total perimeter); every pass then
+    reads neighbors and direction labels from it and updates `types`, `stories` and
+    `ramp_dirs` by room index. `write_back` copies the state into the rect dicts.
+    """
 
-    # Find the connected components
-    components = get_connected_components(rooms)
+    def __init__(self, rooms):
+        self.rooms = rooms
+
+        # ('v', x, y) is the unit segment from (x, y) to (x, y + 1), ('h', x, y) runs to (x + 1, y).
+        # Each key stores the rooms on its low side (west/south) and its high side (east/north).
+        segments = defaultdict(lambda: ([], []))
+        for room_index, room in enumerate(rooms):
+            x, y, w, h = room['x'], room['y'], room['w'], room['h']
+            for i in range(h):
+                segments[('v', x, y + i)][1].append(room_index)      # West edge
+                segments[('v', x + w, y + i)][0].append(room_index)  # East edge
+            for i in range(w):
+                segments[('h', x + i, y)][1].append(room_index)      # South edge
+                segments[('h', x + i, y + h)][0].append(room_index)  # North edge
+
+        # Direction of each neighbor relative to the room, keyed by neighbor index
+        neighbors = [{} for _ in rooms]
+        for (axis, _, _), (low_side, high_side) in segments.items():
+            for low in low_side:
+                for high in high_side:
+                    if low == high:
+                        continue
+                    neighbors[low][high] = 'east' if axis == 'v' else 'north'
+                    neighbors[high][low] = 'west' if axis == 'v' else 'south'
+
+        # Keep neighbors in rect order so queries match a linear scan of the rects
+        self.adjacent = [sorted(room_neighbors) for room_neighbors in neighbors]
+        self.directions = [
+            [(room_neighbors[other_index], other_index) for other_index in adjacent]
+            for room_neighbors, adjacent in zip(neighbors, self.adjacent)
+        ]
+
+        # Mutable room state, cleared like a fresh run
+        self.types = [None] * len(rooms)
+        self.stories = [None] * len(rooms)
+        self.ramp_dirs = [None] * len(rooms)
+
+    def __len__(self):
+        return len(self.rooms)
+
+    def neighbors(self, room_index):
+        """Indices of the rooms sharing a wall segment with the room."""
+        return self.adjacent[room_index]
+
+    def neighbors_by_direction(self, room_index):
+        """Neighbor indices keyed by direction; the last rect in layout order wins, as with a linear scan."""
+        return {direction: other_index for direction, other_index in self.directions[room_index]}
+
+    def is_ramp(self, room_index):
+        return self.types[room_index] == 'ramp'
+
+    def position(self, room_index):
+        room = self.rooms[room_index]
+        return room['x'], room['y']
+
+    def write_back(self):
+        """Store `type`, `story`, `ramp_info` and, for ramps, `ramp_dir` on the rect dicts."""
+        for room_index, room in enumerate(self.rooms):
+            room.pop('type', None)  # Remove any existing 'type'
+            room.pop('story', None)  # Remove any existing 'story'
+            room.pop('ramp_info', None)  # Remove any existing 'ramp_info'
+            room['type'] = self.types[room_index]
+            room['story'] = self.stories[room_index]
+            room['ramp_info'] = None
+            if self.is_ramp(room_index):
+                room['ramp_dir'] = self.ramp_dirs[room_index]
+        return self.rooms
+
+def find_bridges(graph, doors, tile_map, rooms_to_check=None, articulation_points=None):
+    """
+    Mark ramps: 1xN or Nx1 articulation points with neighbors on two opposite sides.
 
-    # Identify bridge rooms
-    for room_index, room in enumerate(rooms):
-        if is_valid_ramp(room, rooms, doors):
-            # Temporarily remove the room and test connectivity
-            remaining_rooms = [r for i, r in enumerate(rooms) if i != room_index]
-            new_components = get_connected_components(remaining_rooms)
+    Parameters:
+    - graph: RoomGraph of the layout.
+    - doors: Door objects of the layout.
+    - tile_map: TileRoomMap built from the layout's rects.
+    - rooms_to_check: Room indices to (re)classify (default = every room). Other rooms keep
+      their current `types`.
+    - articulation_points: Precomputed articulation points of `graph`, if available.
+    """
+    log.debug("Starting ramp detection...")
 
-            # If removing the room increases the number of components, it's a bridge
-            if len(new_components) > len(components):
-                room['type'] = 'ramp'
-                print(f"Room at ({room['x']}, {room['y']}) marked as ramp.")
+    # Rooms whose removal would split the dungeon, found in a single pass
+    if articulation_points is None:
+        articulation_points = find_articulation_points(graph)
+    candidates = range(len(graph)) if rooms_to_check is None else sorted(rooms_to_check)
 
-    # Resolve clusters of adjacent ramps
-    resolve_adjacent_ramps(rooms)
+    # Rooms containing a door that rules them out as ramps
+    disqualifying_door_types = {1, 2, 4, 6, 7}
+    rooms_with_disqualifying_doors = {
+        tile_map.room_index_at(door['x'], door['y'])
+        for door in doors if door['type'] in disqualifying_door_types
+    }
+
+    # Identify bridge rooms
+    for room_index in candidates:
+        if room_index in articulation_points and is_valid_ramp(room_index, graph, rooms_with_disqualifying_doors):
+            graph.types[room_index] = 'ramp'
+            log.debug("Room at (%s, %s) marked as ramp.", *graph.position(room_index))
+        else:
+            graph.types[room_index] = None
 
-    print("Ramp detection completed.")
-    return rooms
+    # Resolve clusters of adjacent ramps
+    resolve_adjacent_ramps(graph, rooms_to_check)
 
-def resolve_adjacent_ramps(rooms):
-    print("Resolving adjacent ramps...")
-    ramps = [room for room in rooms if room['type'] == 'ramp']
-    processed = set()
+    log.debug("Ramp detection completed.")
+    return graph
 
-    for ramp in ramps:
-        ramp_key = (ramp['x'], ramp['y'])  # Use (x, y) as a unique identifier
-        if ramp_key in processed:
-            continue
+def resolve_adjacent_ramps(graph, rooms_to_check=None):
+    log.debug("Resolving adjacent ramps...")
+    rooms = graph.rooms
 
-        # Find all connected ramps (orthogonal adjacency only)
-        cluster = find_adjacent_ramp_cluster(ramp, rooms)
+    for cluster in find_ramp_clusters(graph):
         if len(cluster) <= 1:
             continue  # No need to resolve single ramps
+        if rooms_to_check is not None and rooms_to_check.isdisjoint(cluster):
+            continue  # Resolved on an earlier run
 
-        print(f"Found ramp cluster with {len(cluster)} rooms.")
-        cluster.sort(key=lambda r: (r['x'], r['y']))  # Sort to ensure deterministic ordering
+        log.debug("Found ramp cluster with %d rooms.", len(cluster))
+        cluster.sort(key=lambda i: (rooms[i]['x'], rooms[i]['y']))  # Sort to ensure deterministic ordering
 
         # Determine the ramp to keep
-        if all(r['w'] == cluster[0]['w'] and r['h'] == cluster[0]['h'] for r in cluster):  # Same dimensions
+        first = rooms[cluster[0]]
+        if all(rooms[i]['w'] == first['w'] and rooms[i]['h'] == first['h'] for i in cluster):  # Same dimensions
             if len(cluster) % 2 == 1:
                 keep = cluster[len(cluster) // 2]  # Middle one
             else:
                 keep = random.choice(cluster)  # Pick one at random
         else:  # Keep the longest or widest ramp
-            keep = max(cluster, key=lambda r: max(r['w'], r['h']))
+            keep = max(cluster, key=lambda i: max(rooms[i]['w'], rooms[i]['h']))
 
         # Mark all other ramps in the cluster as non-ramps
-        for r in cluster:
-            r_key = (r['x'], r['y'])
-            if r != keep:
-                r['type'] = None
-                print(f"Removed ramp designation from room at ({r['x']}, {r['y']}).")
-            processed.add(r_key)  # Mark the room as processed
-
-def find_adjacent_ramp_cluster(start_ramp, rooms):
-    """Find all ramps in the same cluster using orthogonal adjacency."""
-    cluster = []
-    queue = deque([start_ramp])
-    visited = set()
-
-    while queue:
-        current = queue.popleft()
-        current_key = (current['x'], current['y'])
-        if current_key in visited:
-            continue
-        visited.add(current_key)
-        cluster.append(current)
+        for room_index in cluster:
+            if room_index != keep:
+                graph.types[room_index] = None
+                log.debug("Removed ramp designation from room at (%s, %s).", *graph.position(room_index))
 
-        # Add orthogonally adjacent ramps
-        for neighbor in find_adjacent_rooms(current, rooms):
-            neighbor_key = (neighbor['x'], neighbor['y'])
-            if neighbor['type'] == 'ramp' and neighbor_key not in visited:
-                queue.append(neighbor)
+def find_ramp_clusters(graph):
+    """
+    Group orthogonally adjacent ramps with a union-find over ramp-to-ramp adjacencies.
 
-    return cluster
+    Returns:
+    - List of clusters (lists of room indices), ordered by their first ramp in the layout.
+    """
+    parent = {room_index: room_index for room_index in range(len(graph)) if graph.is_ramp(room_index)}
+
+    def find(room_index):
+        root = room_index
+        while parent[root] != root:
+            root = parent[root]
+        while parent[room_index] != root:  # Path compression
+            parent[room_index], room_index = root, parent[room_index]
+        return root
+
+    for room_index in parent:
+        for neighbor in graph.neighbors(room_index):
+            if neighbor in parent:
+                root, neighbor_root = find(room_index), find(neighbor)
+                if root != neighbor_root:
+                    parent[max(root, neighbor_root)] = min(root, neighbor_root)
+
+    clusters = {}
+    for room_index in parent:
+        clusters.setdefault(find(room_index), []).append(room_index)
+    return list(clusters.values())
 
 # Assign stories and update ramps
-def assign_stories(rooms):
-    print("Starting story assignment...")
+def assign_stories(graph):
+    """
+    Assign a story to every room reachable from the entrance in one BFS over the room graph.
+
+    Non-ramp rooms share the story of the room they are reached from. A ramp takes the
+    story of the first room that reaches it, which is the higher of its adjacent stories
+    since stories are filled from the top down, and crossing it to an unvisited room
+    decrements the story by one. Every room's neighbors are scanned at most twice, so the
+    pass runs in O(rooms + adjacencies).
+    """
+    log.debug("Starting story assignment...")
 
     # Assign story 0 starting from the entrance
-    entrance = next((room for room in rooms if room['x'] == 0 and room['y'] == 0), None)
-    if not entrance:
+    entrance = next((i for i, room in enumerate(graph.rooms) if room['x'] == 0 and room['y'] == 0), None)
+    if entrance is None:
         raise ValueError("No entrance room found at (0, 0).")
-    
-    entrance['story'] = 0
-    flood_fill_story([entrance], rooms, story=0)
-
-    # Update ramps adjacent to story 0
-    update_adjacent_ramps(rooms, story=0)
-
-    # Iterative process to assign progressively lower stories
-    current_story = 0
-    while True:
-        # Find all ramps for the current story
-        current_story_ramps = [room for room in rooms if room['type'] == 'ramp' and room['story'] == current_story]
-        if not current_story_ramps:
+
+    stories = graph.stories
+    stories[entrance] = 0
+    story = 0
+    rooms_to_fill = deque([entrance])
+
+    while rooms_to_fill:
+        # Flood the current story; ramps reached here are blocked and crossed afterwards
+        story_ramps = []
+        while rooms_to_fill:
+            room_index = rooms_to_fill.popleft()
+            if graph.is_ramp(room_index):
+                story_ramps.append(room_index)  # A ramp the flood started from
+
+            for neighbor in graph.neighbors(room_index):
+                if stories[neighbor] is not None:
+                    continue
+                stories[neighbor] = story
+                if graph.is_ramp(neighbor):  # Unvisited ramp
+                    story_ramps.append(neighbor)
+                    log.debug("Marked ramp at (%s, %s) as story %d (blocked flood-fill).", *graph.position(neighbor), story)
+                else:  # Unvisited, non-ramp room
+                    rooms_to_fill.append(neighbor)
+                    log.debug("Flood-filled room at (%s, %s) with story %d.", *graph.position(neighbor), story)
+
+        if not story_ramps:
             break  # Exit if there are no more ramps to process
 
-        print(f"Processing story {current_story} ramps...")
+        log.debug("Processing story %d ramps...", story)
 
-        # Assign the next story to unvisited rooms adjacent to current story ramps
-        next_story = current_story - 1
-        for ramp in current_story_ramps:
-            neighbors = find_adjacent_rooms(ramp, rooms)
-            for neighbor in neighbors:
-                if neighbor['story'] is None:  # Unvisited room
-                    neighbor['story'] = next_story
-                    flood_fill_story([neighbor], rooms, story=next_story)
-
-        # Update ramps adjacent to the next story
-        update_adjacent_ramps(rooms, story=next_story)
-
-        # Move to the next story level
-        current_story = next_story
-
-    print("Story assignment completed.")
-    return rooms
-
-# Flood-fill for assigning stories with ramp detection
-def flood_fill_story(start_rooms, rooms, story):
-    """Flood-fill to assign a story and mark unvisited ramps blocking the fill."""
-    queue = deque(start_rooms)
-    while queue:
-        current_room = queue.popleft()
-        print(f"Processing room at ({current_room['x']}, {current_room['y']}) for story {story}.")
-        neighbors = find_adjacent_rooms(current_room, rooms)
-
-        for neighbor in neighbors:
-            if neighbor['story'] is None and neighbor.get('type') != 'ramp':  # Unvisited, non-ramp rooms
-                neighbor['story'] = story
-                queue.append(neighbor)
-                print(f"Flood-filled room at ({neighbor['x']}, {neighbor['y']}) with story {story}.")
-            elif neighbor['story'] is None and neighbor.get('type') == 'ramp':  # Unvisited ramp
-                neighbor['story'] = story
-                print(f"Marked ramp at ({neighbor['x']}, {neighbor['y']}) as story {story} (blocked flood-fill).")
-
-def update_adjacent_ramps(rooms, story):
-    """Update ramps adjacent to rooms with the specified story."""
-    for room in rooms:
-        if room['story'] == story:
-            neighbors = find_adjacent_rooms(room, rooms)
+        # Unvisited rooms on the far side of this story's ramps start the next story down
+        story -= 1
+        for ramp in story_ramps:
+            for neighbor in graph.neighbors(ramp):
+                if stories[neighbor] is None:
+                    stories[neighbor] = story
+                    rooms_to_fill.append(neighbor)
+
+    log.debug("Story assignment completed.")
+    return graph
+
+
+def find_articulation_points(graph):
+    """
+    Find the rooms whose removal increases the number of connected components.
+
+    Iterative Tarjan/Hopcroft depth-first search over the room adjacency graph, so the
+    whole layout is covered in O(rooms + adjacencies) without recursion limits.
+
+    Parameters:
+    - graph: RoomGraph of the layout.
+
+    Returns:
+    - Set of room indices that are articulation points.
+    """
+    room_count = len(graph)
+    discovery = [None] * room_count
+    low = [0] * room_count
+    articulation_points = set()
+    counter = 0
+
+    for root in range(room_count):
+        if discovery[root] is not None:
+            continue
+
+        discovery[root] = low[root] = counter
+        counter += 1
+        root_children = 0
+        # Each frame holds (room, parent, iterator over its neighbors)
+        stack = [(root, None, iter(graph.neighbors(root)))]
+
+        while stack:
+            room_index, parent, neighbors = stack[-1]
+            advanced = False
             for neighbor in neighbors:
-                if neighbor.get('type') == 'ramp' and neighbor['story'] is None:
-                    neighbor['story'] = story  # Assign the highest story
-                    print(f"Updated ramp at ({neighbor['x']}, {neighbor['y']}) with story {neighbor['story']}.")
-
-
-def get_direction(room, neighbor):
-    """Determine the direction of the neighbor relative to the room."""
-    if neighbor['x'] + neighbor['w'] == room['x']:
-        return 'west'
-    elif room['x'] + room['w'] == neighbor['x']:
-        return 'east'
-    elif neighbor['y'] + neighbor['h'] == room['y']:
-        return 'south'
-    elif room['y'] + room['h'] == neighbor['y']:
-        return 'north'
-    return 'unknown'
-
-# Get connected components using flood-fill
-def get_connected_components(rooms):
-    visited = set()
-    components = []
-
-    for room_index in range(len(rooms)):
-        if room_index not in visited:
-            # Perform a flood-fill to find all connected rooms
-            component = flood_fill(room_index, rooms, visited)
-            components.append(component)
-
-    return components
-
-# Flood-fill to find all connected rooms from a starting room
-def flood_fill(start_index, rooms, visited):
-    stack = [start_index]
-    component = []
-
-    while stack:
-        room_index = stack.pop()
-        if room_index not in visited:
-            visited.add(room_index)
-            component.append(room_index)
-            neighbors = find_adjacent_rooms_by_index(room_index, rooms)
-            stack.extend(neighbors)
-
-    return component
-
-# Find all adjacent rooms by index
-def find_adjacent_rooms_by_index(room_index, rooms):
-    adjacent = []
-    for other_index, other_room in enumerate(rooms):
-        if other_index != room_index and is_adjacent(rooms[room_index], other_room):
-            adjacent.append(other_index)
-    return adjacent
-
-# Find all adjacent rooms
-def find_adjacent_rooms(room, rooms):
-    adjacent = []
-    for other_room in rooms:
-        if other_room != room and is_adjacent(room, other_room):
-            adjacent.append(other_room)
-    return adjacent
-
-# Check if two rooms are adjacent
-def is_adjacent(room1, room2):
-    if (room1['x'] + room1['w'] == room2['x'] or room2['x'] + room2['w'] == room1['x']) and (room1['y'] < room2['y'] + room2['h'] and room1['y'] + room1['h'] > room2['y']):
-        return True  # Horizontal adjacency
-    if (room1['y'] + room1['h'] == room2['y'] or room2['y'] + room2['h'] == room1['y']) and (room1['x'] < room2['x'] + room2['w'] and room1['x'] + room1['w'] > room2['x']):
-        return True  # Vertical adjacency
-    return False
+                if discovery[neighbor] is None:
+                    discovery[neighbor] = low[neighbor] = counter
+                    counter += 1
+                    if room_index == root:
+                        root_children += 1
+                    stack.append((neighbor, room_index, iter(graph.neighbors(neighbor))))
+                    advanced = True
+                    break
+                if neighbor != parent:
+                    low[room_index] = min(low[room_index], discovery[neighbor])
+            if advanced:
+                continue
+
+            # All neighbors explored, propagate the low-link to the parent
+            stack.pop()
+            if parent is not None:
+                low[parent] = min(low[parent], low[room_index])
+                if parent != root and low[room_index] >= discovery[parent]:
+                    articulation_points.add(parent)
+
+        if root_children > 1:
+            articulation_points.add(root)
+
+    return articulation_points
 
 # Check if a room is a valid ramp (1xN or Nx1) with opposite adjacency
-def is_valid_ramp(room, rooms, doors):
+def is_valid_ramp(room_index, graph, rooms_with_disqualifying_doors):
+    room = graph.rooms[room_index]
+
     # Check if the room is 1xN or Nx1
     if not (room['w'] == 1 or room['h'] == 1):
         return False
 
     # Check for disqualifying doors
-    disqualifying_door_types = {1, 2, 4, 6, 7}
-    room_has_disqualifying_door = any(
-        door['type'] in disqualifying_door_types and
-        door['x'] >= room['x'] and door['x'] < room['x'] + room['w'] and
-        door['y'] >= room['y'] and door['y'] < room['y'] + room['h']
-        for door in doors
-    )
-    if room_has_disqualifying_door:
+    if room_index in rooms_with_disqualifying_doors:
         return False
 
     # Get adjacent rooms
-    neighbors = find_adjacent_rooms_by_direction(room, rooms)
+    neighbors = graph.neighbors_by_direction(room_index)
 
     # Ensure exactly two neighbors exist and they are on opposite sides
     if len(neighbors) == 2:
@@ -261,123 +329,243 @@ def is_valid_ramp(room, rooms, doors):
 
     return False
 
-# Find adjacent rooms by direction (north, south, east, west)
-def find_adjacent_rooms_by_direction(room, rooms):
-    neighbors = {}
-
-    for other_room in rooms:
-        if is_adjacent(room, other_room):
-            if other_room['x'] + other_room['w'] == room['x']:  # West
-                neighbors['west'] = other_room
-            elif room['x'] + room['w'] == other_room['x']:  # East
-                neighbors['east'] = other_room
-            elif other_room['y'] + other_room['h'] == room['y']:  # South
-                neighbors['south'] = other_room
-            elif room['y'] + room['h'] == other_room['y']:  # North
-                neighbors['north'] = other_room
-
-    return neighbors
-
-def assign_ramp_directions(rects):
+def assign_ramp_directions(graph, rooms_to_update=None):
     """
     Assign directions to ramps based on the lowest-story adjacent room.
+
+    Parameters:
+    - graph: RoomGraph with stories assigned.
+    - rooms_to_update: Room indices whose direction is recomputed (default = every room).
     """
-    for rect in rects:
-        if rect.get('type') == 'ramp':
-            neighbors = find_adjacent_rooms_by_direction(rect, rects)
+    if rooms_to_update is None:
+        rooms_to_update = range(len(graph))
+
+    for room_index in sorted(rooms_to_update):
+        if graph.is_ramp(room_index):
+            neighbors = graph.neighbors_by_direction(room_index)
 
             # Filter neighbors to only those with a valid story
-            valid_neighbors = {direction: room for direction, room in neighbors.items() if 'story' in room and room['story'] is not None}
+            valid_neighbors = {direction: other for direction, other in neighbors.items() if graph.stories[other] is not None}
 
             if valid_neighbors:
                 # Find the neighbor with the lowest story
-                lowest_story_direction = min(valid_neighbors, key=lambda d: valid_neighbors[d]['story'])
-                rect['ramp_dir'] = lowest_story_direction
-                print(f"Assigned direction {lowest_story_direction} to ramp at ({rect['x']}, {rect['y']}) with story {rect['story']}.")
+                lowest_story_direction = min(valid_neighbors, key=lambda d: graph.stories[valid_neighbors[d]])
+                graph.ramp_dirs[room_index] = lowest_story_direction
+                log.debug("Assigned direction %s to ramp at (%s, %s) with story %s.", lowest_story_direction, *graph.position(room_index), graph.stories[room_index])
             else:
-                rect['ramp_dir'] = 'unknown'
-                print(f"Could not determine direction for ramp at ({rect['x']}, {rect['y']}). No valid adjacent rooms.")
+                graph.ramp_dirs[room_index] = 'unknown'
+                log.warning("Could not determine direction for ramp at (%s, %s). No valid adjacent rooms.", *graph.position(room_index))
+
+    return graph
+
+def update_stories(graph, previous_rects, doors, previous_doors, tile_map):
+    """
+    Re-annotate a hand-edited layout from its previous annotated version.
+
+    Rects are matched with the previous layout by position and size; a resized rect counts
+    as removed and re-added. Ramp status is re-evaluated only for the affected rooms: the
+    added rooms, the rooms that gained or lost a neighbor or a door, and the rooms whose
+    articulation-point status changed because an edit opened or closed a loop elsewhere.
+    Every other room keeps its previous `type` and `ramp_dir`, so ramps picked at random in
+    earlier runs stay where they were. Stories are re-flooded, since a new ramp shifts every
+    story beyond it, and only ramps whose own or neighboring stories changed get a new
+    direction.
 
-    return rects
+    Parameters:
+    - graph: RoomGraph of the edited layout.
+    - previous_rects: Annotated rects of the previous layout.
+    - doors: Door objects of the edited layout.
+    - previous_doors: Door objects of the previous layout.
+    - tile_map: TileRoomMap built from the edited rects.
 
-def assign_door_stories(rects, doors):
+    Returns:
+    - Set of room indices whose ramp status was re-evaluated.
+    """
+    # Match rooms by geometry
+    previous_by_shape = {(r['x'], r['y'], r['w'], r['h']): i for i, r in enumerate(previous_rects)}
+    kept = {}  # Room index -> previous room index
+    for room_index, room in enumerate(graph.rooms):
+        previous_index = previous_by_shape.pop((room['x'], room['y'], room['w'], room['h']), None)
+        if previous_index is not None:
+            kept[room_index] = previous_index
+    removed = list(previous_by_shape.values())
+    added = [room_index for room_index in range(len(graph)) if room_index not in kept]
+    log.debug("%d rooms added, %d removed, %d unchanged.", len(added), len(removed), len(kept))
+
+    previous_graph = RoomGraph(previous_rects)
+    current_index = {previous_index: room_index for room_index, previous_index in kept.items()}
+
+    # Rooms whose neighbors changed
+    affected = set(added)
+    for room_index in added:
+        affected.update(graph.neighbors(room_index))
+    for previous_index in removed:
+        affected.update(current_index[other] for other in previous_graph.neighbors(previous_index) if other in current_index)
+
+    # Rooms that stopped or started splitting the dungeon
+    articulation_points = find_articulation_points(graph)
+    previous_articulation_points = find_articulation_points(previous_graph)
+    affected.update(
+        room_index for room_index, previous_index in kept.items()
+        if (room_index in articulation_points) != (previous_index in previous_articulation_points)
+    )
+
+    # Rooms whose doors changed
+    def door_keys(door_list):
+        return {(door['x'], door['y'], door['type']) for door in door_list}
+
+    for door_x, door_y, _ in door_keys(doors) ^ door_keys(previous_doors):
+        room_index = tile_map.room_index_at(door_x, door_y)
+        if room_index is not None:
+            affected.add(room_index)
+
+    # Clusters of adjacent ramps are resolved as a whole, so pull in every candidate touching one
+    candidates = deque(affected)
+    while candidates:
+        for other in graph.neighbors(candidates.popleft()):
+            room = graph.rooms[other]
+            if other not in affected and other in articulation_points and (room['w'] == 1 or room['h'] == 1):
+                affected.add(other)
+                candidates.append(other)
+
+    # Carry over the annotations of every unchanged room, then redo the affected ones
+    for room_index, previous_index in kept.items():
+        graph.types[room_index] = previous_rects[previous_index].get('type')
+        graph.ramp_dirs[room_index] = previous_rects[previous_index].get('ramp_dir')
+    find_bridges(graph, doors, tile_map, affected, articulation_points)
+
+    assign_stories(graph)
+
+    # Ramps next to a room whose story changed may now point elsewhere
+    restoried = set(added)
+    restoried.update(
+        room_index for room_index, previous_index in kept.items()
+        if graph.stories[room_index] != previous_rects[previous_index].get('story')
+    )
+    redirect = affected | restoried
+    for room_index in restoried:
+        redirect.update(graph.neighbors(room_index))
+    assign_ramp_directions(graph, redirect)
+
+    log.debug("Re-evaluated %d rooms, %d changed story.", len(affected), len(restoried))
+    return affected
+
+def assign_door_stories(rects, doors, tile_map):
     """
     Assigns the story of the corresponding room to each door in the doors array.
 
     Parameters:
     - rects: List of room rectangles with `x`, `y`, `w`, `h`, and `story`.
     - doors: List of door objects with `x`, `y`, and other properties.
+    - tile_map: TileRoomMap built from `rects`.
 
     Returns:
     - Updated doors array with assigned `story` values.
     """
     for door in doors:
         door_x, door_y = door['x'], door['y']
-        door_story = None
 
         # Find the room that contains this door
-        for rect in rects:
-            rect_x, rect_y, rect_w, rect_h = rect['x'], rect['y'], rect['w'], rect['h']
-            if rect_x <= door_x < rect_x + rect_w and rect_y <= door_y < rect_y + rect_h:
-                door_story = rect.get('story', 0)  # Default story is 0 if not assigned
-                break
+        rect = tile_map.room_at(door_x, door_y)
 
-        if door_story is not None:
+        if rect is not None:
+            door_story = rect.get('story', 0)  # Default story is 0 if not assigned
             door['story'] = door_story
-            print(f"Assigned story {door_story} to door at ({door_x}, {door_y}).")
+            log.debug("Assigned story %s to door at (%s, %s).", door_story, door_x, door_y)
         else:
-            print(f"Could not assign a story to door at ({door_x}, {door_y}). No matching room found.")
+            log.warning("Could not assign a story to door at (%s, %s). No matching room found.", door_x, door_y)
 
     return doors
 
-def assign_column_stories(rects, columns):
+def assign_column_stories(rects, columns, tile_map):
     """
     Assign the correct story to each column based on the room it is in.
 
     Parameters:
     - rects: List of room rectangles with `x`, `y`, `w`, `h`, and `story`.
-    - columns: List of column objects with `x` and `y`.
+    - columns: List of column objects with `x` and `y` (floats allowed).
+    - tile_map: TileRoomMap built from `rects`.
 
     Returns:
     - Updated columns array with assigned `story` values.
     """
     for column in columns:
         column_x, column_y = column['x'], column['y']
-        column_story = None
 
         # Find the room that contains this column
-        for rect in rects:
-            rect_x, rect_y, rect_w, rect_h = rect['x'], rect['y'], rect['w'], rect['h']
-            if rect_x <= column_x < rect_x + rect_w and rect_y <= column_y < rect_y + rect_h:
-                column_story = rect.get('story', 0)  # Default story is 0 if not assigned
-                break
+        rect = tile_map.room_at(column_x, column_y)
 
-        if column_story is not None:
+        if rect is not None:
+            column_story = rect.get('story', 0)  # Default story is 0 if not assigned
             column['story'] = column_story
-            print(f"Assigned story {column_story} to column at ({column_x}, {column_y}).")
+            log.debug("Assigned story %s to column at (%s, %s).", column_story, column_x, column_y)
         else:
-            print(f"Could not assign a story to column at ({column_x}, {column_y}). No matching room found.")
+            log.warning("Could not assign a story to column at (%s, %s). No matching room found.", column_x, column_y)
 
     return columns
 
-# Process each JSON file
-directory = "./"  # Replace with your directory path
+def process_file(filepath, previous_filepath=None):
+    """
+    Annotate one layout in place.
 
-for filename in os.listdir(directory):
-    if filename.endswith('.json'):
-        filepath = os.path.join(directory, filename)
+    Parameters:
+    - filepath: JSON layout to annotate.
+    - previous_filepath: Annotated earlier version of the same layout. When given, only the
+      rooms affected by the edits are re-evaluated (see `update_stories`).
+    """
+    filename = os.path.basename(filepath)
+    timer = StageTimer(log, filename)
 
+    with timer.stage('load'):
         with open(filepath) as f:
             data = json.load(f)
-
-        print(f"Processing file: {filename}")
-        data['rects'] = find_bridges(data['rects'], data.get('doors', []))  # Pass the doors array
-        data['rects'] = assign_stories(data['rects'])  # Assign stories
-        data['rects'] = assign_ramp_directions(data['rects'])  # Assign ramp directions
-        data['doors'] = assign_door_stories(data['rects'], data.get('doors', []))  # Assign door stories
-        data['columns'] = assign_column_stories(data['rects'], data.get('columns', []))  # Assign column stories
-
+        previous = None
+        if previous_filepath is not None:
+            with open(previous_filepath) as f:
+                previous = json.load(f)
+            if not all('story' in room for room in previous['rects']):
+                log.warning("%s has not been annotated yet, recomputing %s from scratch.", previous_filepath, filename)
+                previous = None
+
+    log.debug("Processing file: %s", filename)
+    with timer.stage('graph'):
+        graph = RoomGraph(data['rects'])  # Adjacency and room state shared by every pass
+        tile_map = TileRoomMap(data['rects'])  # Tile-to-room lookup for doors and columns
+    if previous is None:
+        with timer.stage('ramps'):
+            find_bridges(graph, data.get('doors', []), tile_map)  # Pass the doors array
+        with timer.stage('stories'):
+            assign_stories(graph)  # Assign stories
+        with timer.stage('ramp directions'):
+            assign_ramp_directions(graph)  # Assign ramp directions
+        counts = {}
+    else:
+        with timer.stage('update'):
+            affected = update_stories(graph, previous['rects'], data.get('doors', []), previous.get('doors', []), tile_map)
+        counts = {'re-evaluated': len(affected)}
+    data['rects'] = graph.write_back()
+    with timer.stage('doors, columns'):
+        data['doors'] = assign_door_stories(data['rects'], data.get('doors', []), tile_map)  # Assign door stories
+        data['columns'] = assign_column_stories(data['rects'], data.get('columns', []), tile_map)  # Assign column stories
+
+    with timer.stage('save'):
         with open(filepath, 'w') as f:
             json.dump(data, f, indent=4)
 
-print("All files processed with ramps, stories, and door stories assigned.")
+    timer.summary(rooms=len(graph), ramps=graph.types.count('ramp'), **counts)
+
+# Process each JSON file, or a single edited file against its previous version:
+#   python add-stories.py --incremental previous.json edited.json
+directory = "./"  # Replace with your directory path
+
+if len(sys.argv) > 1:
+    if len(sys.argv) != 4 or sys.argv[1] != '--incremental':
+        sys.exit("Usage: python add-stories.py [--incremental PREVIOUS.json EDITED.json]")
+    process_file(sys.argv[3], previous_filepath=sys.argv[2])
+    log.info("Incrementally updated %s.", sys.argv[3])
+else:
+    for filename in os.listdir(directory):
+        if filename.endswith('.json'):
+            process_file(os.path.join(directory, filename))
+
+    log.info("All files processed with ramps, stories, and door and column stories assigned.")
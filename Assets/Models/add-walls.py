@@ -1,10 +1,24 @@
 import os
+import sys
 import json
 import random
 
+try:
+    import numpy as np
+except ImportError:  # Fall back to the per-wall dict passes
+    np = None
+
+from pipeline_log import StageTimer, get_logger
+from wall_segments import compact_walls
+
+log = get_logger('add-walls')
+
 # Directory containing the JSON files
 directory = '.'
 
+# Store straight runs of walls as `wall_segments` instead of unit `walls` (see wall_segments.py)
+compact = '--compact' in sys.argv[1:]
+
 # Function to generate walls for each room
 def generate_walls(rooms):
     for room in rooms:
@@ -66,10 +80,10 @@ def find_exits_for_rotunda(room, wall_count):
     exits = set()
     for wall in room['walls']:
         wall_tuple = (wall['x'], wall['y'], wall['dir']['x'], wall['dir']['y'])
-        if wall_count.get(wall_tuple, 0) > 1:
+        if wall_count.get(wall_tuple + (wall['level'],), 0) > 1:
             direction = determine_direction(wall)
             exits.add(direction)
-    room['exits'] = list(exits)
+    room['exits'] = sorted(exits)
 
 # Remove duplicate walls where rooms intersect
 def remove_duplicate_walls(rooms):
@@ -85,38 +99,147 @@ def remove_duplicate_walls(rooms):
     for room in rooms:
         room['walls'] = [wall for wall in room['walls'] if wall_count[(wall['x'], wall['y'], wall['dir']['x'], wall['dir']['y'], wall['level'])] == 1]
 
+def generate_walls_vectorized(rooms):
+    """
+    Vectorized equivalent of generate_walls, rotunda exits and remove_duplicate_walls.
+
+    Rooms are rasterized into an integer occupancy grid per ceiling level (a room with
+    ceiling c occupies levels 0 to c). A unit wall on a room's boundary is kept exactly when
+    the cells on either side of it differ in occupancy, which is an XOR of the grid with a
+    copy shifted by one cell. Rotunda exits are the boundary walls shared at level 0. The
+    `vault`, `ceiling`, `walls` and `exits` written to the rooms are identical to the dict
+    passes, including wall order and random ceiling draws.
+
+    Parameters:
+    - rooms: List of room rectangles with `x`, `y`, `w` and `h`.
+
+    Returns:
+    - True if the walls were generated, False if rooms overlap (the shared-edge test then
+      differs from the wall count) and the dict passes must be used instead.
+    """
+    if not rooms:
+        return True
+
+    xs = np.array([room['x'] for room in rooms])
+    ys = np.array([room['y'] for room in rooms])
+    ws = np.array([room['w'] for room in rooms])
+    hs = np.array([room['h'] for room in rooms])
+    x0, y0 = xs.min(), ys.min()
+    width, height = (xs + ws).max() - x0, (ys + hs).max() - y0
+
+    def occupancy(active):
+        # Coverage counts from a 2D difference array, padded by one empty cell on every side
+        diff = np.zeros((height + 2, width + 2), dtype=np.int32)
+        left, bottom = xs[active] - x0 + 1, ys[active] - y0 + 1
+        right, top = left + ws[active], bottom + hs[active]
+        np.add.at(diff, (bottom, left), 1)
+        np.add.at(diff, (bottom, right), -1)
+        np.add.at(diff, (top, left), -1)
+        np.add.at(diff, (top, right), 1)
+        return diff.cumsum(axis=0).cumsum(axis=1)
+
+    coverage = occupancy(np.ones(len(rooms), dtype=bool))
+    if coverage.max() > 1:
+        return False
+
+    # Same vault and ceiling assignment (and random draws) as generate_walls
+    for room in rooms:
+        room['vault'] = 0 if room['w'] == 1 or room['h'] == 1 else 1
+        room['ceiling'] = determine_ceiling(room)
+    ceilings = np.array([room['ceiling'] for room in rooms])
+
+    # Boundary edges per level: horizontal[e, c] is the wall at (x0 + c, y0 + e) with dir (1, 0),
+    # vertical[r, e] the wall at (x0 + e, y0 + r) with dir (0, 1)
+    boundaries = []
+    for level in range(ceilings.max() + 1):
+        occupied = (coverage if level == 0 else occupancy(ceilings >= level)) > 0
+        horizontal = occupied[:-1, 1:-1] ^ occupied[1:, 1:-1]
+        vertical = occupied[1:-1, :-1] ^ occupied[1:-1, 1:]
+        boundaries.append((horizontal.tolist(), vertical.tolist()))
+
+    for room in rooms:
+        x, y, w, h = room['x'], room['y'], room['w'], room['h']
+        column, row = x - x0, y - y0
+        walls = []
+        for level in range(room['ceiling'] + 1):
+            horizontal, vertical = boundaries[level]
+            # Top, bottom, left and right walls, in generate_walls order
+            for edge_row, edge_y in ((row, y), (row + h, y + h)):
+                edges = horizontal[edge_row]
+                walls.extend({"x": x + i, "y": edge_y, "dir": {"x": 1, "y": 0}, "level": level}
+                             for i in range(w) if edges[column + i])
+            for edge_column, edge_x in ((column, x), (column + w, x + w)):
+                walls.extend({"x": edge_x, "y": y + i, "dir": {"x": 0, "y": 1}, "level": level}
+                             for i in range(h) if vertical[row + i][edge_column])
+        room['walls'] = walls
+
+        if room.get('rotunda'):
+            # A boundary wall missing at level 0 is shared with a neighboring room
+            horizontal, vertical = boundaries[0]
+            exits = set()
+            if not all(horizontal[row][column:column + w]) or not all(horizontal[row + h][column:column + w]):
+                exits.add(determine_direction({"dir": {"x": 1, "y": 0}}))
+            if not all(vertical[row + i][edge_column] for i in range(h) for edge_column in (column, column + w)):
+                exits.add(determine_direction({"dir": {"x": 0, "y": 1}}))
+            room['exits'] = sorted(exits)
+
+    return True
+
 # Process each JSON file in the directory
 for filename in os.listdir(directory):
     if filename.endswith('.json'):
         filepath = os.path.join(directory, filename)
+        timer = StageTimer(log, filename)
         
-        with open(filepath) as f:
-            data = json.load(f)
-        
-        # Generate walls for all rooms
-        generate_walls(data['rects'])
-
-        # Find exits for rotunda rooms
-        wall_count = {}
-        for room in data['rects']:
-            for wall in room['walls']:
-                wall_tuple = (wall['x'], wall['y'], wall['dir']['x'], wall['dir']['y'], wall['level'])
-                if wall_tuple in wall_count:
-                    wall_count[wall_tuple] += 1
-                else:
-                    wall_count[wall_tuple] = 1
-
-        for room in data['rects']:
-            if 'rotunda' in room and room['rotunda']:
-                find_exits_for_rotunda(room, wall_count)
-        
-        # Remove duplicate walls
-        remove_duplicate_walls(data['rects'])
+        with timer.stage('load'):
+            with open(filepath) as f:
+                data = json.load(f)
         
+        # Generate walls, rotunda exits and shared-wall removal on the occupancy grid if possible
+        with timer.stage('walls'):
+            vectorized = np is not None and generate_walls_vectorized(data['rects'])
+
+        if not vectorized:
+            # Generate walls for all rooms
+            with timer.stage('walls'):
+                generate_walls(data['rects'])
+
+            # Find exits for rotunda rooms
+            with timer.stage('rotunda exits'):
+                wall_count = {}
+                for room in data['rects']:
+                    for wall in room['walls']:
+                        wall_tuple = (wall['x'], wall['y'], wall['dir']['x'], wall['dir']['y'], wall['level'])
+                        if wall_tuple in wall_count:
+                            wall_count[wall_tuple] += 1
+                        else:
+                            wall_count[wall_tuple] = 1
+
+                for room in data['rects']:
+                    if 'rotunda' in room and room['rotunda']:
+                        find_exits_for_rotunda(room, wall_count)
+
+            # Remove duplicate walls
+            with timer.stage('duplicates'):
+                remove_duplicate_walls(data['rects'])
+
+        if compact:
+            with timer.stage('compact'):
+                segment_count = compact_walls(data['rects'])
+        else:
+            for room in data['rects']:
+                room.pop('wall_segments', None)  # Left over from an earlier --compact run
+
         # Save the modified JSON data
         new_filepath = os.path.join(directory, f'{filename}')
-        with open(new_filepath, 'w') as f:
-            json.dump(data, f, indent=4)
+        with timer.stage('save'):
+            with open(new_filepath, 'w') as f:
+                json.dump(data, f, indent=4)
+
+        if compact:
+            timer.summary(segments=segment_count)
+        else:
+            timer.summary(walls=sum(len(room['walls']) for room in data['rects']))
 
-print("All files processed and saved with wall arrays added, high ceilings handled, exits for rotunda rooms handled, and duplicate walls removed.")
+log.info("All files processed and saved with wall arrays added, high ceilings handled, exits for rotunda rooms handled, and duplicate walls removed.")
 
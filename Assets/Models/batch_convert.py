@@ -0,0 +1,259 @@
+"""
+Converts many layouts at once with a pool of background Blender workers.
+
+    python batch_convert.py                       # Every layout in the current folder
+    python batch_convert.py DesecratedTemple      # Every layout in a folder
+    python batch_convert.py a.json b.json --optimize
+
+Each worker is one `blender -b -P convert_json_to_blend.py -- --worker` process that keeps
+its imported assets between files (see convert_json_to_blend.BatchSession) and converts
+the files it is sent on stdin, one at a time. Workers take the next file from a shared
+queue as soon as they finish one, largest files first. A file that fails, crashes its
+worker or runs past the timeout is reported and skipped: a crashed or stuck worker is
+replaced and the other files are unaffected. Other flags (--merge-quads, --optimize,
+--share-meshes) are passed on to the workers.
+
+For repeated conversions, a daemon skips Blender's startup and the asset imports:
+
+    blender -b -P convert_json_to_blend.py -- --serve    # Stays running, assets imported
+    python batch_convert.py --daemon a.json              # Converts with it, reports timings
+
+The daemon converts one file at a time with the flags it was started with, so other flags
+are refused together with --daemon.
+
+Environment:
+- BLENDER: Blender executable (default = blender on the PATH).
+- DUNGEON_JOBS: Number of workers (default = one per core).
+- DUNGEON_TIMEOUT: Seconds a single file may take (default = 600).
+- DUNGEON_PORT: Local port of the daemon (default = 7370).
+
+Assets are looked up in the current folder, like convert_json_to_blend.py does; the
+daemon uses the folder it was started in.
+"""
+import glob
+import json
+import os
+import queue
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+from pipeline_log import flush, get_logger
+
+log = get_logger('batch_convert')
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'convert_json_to_blend.py')
+
+DEFAULT_TIMEOUT = 600
+DEFAULT_PORT = 7370
+
+# Workers report each file on a stdout line of its own; Blender's other output is only logged
+REPORT_PREFIX = '@dungeon-report '
+
+
+def report(json_file, stream=None, **result):
+    """
+    Report the outcome of one file from a worker or the daemon.
+
+    Parameters:
+    - json_file: Layout JSON file, as it was received.
+    - stream: Where to write the report (default = sys.stdout).
+    - result: 'outputs' (files written), 'seconds' and 'stages' (durations by stage name)
+      on success, 'error' (message) on failure.
+    """
+    print(REPORT_PREFIX + json.dumps(dict(result, file=json_file)), file=stream or sys.stdout, flush=True)
+
+
+def layout_files(paths):
+    """JSON layouts named by `paths` (files or folders of layouts), or those in the current folder."""
+    if not paths:
+        return sorted(glob.glob('*.json'))
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files += sorted(glob.glob(os.path.join(path, '*.json')))
+        else:
+            files.append(path)
+    return files
+
+
+class Worker:
+    """One background Blender process converting the files it is sent, one at a time."""
+
+    def __init__(self, number, flags):
+        self.number = number
+        command = [os.environ.get('BLENDER', 'blender'), '-b', '--factory-startup', '-P', WORKER_SCRIPT, '--', '--worker']
+        self.process = subprocess.Popen(
+            command + flags, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+            text=True, bufsize=1,
+        )
+        self.reports = queue.Queue()
+        threading.Thread(target=self.read, daemon=True).start()
+
+    def read(self):
+        """Collect the worker's reports; everything else it prints is logged at debug level."""
+        for line in self.process.stdout:
+            if line.startswith(REPORT_PREFIX):
+                self.reports.put(json.loads(line[len(REPORT_PREFIX):]))
+            else:
+                log.debug("[worker %s] %s", self.number, line.rstrip())
+        self.reports.put(None)  # The process has exited
+
+    def convert(self, json_file, timeout):
+        """
+        Have the worker convert one file and wait for its report.
+
+        Returns:
+        - The report (see `report`). A worker that exits or runs past `timeout` is stopped
+          and its report has an 'error'; it must not be sent more files.
+        """
+        try:
+            self.process.stdin.write(json_file + '\n')
+            self.process.stdin.flush()
+            result = self.reports.get(timeout=timeout)
+        except (BrokenPipeError, OSError):
+            result = None
+        except queue.Empty:
+            self.stop()
+            return {'file': json_file, 'error': f"timed out after {timeout} s"}
+
+        if result is None:
+            self.stop()
+            return {'file': json_file, 'error': f"Blender exited with code {self.process.returncode}"}
+        return result
+
+    def alive(self):
+        return self.process.poll() is None
+
+    def close(self):
+        """Let the worker finish: closing its stdin ends its loop."""
+        try:
+            self.process.stdin.close()
+        except OSError:
+            pass
+        self.process.wait()
+
+    def stop(self):
+        self.process.kill()
+        self.process.wait()
+
+
+def convert_all(files, jobs, timeout, flags):
+    """
+    Convert layouts with up to `jobs` Blender workers.
+
+    Parameters:
+    - files: Layout JSON files.
+    - jobs: Number of workers.
+    - timeout: Seconds a single file may take before its worker is stopped.
+    - flags: Extra arguments for convert_json_to_blend.py.
+
+    Returns:
+    - The reports of all files (see `report`), in the order they finished.
+    """
+    pending = queue.Queue()
+    for json_file in sorted(files, key=os.path.getsize, reverse=True):  # Largest first, so no worker ends long after the others
+        pending.put(json_file)
+    results = []
+
+    def run(number):
+        worker = None
+        while True:
+            try:
+                json_file = pending.get_nowait()
+            except queue.Empty:
+                break
+            if worker is None or not worker.alive():
+                worker = Worker(number, flags)
+
+            result = worker.convert(json_file, timeout)
+            if 'error' in result:
+                log.error("%s: %s", json_file, result['error'])
+            else:
+                log.info("%s: %.1f ms on worker %s", json_file, result['seconds'] * 1000, number)
+            results.append(result)
+        if worker is not None and worker.alive():
+            worker.close()
+
+    threads = [threading.Thread(target=run, args=(number,)) for number in range(min(jobs, len(files)))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def convert_with_daemon(files, port, timeout):
+    """
+    Convert layouts with a running daemon (convert_json_to_blend.py --serve), one after another.
+
+    Parameters:
+    - files: Layout JSON files.
+    - port: Local port the daemon listens on.
+    - timeout: Seconds a single file may take.
+
+    Returns:
+    - The reports of all files (see `report`), in order.
+    """
+    results = []
+    with socket.create_connection(('127.0.0.1', port), timeout=timeout) as connection:
+        requests = connection.makefile('w')
+        replies = connection.makefile('r')
+        for json_file in files:
+            start = time.perf_counter()
+            requests.write(os.path.abspath(json_file) + '\n')  # The daemon may run in another folder
+            requests.flush()
+            line = replies.readline()
+            if not line.startswith(REPORT_PREFIX):
+                raise ConnectionError(f"The daemon closed the connection while converting {json_file}.")
+
+            result = dict(json.loads(line[len(REPORT_PREFIX):]), file=json_file)
+            if 'error' in result:
+                log.error("%s: %s", json_file, result['error'])
+            else:
+                log.info(
+                    "%s: %.1f ms, %.1f ms with the round trip, wrote %s", json_file, result['seconds'] * 1000,
+                    (time.perf_counter() - start) * 1000, ", ".join(result['outputs']),
+                )
+            results.append(result)
+    return results
+
+
+def main():
+    args = sys.argv[1:]
+    flags = [arg for arg in args if arg.startswith('--') and arg != '--daemon']
+    files = layout_files([arg for arg in args if not arg.startswith('--')])
+    jobs = int(os.environ.get('DUNGEON_JOBS', 0)) or os.cpu_count() or 1
+    timeout = float(os.environ.get('DUNGEON_TIMEOUT', DEFAULT_TIMEOUT))
+
+    if '--daemon' in args and flags:
+        # The daemon's flags are fixed when it starts, so these would be ignored
+        log.error(
+            "%s cannot be used with --daemon; start the daemon with those flags instead "
+            "(blender -b -P convert_json_to_blend.py -- --serve %s).", " ".join(flags), " ".join(flags),
+        )
+        flush()
+        sys.exit(2)
+
+    start = time.perf_counter()
+    if '--daemon' in args:
+        jobs = 1
+        results = convert_with_daemon(files, int(os.environ.get('DUNGEON_PORT', DEFAULT_PORT)), timeout)
+    else:
+        results = convert_all(files, jobs, timeout, flags)
+    failed = [result['file'] for result in results if 'error' in result]
+
+    log.info(
+        "Converted %s of %s files with %s workers in %.1f s.",
+        len(results) - len(failed), len(files), min(jobs, len(files)), time.perf_counter() - start,
+    )
+    if failed:
+        log.error("Failed: %s", ", ".join(failed))
+    flush()
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,11 @@ import json
 import matplotlib.pyplot as plt
 from matplotlib.patches import Rectangle
 
+from pipeline_log import StageTimer, get_logger
+from wall_segments import room_segments
+
+log = get_logger('draw-walls')
+
 # Directory containing the JSON files
 directory = '.'
 
@@ -19,12 +24,12 @@ def story_to_color(story, min_story, max_story):
     grayscale_value = normalized  # Higher values closer to 0 become lighter
     return (grayscale_value, grayscale_value, grayscale_value)  # RGB tuple
 
-# Function to draw walls based on the walls array
-def draw_walls(walls, ax):
-    for wall in walls:
-        start_x, start_y = wall['x'], wall['y']
-        dir_x, dir_y = wall['dir']['x'], wall['dir']['y']
-        end_x, end_y = start_x + dir_x, start_y + dir_y
+# Function to draw walls, one line per straight wall segment
+def draw_walls(segments, ax):
+    for segment in segments:
+        start_x, start_y = segment['x'], segment['y']
+        dir_x, dir_y = segment['dir']['x'], segment['dir']['y']
+        end_x, end_y = start_x + dir_x * segment['length'], start_y + dir_y * segment['length']
         
         ax.plot([start_x, end_x], [start_y, end_y], color='black', linewidth=1)
 
@@ -37,43 +42,48 @@ def fill_room(room, color, ax):
 for filename in os.listdir(directory):
     if filename.endswith('.json'):
         filepath = os.path.join(directory, filename)
+        timer = StageTimer(log, filename)
         
-        with open(filepath) as f:
-            data = json.load(f)
+        with timer.stage('load'):
+            with open(filepath) as f:
+                data = json.load(f)
         
         # Determine the range of stories in the dungeon
         stories = [room['story'] for room in data['rects'] if room.get('story') is not None]
         if not stories:
-            print(f"No valid stories in {filename}, skipping.")
+            log.warning("No valid stories in %s, skipping.", filename)
             continue
         min_story, max_story = min(stories), max(stories)
         
         # Create a plot for the dungeon layout
-        fig, ax = plt.subplots()
-        ax.set_aspect('equal')
-        ax.set_title(filename)
-        
-        # Draw the rooms with their appropriate fill colors
-        for room in data['rects']:
-            if room.get('type') == 'ramp':
-                fill_room(room, 'red', ax)  # Fill ramp rooms with red
-            elif room.get('story') is not None:
-                # Fill regular rooms with grayscale based on their story
-                color = story_to_color(room['story'], min_story, max_story)
-                fill_room(room, color, ax)
+        with timer.stage('draw'):
+            fig, ax = plt.subplots()
+            ax.set_aspect('equal')
+            ax.set_title(filename)
             
-            # Draw the walls for each room
-            if 'walls' in room:
-                draw_walls(room['walls'], ax)
-        
-        # Set plot limits
-        ax.autoscale()
-        ax.margins(0.1)
+            # Draw the rooms with their appropriate fill colors
+            for room in data['rects']:
+                if room.get('type') == 'ramp':
+                    fill_room(room, 'red', ax)  # Fill ramp rooms with red
+                elif room.get('story') is not None:
+                    # Fill regular rooms with grayscale based on their story
+                    color = story_to_color(room['story'], min_story, max_story)
+                    fill_room(room, color, ax)
+                
+                # Draw the walls for each room, stored either as unit walls or as segments
+                draw_walls(room_segments(room), ax)
+            
+            # Set plot limits
+            ax.autoscale()
+            ax.margins(0.1)
         
         # Save the plot as a PNG file
         png_filename = filename.replace('.json', '.png')
-        plt.savefig(png_filename)
-        plt.close(fig)
+        with timer.stage('save'):
+            plt.savefig(png_filename)
+            plt.close(fig)
+
+        timer.summary()
 
-print("PNG files created for all JSON files with rooms filled based on stories.")
+log.info("PNG files created for all JSON files with rooms filled based on stories.")
 
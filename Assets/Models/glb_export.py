@@ -0,0 +1,345 @@
+"""
+glTF-binary (.glb) export straight from room_geometry meshes, without Blender.
+
+    python glb_export.py                  # Convert every layout in the current folder
+    python glb_export.py --merge-quads    # ... with coplanar quads merged
+    python glb_export.py --optimize       # ... with welded, cache-ordered meshes
+    python glb_export.py --share-meshes   # ... with identical meshes written once
+    python glb_export.py --split-rooms    # ... built in a process pool, one room per task
+    python glb_export.py --split-stories  # ... one story per task (see parallel_geometry.py)
+    python glb_export.py --mesh-cache     # ... rebuilding only changed rooms (see mesh_cache.py)
+
+Dungeons are built and written one room at a time (one story with --split-stories, see
+parallel_geometry.layout_part_meshes): the vertex and index arrays of each part go to a
+temporary binary chunk as soon as they are ready and the part is let go, so only the JSON
+description is kept until the file is finished. Nodes are therefore in part order: each
+room followed by its doorways and columns. Coordinates are converted to glTF's +Y up the way Blender's glTF exporter
+does, and materials are named after the Unity materials in Materials/.
+"""
+import glob
+import json
+import os
+import shutil
+import struct
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from mesh_cache import MeshCache
+from mesh_optimize import cache_order, degenerate_triangles, fan_triangles, fetch_order, first_occurrence
+from parallel_geometry import layout_part_meshes
+from pipeline_log import StageTimer, flush, get_logger
+from room_geometry import (
+    CEILING_MATERIAL, COLUMN_MATERIAL, FLOOR_MATERIAL, WALL_MATERIAL, corner_offsets, face_normals,
+    load_assets, local_mesh,
+)
+
+log = get_logger('glb_export')
+
+# Unity materials (Materials/DUNG_*.mat) used for the generated surfaces; asset materials keep their names
+MATERIAL_NAMES = {
+    FLOOR_MATERIAL: "DUNG_WL_2-0",
+    WALL_MATERIAL: "DUNG_WL_0-0",
+    CEILING_MATERIAL: "DUNG_WL_1-0",
+    COLUMN_MATERIAL: "DUNG_COL_00",
+}
+
+# Blender Z up to glTF Y up: (x, y, z) -> (x, z, -y)
+Y_UP = np.array([[1.0, 0.0, 0.0], [0.0, 0.0, 1.0], [0.0, -1.0, 0.0]])
+
+# glTF constants
+FLOAT = 5126
+UNSIGNED_INT = 5125
+ARRAY_BUFFER = 34962
+ELEMENT_ARRAY_BUFFER = 34963
+TRIANGLES = 4
+
+GLB_MAGIC = 0x46546C67  # "glTF"
+JSON_CHUNK = 0x4E4F534A  # "JSON"
+BIN_CHUNK = 0x004E4942  # "BIN\0"
+
+
+def triangulate(mesh):
+    """
+    Per-corner vertex attributes and fan triangles of a RoomMesh.
+
+    Every face corner becomes its own glTF vertex, since UVs and flat normals belong to
+    corners rather than to vertices.
+
+    Returns:
+    - positions, normals, texcoords: float32 arrays with one row per corner, in glTF axes.
+    - triangles: uint32 array of corner triples.
+    - triangle_materials: Material slot of every triangle.
+    """
+    verts, corners, starts, sizes, uvs = mesh.arrays()
+
+    # Flat normals, unit length (degenerate faces point up)
+    normals = face_normals(verts, corners, starts, sizes)
+    lengths = np.linalg.norm(normals, axis=1)
+    normals[lengths == 0] = (0.0, 0.0, 1.0)
+    lengths[lengths == 0] = 1.0
+    normals /= lengths[:, None]
+
+    face_of, _ = corner_offsets(starts, sizes)
+    positions = (verts[corners] @ Y_UP.T).astype(np.float32)
+    corner_normals = (normals[face_of] @ Y_UP.T).astype(np.float32)
+    texcoords = np.column_stack((uvs[:, 0], 1.0 - uvs[:, 1])).astype(np.float32)  # glTF V runs downwards
+
+    triangles, triangle_faces = fan_triangles(starts, sizes)
+    triangle_materials = np.array(mesh.face_materials, dtype=np.int64).reshape(-1)[triangle_faces]
+    return positions, corner_normals, texcoords, triangles.astype(np.uint32), triangle_materials
+
+
+def optimize_triangles(positions, normals, texcoords, triangles, triangle_materials):
+    """
+    Weld the corners of `triangulate` that share position, normal and UV, drop degenerate
+    triangles, order each material's triangles for the vertex cache and the vertices by
+    first use. Takes and returns the values of `triangulate`.
+    """
+    keep, remap = first_occurrence(np.column_stack((positions, normals, texcoords)))
+    positions, normals, texcoords = positions[keep], normals[keep], texcoords[keep]
+    triangles = remap[triangles]
+
+    valid = ~degenerate_triangles(positions, triangles)
+    triangles, triangle_materials = triangles[valid], triangle_materials[valid]
+
+    # Group by material, as the primitives draw them, in cache order within each group
+    drawn = []
+    for material in np.unique(triangle_materials):
+        group = np.flatnonzero(triangle_materials == material)
+        drawn.append(group[cache_order(triangles[group])])
+    drawn = np.concatenate(drawn) if drawn else np.zeros(0, dtype=np.int64)
+    triangles, triangle_materials = triangles[drawn], triangle_materials[drawn]
+
+    order, remap = fetch_order(triangles.ravel(), len(positions))
+    return (
+        positions[order], normals[order], texcoords[order], remap[triangles].astype(np.uint32),
+        triangle_materials,
+    )
+
+
+class GlbWriter:
+    """
+    Writes one .glb file, one mesh at a time. With `optimize`, every mesh goes through
+    optimize_triangles first.
+
+    Usage:
+        with GlbWriter(path, scene_name) as glb:
+            for name, mesh in meshes.items():
+                glb.add_node(name, glb.add_mesh(name, mesh))
+    """
+
+    def __init__(self, path, scene_name='Scene', optimize=False):
+        self.path = path
+        self.scene_name = scene_name
+        self.optimize = optimize
+        self.binary = tempfile.TemporaryFile()
+        self.length = 0
+        self.gltf = {
+            'asset': {'version': '2.0', 'generator': 'dungeontest glb_export.py'},
+            'scene': 0,
+            'scenes': [{'name': scene_name, 'nodes': []}],
+            'nodes': [],
+            'meshes': [],
+            'materials': [],
+            'accessors': [],
+            'bufferViews': [],
+            'buffers': [],
+        }
+        self.material_indices = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.binary.close()
+
+    def add_accessor(self, array, component_type, accessor_type, target, bounds=False):
+        """Write an array to the binary chunk as its own buffer view and describe it."""
+        array = np.ascontiguousarray(array)
+        self.binary.write(memoryview(array).cast('B'))  # Written straight from the array's memory
+
+        view = {'buffer': 0, 'byteOffset': self.length, 'byteLength': array.nbytes, 'target': target}
+        self.length += array.nbytes
+        self.gltf['bufferViews'].append(view)
+
+        accessor = {
+            'bufferView': len(self.gltf['bufferViews']) - 1,
+            'componentType': component_type,
+            'count': len(array),
+            'type': accessor_type,
+        }
+        if bounds:
+            accessor['min'] = array.min(axis=0).tolist()
+            accessor['max'] = array.max(axis=0).tolist()
+        self.gltf['accessors'].append(accessor)
+        return len(self.gltf['accessors']) - 1
+
+    def material(self, name):
+        """Index of the glTF material for a room_geometry material name."""
+        name = MATERIAL_NAMES.get(name, name)
+        if name not in self.material_indices:
+            self.material_indices[name] = len(self.gltf['materials'])
+            self.gltf['materials'].append({
+                'name': name,
+                'pbrMetallicRoughness': {'metallicFactor': 0.0, 'roughnessFactor': 1.0},
+            })
+        return self.material_indices[name]
+
+    def add_mesh(self, name, mesh):
+        """
+        Encode a RoomMesh as a glTF mesh with one primitive per material.
+
+        Returns:
+        - Index of the glTF mesh, or None if the RoomMesh has no faces.
+        """
+        arrays = triangulate(mesh)
+        if self.optimize:
+            arrays = optimize_triangles(*arrays)
+        positions, normals, texcoords, triangles, triangle_materials = arrays
+        if not len(triangles):
+            return None
+
+        attributes = {
+            'POSITION': self.add_accessor(positions, FLOAT, 'VEC3', ARRAY_BUFFER, bounds=True),
+            'NORMAL': self.add_accessor(normals, FLOAT, 'VEC3', ARRAY_BUFFER),
+            'TEXCOORD_0': self.add_accessor(texcoords, FLOAT, 'VEC2', ARRAY_BUFFER),
+        }
+
+        primitives = []
+        for slot, material in enumerate(mesh.materials):
+            indices = triangles[triangle_materials == slot].ravel()
+            if not len(indices):
+                continue
+            primitive = {
+                'attributes': attributes,
+                'indices': self.add_accessor(indices, UNSIGNED_INT, 'SCALAR', ELEMENT_ARRAY_BUFFER),
+                'mode': TRIANGLES,
+            }
+            if material is not None:
+                primitive['material'] = self.material(material)
+            primitives.append(primitive)
+
+        self.gltf['meshes'].append({'name': name, 'primitives': primitives})
+        return len(self.gltf['meshes']) - 1
+
+    def add_node(self, name, mesh=None, location=None):
+        """
+        Add an object to the scene.
+
+        Parameters:
+        - name: Node name.
+        - mesh: Index returned by add_mesh, or None for an empty node.
+        - location: (x, y, z) translation in Blender axes, or None to leave the node at the origin.
+        """
+        node = {'name': name}
+        if mesh is not None:
+            node['mesh'] = mesh
+        if location is not None:
+            node['translation'] = (Y_UP @ np.asarray(location, dtype=np.float64)).tolist()
+        self.gltf['nodes'].append(node)
+        self.gltf['scenes'][0]['nodes'].append(len(self.gltf['nodes']) - 1)
+
+    def close(self):
+        """Write the header, the JSON chunk and the binary chunk to `path`."""
+        self.gltf['buffers'].append({'byteLength': self.length})
+        if not self.gltf['materials']:
+            del self.gltf['materials']
+        for key in ('meshes', 'accessors', 'bufferViews'):
+            if not self.gltf[key]:
+                del self.gltf[key]
+
+        document = json.dumps(self.gltf, separators=(',', ':')).encode('utf-8')
+        document += b' ' * (-len(document) % 4)  # Chunks are 4-byte aligned
+        padding = -self.length % 4
+        total = 12 + 8 + len(document) + 8 + self.length + padding
+
+        with open(self.path, 'wb') as f:
+            f.write(struct.pack('<III', GLB_MAGIC, 2, total))
+            f.write(struct.pack('<II', len(document), JSON_CHUNK))
+            f.write(document)
+            f.write(struct.pack('<II', self.length + padding, BIN_CHUNK))
+            self.binary.seek(0)
+            shutil.copyfileobj(self.binary, f)
+            f.write(b'\0' * padding)
+        self.binary.close()
+
+
+def export_glb(parts, path, scene_name='Scene', optimize=False, share_meshes=False):
+    """
+    Write RoomMeshes to a .glb file, one part of the dungeon at a time.
+
+    Parameters:
+    - parts: Iterable of dicts of object name -> RoomMesh in final coordinates, such as
+      parallel_geometry.layout_part_meshes yields or [dungeon_meshes(...)]. Each part is
+      encoded and let go before the next one is taken.
+    - path: Output .glb file.
+    - scene_name: Name of the glTF scene.
+    - optimize: Weld vertices and reorder triangles and vertices (see optimize_triangles).
+    - share_meshes: Write identical geometry once, with a translated node per object (see
+      room_geometry.shared_meshes).
+
+    Returns:
+    - Number of objects written.
+    """
+    objects = 0
+    with GlbWriter(path, scene_name, optimize) as glb:
+        indices = {}  # Geometry key -> glTF mesh, with share_meshes
+        for meshes in parts:
+            for name, mesh in meshes.items():
+                if share_meshes:
+                    key, location, local = local_mesh(mesh)
+                    if key not in indices:
+                        indices[key] = glb.add_mesh(name, local)
+                    glb.add_node(name, indices[key], location)
+                else:
+                    glb.add_node(name, glb.add_mesh(name, mesh))
+                objects += 1
+            del meshes
+    return objects
+
+
+def main():
+    merge_quads = '--merge-quads' in sys.argv[1:]
+    optimize = '--optimize' in sys.argv[1:]
+    share_meshes = '--share-meshes' in sys.argv[1:]
+    split = 'room' if '--split-rooms' in sys.argv[1:] else 'story' if '--split-stories' in sys.argv[1:] else None
+    cache = MeshCache() if '--mesh-cache' in sys.argv[1:] else None
+    assets = load_assets()
+    executor = ProcessPoolExecutor(int(os.environ.get('DUNGEON_JOBS', 0)) or os.cpu_count() or 1) if split else None
+    try:
+        for json_file in sorted(glob.glob('*.json')):
+            timer = StageTimer(log, json_file)
+            with open(json_file, 'r') as f:
+                data = json.load(f)
+            timer.lap('load')
+
+            # Built one room (or story) at a time and written as it comes
+            parts = layout_part_meshes(
+                data, assets, split or 'room', 1 if executor is None else None,
+                merge_quads=merge_quads, optimize=optimize, executor=executor, cache=cache,
+            )
+            output_file_glb = os.path.splitext(json_file)[0] + '.glb'
+            objects = export_glb(
+                parts, output_file_glb, scene_name=os.path.splitext(os.path.basename(json_file))[0],
+                optimize=optimize, share_meshes=share_meshes,
+            )
+            timer.lap('export')
+
+            timer.summary(objects=objects, bytes=os.path.getsize(output_file_glb))
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    if cache is not None:
+        cache.prune()
+    log.info("All files exported.")
+    flush()
+
+
+if __name__ == "__main__":
+    main()
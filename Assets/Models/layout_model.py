@@ -0,0 +1,194 @@
+"""
+Compact object model for the dungeon layout JSON.
+
+`load_layout` parses a layout into `__slots__` records (Layout, Rect, Wall, Door, Column,
+Note) instead of nested dicts, with every `dir` sub-dict stored as an integer code:
+
+    layout = load_layout('temple_of_riellis.json')
+    for door in layout.doors:
+        if door.dir == NORTH:
+            ...
+    save_layout(layout, 'temple_of_riellis.json')
+
+Records keep the key order of the object they were read from and carry unknown keys in
+`extra`, so `save_layout` writes back exactly what was read. A field that was absent in the
+JSON is an unset attribute: use `getattr(rect, 'story', 0)` where the scripts used
+`rect.get('story', 0)`, and `del rect.ramp_dir` to drop a key.
+
+A `dir` that is not one of the four unit directions is read as UNKNOWN_DIRECTION with a
+logged warning, so that make-rdb.py falls back to its default rotation as it did with the
+plain dicts. Such a layout cannot be saved back.
+"""
+import json
+
+from pipeline_log import get_logger
+
+log = get_logger('layout_model')
+
+# Unit directions indexed by their integer code, named as in make-rdb.py
+DIRECTIONS = ((1, 0), (0, 1), (-1, 0), (0, -1))
+EAST, NORTH, WEST, SOUTH = range(4)
+DIRECTION_CODES = {direction: code for code, direction in enumerate(DIRECTIONS)}
+
+# Code of the directions that are none of the above
+UNKNOWN_DIRECTION = -1
+
+
+def direction_code(direction):
+    """Integer code of a `{"x", "y"}` direction dict."""
+    try:
+        return DIRECTION_CODES[(direction['x'], direction['y'])]
+    except (KeyError, TypeError):
+        raise ValueError(f"Unsupported direction {direction!r}.") from None
+
+
+def direction_dict(code):
+    """`{"x", "y"}` direction dict of an integer code."""
+    if code == UNKNOWN_DIRECTION:
+        raise ValueError("Directions that were not understood cannot be written back.")
+    dir_x, dir_y = DIRECTIONS[code]
+    return {"x": dir_x, "y": dir_y}
+
+
+def read_direction(direction):
+    """direction_code, or UNKNOWN_DIRECTION with a warning for an unsupported direction."""
+    try:
+        return direction_code(direction)
+    except ValueError as exc:
+        log.warning("%s Using the default.", exc)
+        return UNKNOWN_DIRECTION
+
+
+# Key orders are shared between records instead of stored once per object
+_key_orders = {}
+
+
+class Record:
+    """
+    Base class of the layout records.
+
+    FIELDS maps each known JSON key to a (decode, encode) pair, or None when the value is
+    stored as is. Known keys become slot attributes, anything else goes to `extra`.
+    """
+    __slots__ = ('_keys', 'extra')
+    FIELDS = {}
+
+    @classmethod
+    def from_json(cls, obj):
+        record = cls.__new__(cls)
+        keys = tuple(obj)
+        record._keys = _key_orders.setdefault(keys, keys)
+        record.extra = None
+        fields = cls.FIELDS
+        for key, value in obj.items():
+            if key in fields:
+                codec = fields[key]
+                setattr(record, key, value if codec is None else codec[0](value))
+            else:
+                if record.extra is None:
+                    record.extra = {}
+                record.extra[key] = value
+        return record
+
+    def to_json(self):
+        """Plain dict in the original key order, followed by fields set after loading."""
+        fields = self.FIELDS
+        obj = {}
+        for key in self._keys:
+            if key not in fields:
+                obj[key] = self.extra[key]
+            elif hasattr(self, key):
+                codec = fields[key]
+                value = getattr(self, key)
+                obj[key] = value if codec is None else codec[1](value)
+        for key, codec in fields.items():
+            if key not in obj and key not in self._keys and hasattr(self, key):
+                value = getattr(self, key)
+                obj[key] = value if codec is None else codec[1](value)
+        return obj
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.to_json()!r})"
+
+
+def _records(cls):
+    """Codec for a list of records of the given class."""
+    return (
+        lambda values: [cls.from_json(value) for value in values],
+        lambda records: [record.to_json() for record in records],
+    )
+
+
+_DIRECTION = (read_direction, direction_dict)
+_POSITION = (lambda pos: (pos['x'], pos['y']), lambda pos: {"x": pos[0], "y": pos[1]})
+
+
+class Wall(Record):
+    __slots__ = ('x', 'y', 'dir', 'level')
+    FIELDS = {'x': None, 'y': None, 'dir': _DIRECTION, 'level': None}
+
+    def __init__(self, x, y, dir, level):
+        self._keys, self.extra = ('x', 'y', 'dir', 'level'), None
+        self.x, self.y, self.dir, self.level = x, y, dir, level
+
+
+class Door(Record):
+    __slots__ = ('x', 'y', 'dir', 'type', 'story')
+    FIELDS = {'x': None, 'y': None, 'dir': _DIRECTION, 'type': None, 'story': None}
+
+
+class Column(Record):
+    __slots__ = ('x', 'y', 'story')
+    FIELDS = {'x': None, 'y': None, 'story': None}
+
+
+class Note(Record):
+    """Note with its `pos` stored as an (x, y) tuple."""
+    __slots__ = ('text', 'ref', 'pos', 'story')
+    FIELDS = {'text': None, 'ref': None, 'pos': _POSITION, 'story': None}
+
+
+class Rect(Record):
+    """Room rectangle; `walls` are Wall records, `wall_segments` stay plain dicts."""
+    __slots__ = (
+        'x', 'y', 'w', 'h', 'rotunda', 'ending', 'vault', 'ceiling', 'walls', 'wall_segments',
+        'exits', 'type', 'story', 'ramp_info', 'ramp_dir',
+    )
+    FIELDS = {
+        'x': None, 'y': None, 'w': None, 'h': None, 'rotunda': None, 'ending': None,
+        'vault': None, 'ceiling': None, 'walls': _records(Wall), 'wall_segments': None,
+        'exits': None, 'type': None, 'story': None, 'ramp_info': None, 'ramp_dir': None,
+    }
+
+    def is_ramp(self):
+        return getattr(self, 'type', None) == 'ramp'
+
+
+class Layout(Record):
+    __slots__ = ('version', 'title', 'story', 'rects', 'doors', 'notes', 'columns', 'water')
+    FIELDS = {
+        'version': None, 'title': None, 'story': None, 'rects': _records(Rect),
+        'doors': _records(Door), 'notes': _records(Note), 'columns': _records(Column),
+        'water': None,
+    }
+
+
+def load_layout(path):
+    """
+    Parse a layout JSON file into a Layout.
+
+    Parameters:
+    - path: Layout JSON file.
+
+    Returns:
+    - Layout whose `rects`, `doors`, `notes` and `columns` are lists of records (unset if
+      the file has no such key).
+    """
+    with open(path) as f:
+        return Layout.from_json(json.load(f))
+
+
+def save_layout(layout, path, indent=4):
+    """Write a Layout back to JSON, formatted like the pipeline scripts write it."""
+    with open(path, 'w') as f:
+        json.dump(layout.to_json(), f, indent=indent)
@@ -2,18 +2,23 @@ import os
 import json
 import random
 
+from layout_model import EAST, NORTH, SOUTH, WEST, load_layout
+from pipeline_log import StageTimer, get_logger
+
+log = get_logger('make-rdb')
+
 
 def exit_yrotation(door_dir):
     """
-    Map the door's direction to a specific YRotation value.
+    Map the door's direction code to a specific YRotation value.
     """
-    if door_dir == {"x": 0, "y": 1}:  # Silverstar House
+    if door_dir == NORTH:  # Silverstar House
         return 512
-    elif door_dir == {"x": 1, "y": 0}:  # Forgotten Lair
+    elif door_dir == EAST:  # Forgotten Lair
         return 0
-    elif door_dir == {"x": 0, "y": -1}:  # Tomb of the Demon Priest
+    elif door_dir == SOUTH:  # Tomb of the Demon Priest
         return 1536
-    elif door_dir == {"x": -1, "y": 0}:  # Temple of Riellis
+    elif door_dir == WEST:  # Temple of Riellis
         return 1024
     else:
         return 0  # Default rotation
@@ -21,16 +26,16 @@ def exit_yrotation(door_dir):
 
 def calculate_player_position(door_dir):
     """
-    Calculate the player's position adjustment based on the door's direction.
+    Calculate the player's position adjustment based on the door's direction code.
     Ensure only one of XPos or ZPos is non-zero.
     """
-    if door_dir == {"x": 0, "y": -1}:  # South
+    if door_dir == SOUTH:
         return {"XPos": 0, "ZPos": 128}
-    elif door_dir == {"x": 0, "y": 1}:  # North
+    elif door_dir == NORTH:
         return {"XPos": 0, "ZPos": -128}
-    elif door_dir == {"x": 1, "y": 0}:  # East
+    elif door_dir == EAST:
         return {"XPos": -128, "ZPos": 0}
-    elif door_dir == {"x": -1, "y": 0}:  # West
+    elif door_dir == WEST:
         return {"XPos": 128, "ZPos": 0}
     else:
         return {"XPos": 0, "ZPos": 0}  # Default (no adjustment)
@@ -54,33 +59,33 @@ def calculate_door_position(door):
     then adjust its placement within the doorframe based on its facing direction.
     """
     # Convert door grid coordinates to world coordinates
-    x_pos = door["x"] * -128
-    z_pos = door["y"] * -128
+    x_pos = door.x * -128
+    z_pos = door.y * -128
 
     # Adjust within doorframe based on direction
-    direction = door.get("dir", {})
-    if direction == {"x": 0, "y": -1}:
+    direction = getattr(door, "dir", None)
+    if direction == SOUTH:
         x_pos -= 16
-    elif direction == {"x": 0, "y": 1}:
+    elif direction == NORTH:
         x_pos += 16
-    elif direction == {"x": 1, "y": 0}:
+    elif direction == EAST:
         z_pos += 16
-    elif direction == {"x": -1, "y": 0}:
+    elif direction == WEST:
         z_pos -= 16
 
     return {"XPos": x_pos, "ZPos": z_pos}
 
 def door_yrotation(door_dir):
     """
-    Map the door's direction to a specific YRotation value.
+    Map the door's direction code to a specific YRotation value.
     """
-    if door_dir == {"x": 0, "y": 1}:
+    if door_dir == NORTH:
         return 1024
-    elif door_dir == {"x": 1, "y": 0}:
+    elif door_dir == EAST:
         return 1536
-    elif door_dir == {"x": 0, "y": -1}:
+    elif door_dir == SOUTH:
         return 0
-    elif door_dir == {"x": -1, "y": 0}:
+    elif door_dir == WEST:
         return 512
     else:
         return 0  # Default rotation
@@ -107,10 +112,10 @@ def add_doors(output_data, doors):
 
     for door in doors:
         # Filter for door types 1, 4, and 7
-        if door["type"] in {1, 2, 4, 6, 7}:
+        if door.type in {1, 2, 4, 6, 7}:
             door_position = calculate_door_position(door)
-            y_rotation = door_yrotation(door["dir"])  # Determine direction
-            story = door.get("story", 0)  # Get story value, default to 0
+            y_rotation = door_yrotation(door.dir)  # Determine direction
+            story = getattr(door, "story", 0)  # Get story value, default to 0
             y_pos = story * -128  # Adjust YPos based on story
 
             # Create the door object
@@ -174,8 +179,8 @@ def place_monsters_in_room(room, monster_count, faction_ids, rdb_objects):
     """
     room_tiles = [
         (x, y)
-        for x in range(room["x"], room["x"] + room["w"])
-        for y in range(room["y"], room["y"] + room["h"])
+        for x in range(room.x, room.x + room.w)
+        for y in range(room.y, room.y + room.h)
     ]
     monster_positions = random.sample(room_tiles, min(len(room_tiles), monster_count))
 
@@ -214,8 +219,8 @@ def add_monsters_by_rooms(output_data, rects, entrance_coords, door_coords):
     Add monsters to rooms based on their size and randomized rules.
     """
     for rect in rects:
-        room_width = rect["w"]
-        room_height = rect["h"]
+        room_width = rect.w
+        room_height = rect.h
         room_size = min(room_width, room_height)  # Shortest side
 
         # Skip 1x1 rooms
@@ -224,17 +229,17 @@ def add_monsters_by_rooms(output_data, rects, entrance_coords, door_coords):
 
         # Determine monster count
         monster_count = calculate_monster_count(room_size - 1)
-        print(f"Room {rect['x']}, {rect['y']} - Monster count: {monster_count}")
+        log.debug("Room %s, %s - Monster count: %d", rect.x, rect.y, monster_count)
 
         # Get the story value for the room
-        story = rect.get("story", 0)
+        story = getattr(rect, "story", 0)
 
         # Place monsters randomly in the room
         placed_positions = set()  # Track occupied tiles
         for _ in range(monster_count):
             while True:
-                x = random.randint(rect["x"], rect["x"] + rect["w"] - 1)
-                y = random.randint(rect["y"], rect["y"] + rect["h"] - 1)
+                x = random.randint(rect.x, rect.x + rect.w - 1)
+                y = random.randint(rect.y, rect.y + rect.h - 1)
 
                 if (x, y) not in placed_positions and (x, y) not in entrance_coords and (x, y) not in door_coords:
                     placed_positions.add((x, y))
@@ -292,9 +297,11 @@ def add_monster(output_data, x, y, faction_id, story=0):
 
 
 def process_json(input_file):
+    timer = StageTimer(log, input_file)
+
     # Read the input JSON
-    with open(input_file, "r") as file:
-        data = json.load(file)
+    with timer.stage("load"):
+        layout = load_layout(input_file)
 
     # Prepare the RDB.json structure
     output_data = {
@@ -417,15 +424,15 @@ def process_json(input_file):
     add_door_model_reference(output_data)
 
     # Process doors
-    doors = data.get("doors", [])
-    add_doors(output_data, doors)
+    doors = getattr(layout, "doors", [])
+    with timer.stage("doors"):
+        add_doors(output_data, doors)
 
     # Adjust the YRotation for ModelIndex 1 and position for Index 2
-    doors = data.get("doors", [])
-    door_match = next((door for door in doors if door["x"] == 0 and door["y"] == 0), None)
+    door_match = next((door for door in doors if door.x == 0 and door.y == 0), None)
 
     if door_match:
-        door_dir = door_match.get("dir", {})
+        door_dir = getattr(door_match, "dir", None)
         adjusted_yrotation = exit_yrotation(door_dir)
         position_adjustment = calculate_player_position(door_dir)
 
@@ -457,25 +464,29 @@ def process_json(input_file):
     entrance_coords = (0, 0)  # Replace with actual entrance logic if dynamic
 
     # Get all door coordinates from the 'doors' list
-    door_coords = {(door["x"], door["y"]) for door in data.get("doors", [])}
+    door_coords = {(door.x, door.y) for door in doors}
 
     # Add monsters by rooms
-    add_monsters_by_rooms(output_data, data.get("rects", []), entrance_coords, door_coords)
+    with timer.stage("monsters"):
+        add_monsters_by_rooms(output_data, getattr(layout, "rects", []), entrance_coords, door_coords)
 
 
     # Write the modified data to the output file
     output_file = os.path.splitext(input_file)[0] + ".RDB.json"
-    with open(output_file, "w") as file:
-        json.dump(output_data, file, indent=4)
+    with timer.stage("save"):
+        with open(output_file, "w") as file:
+            json.dump(output_data, file, indent=4)
+
+    timer.summary(objects=len(output_data["RdbBlock"]["ObjectRootList"][0]["RdbObjects"]))
 
 
 def main():
     # Process all JSON files in the current directory
     for filename in os.listdir("."):
         if filename.endswith(".json") and not filename.endswith(".RDB.json"):
-            print(f"Processing {filename}...")
+            log.debug("Processing %s...", filename)
             process_json(filename)
-    print("Processing complete.")
+    log.info("Processing complete.")
 
 
 if __name__ == "__main__":
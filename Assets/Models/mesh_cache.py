@@ -0,0 +1,193 @@
+"""
+On-disk cache of the meshes of layout parts, so that re-exporting an edited layout only
+rebuilds the rooms that changed.
+
+Every part of a split layout (see parallel_geometry.split_layout) is stored under a hash
+of everything its meshes depend on:
+- its rects (with their walls, ramps and ceilings), doors and columns;
+- the wall and doorway assets;
+- the dungeon transform;
+- the build options;
+- the source of the modules that build the meshes (GEOMETRY_MODULES), so any change to
+  them rebuilds everything.
+
+An edited room hashes differently and is rebuilt; the other rooms are read back. Files
+are written once under their hash and never changed, so parallel runs can share the
+cache folder and it can be deleted at any time. Moving Room_0_0 changes the transform of
+every room, so it rebuilds them all.
+
+Reading an entry marks it as used. `prune` deletes the entries that have not been used
+for the longest time, once they are too old or the folder is too large.
+"""
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+import time
+
+import numpy as np
+
+import mesh_optimize
+import room_geometry
+import room_lookup
+import wall_segments
+from pipeline_log import get_logger
+
+log = get_logger('mesh_cache')
+
+# Cache folder, next to the layouts; Unity does not import folders starting with a dot
+DEFAULT_DIRECTORY = '.mesh_cache'
+
+# Modules whose source the cached meshes depend on
+GEOMETRY_MODULES = (room_geometry, mesh_optimize, room_lookup, wall_segments)
+
+# Limits `prune` keeps the cache folder within
+MAX_AGE = 30 * 24 * 3600  # Seconds since an entry was last used
+MAX_BYTES = 256 * 2 ** 20
+
+_source_digest = None
+
+
+def source_digest():
+    """Hash of the source of GEOMETRY_MODULES, read once per process."""
+    global _source_digest
+
+    if _source_digest is None:
+        digest = hashlib.sha1()
+        for module in GEOMETRY_MODULES:
+            with open(module.__file__, 'rb') as f:
+                digest.update(f.read())
+        _source_digest = digest.hexdigest()
+    return _source_digest
+
+
+def asset_digest(digest, asset):
+    """Add an Asset (or None) to a hash."""
+    if asset is None:
+        digest.update(b'none')
+        return
+    for array in (asset.verts, asset.corners, asset.starts, asset.sizes, asset.uvs, asset.material_indices):
+        digest.update(np.ascontiguousarray(array).tobytes())
+    digest.update(repr((list(asset.materials), tuple(asset.scale))).encode('utf-8'))
+
+
+class MeshCache:
+    """
+    Meshes of layout parts, one file per part in `directory`.
+
+    Usage:
+        keys = cache.part_keys(parts, assets, matrix)
+        meshes = cache.load(keys[0])  # None if the part has not been built yet
+        cache.save(keys[0], dungeon_meshes(parts[0], assets, matrix=matrix))
+    """
+
+    def __init__(self, directory=DEFAULT_DIRECTORY):
+        self.directory = os.path.abspath(directory)
+        self.hits = 0
+        self.misses = 0
+
+    def part_keys(self, parts, assets, matrix, merge_quads=False, optimize=False):
+        """
+        Cache key of every part.
+
+        Parameters:
+        - parts: Layout dicts, as split_layout returns them.
+        - assets: Dict with the 'wall' and 'doorway' Assets.
+        - matrix: Dungeon transform the parts are built with.
+        - merge_quads, optimize: Options of dungeon_meshes.
+
+        Returns:
+        - List of hex digests, in the order of `parts`.
+        """
+        # What all parts have in common is hashed once
+        common = hashlib.sha1(f"{source_digest()} {merge_quads} {optimize}".encode('utf-8'))
+        for key in ('wall', 'doorway'):
+            asset_digest(common, assets.get(key))
+        common.update(np.ascontiguousarray(matrix, dtype=np.float64).tobytes())
+
+        keys = []
+        for part in parts:
+            digest = common.copy()
+            content = {key: part.get(key, []) for key in ('rects', 'doors', 'columns')}
+            digest.update(json.dumps(content, sort_keys=True).encode('utf-8'))
+            keys.append(digest.hexdigest())
+        return keys
+
+    def path(self, key):
+        return os.path.join(self.directory, key + '.pickle')
+
+    def load(self, key):
+        """The meshes stored under `key` (dict of object name -> RoomMesh), or None."""
+        try:
+            with open(self.path(key), 'rb') as f:
+                meshes = pickle.load(f)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError) as exc:
+            log.warning("Ignoring unreadable cached meshes %s: %s", key, exc)
+            self.misses += 1
+            return None
+        self.hits += 1
+        try:
+            os.utime(self.path(key))  # Last used now, for prune
+        except OSError:
+            pass
+        return meshes
+
+    def save(self, key, meshes):
+        """Store the meshes of one part under `key`."""
+        os.makedirs(self.directory, exist_ok=True)
+
+        # Written to a temporary file first, so that readers never see part of a file
+        handle, temporary = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(handle, 'wb') as f:
+                pickle.dump(meshes, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temporary, self.path(key))
+        except BaseException:
+            os.remove(temporary)
+            raise
+
+    def prune(self, max_age=MAX_AGE, max_bytes=MAX_BYTES):
+        """
+        Delete the entries unused for more than `max_age` seconds, then the least recently
+        used ones until the folder holds at most `max_bytes`. Leftover temporary files of
+        interrupted runs go by age too.
+
+        Returns:
+        - Number of files deleted.
+        """
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return 0
+
+        entries = []
+        for name in names:
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort(reverse=True)  # Most recently used first
+
+        now = time.time()
+        kept_bytes = 0
+        deleted = 0
+        for mtime, size, path in entries:
+            kept_bytes += size
+            if now - mtime <= max_age and kept_bytes <= max_bytes:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            kept_bytes -= size
+            deleted += 1
+
+        if deleted:
+            log.debug("Pruned %s cached meshes, %.0f MB left.", deleted, kept_bytes / 2 ** 20)
+        return deleted
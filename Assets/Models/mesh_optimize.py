@@ -0,0 +1,462 @@
+"""
+Optional clean-up passes over finished RoomMeshes.
+
+`merge_coplanar_quads` replaces runs of unit floor, wall and ceiling quads by the fewest
+rectangles that cover them (greedy meshing), keeping the texture's one repeat per unit.
+`optimize_mesh` welds coincident vertices, drops degenerate faces and orders faces and
+vertices for the GPU's post-transform vertex cache and vertex fetch. These passes only use
+the RoomMesh arrays, so they run with or without Blender.
+"""
+import heapq
+
+import numpy as np
+
+# Distances and UVs closer than this are treated as equal
+EPSILON = 1e-5
+DECIMALS = 5
+
+# Vertex cache model of cache_order (Tom Forsyth, "Linear-Speed Vertex Cache Optimisation")
+CACHE_SIZE = 32
+CACHE_DECAY_POWER = 1.5
+LAST_TRIANGLE_SCORE = 0.75
+VALENCE_BOOST_SCALE = 2.0
+VALENCE_BOOST_POWER = 0.5
+
+
+def _rounded(values):
+    """Values rounded for use as grouping keys, with -0.0 folded into 0.0."""
+    return np.round(values, DECIMALS) + 0.0
+
+
+def quad_planes(points):
+    """
+    Plane frame of every quad.
+
+    Parameters:
+    - points: Q x 4 x 3 array of quad corners.
+
+    Returns:
+    - normals: Unit normals (following the winding), or zero for degenerate quads.
+    - axis_a, axis_b: In-plane axes with axis_a x axis_b = normal. axis_a is horizontal
+      (X for floors and ceilings), so walls get a horizontal and a vertical axis.
+    """
+    normals = np.cross(points, np.roll(points, -1, axis=1)).sum(axis=1)
+    lengths = np.linalg.norm(normals, axis=1)
+    normals = np.divide(normals, lengths[:, None], out=np.zeros_like(normals), where=lengths[:, None] > EPSILON)
+
+    axis_a = np.cross((0.0, 0.0, 1.0), normals)
+    a_lengths = np.linalg.norm(axis_a, axis=1)
+    horizontal = a_lengths < EPSILON
+    axis_a[horizontal] = (1.0, 0.0, 0.0)
+    a_lengths[horizontal] = 1.0
+    axis_a /= a_lengths[:, None]
+    return normals, axis_a, np.cross(normals, axis_a)
+
+
+def greedy_rectangles(grid):
+    """
+    Cover the True cells of a boolean grid with rectangles, each grown as far as it goes
+    along the first axis and then the second.
+
+    Returns:
+    - List of (i0, i1, j0, j1) cell ranges, end exclusive.
+    """
+    free = grid.copy()
+    rectangles = []
+    rows, columns = free.shape
+    for i in range(rows):
+        for j in range(columns):
+            if not free[i, j]:
+                continue
+            j1 = j + 1
+            while j1 < columns and free[i, j1]:
+                j1 += 1
+            i1 = i + 1
+            while i1 < rows and free[i1, j:j1].all():
+                i1 += 1
+            free[i:i1, j:j1] = False
+            rectangles.append((i, i1, j, j1))
+    return rectangles
+
+
+def merge_coplanar_quads(mesh, materials):
+    """
+    Merge coplanar rectangular quads of a RoomMesh into larger rectangles.
+
+    Quads are merged when they share material, plane, facing and UV mapping: their UVs must
+    be the same affine function of the position on the plane, up to whole texture repeats.
+    Rectangles are then grown greedily over the area the quads cover, and get UVs from that
+    mapping, so the texture still repeats once per unit. Overlapping quads (like the center
+    of a rotunda's plus floor) are covered once. Other faces are left as they are.
+
+    Parameters:
+    - mesh: RoomMesh to rework in place.
+    - materials: Names of the materials whose textures repeat; faces of other materials
+      (like imported assets) are never merged.
+
+    Returns:
+    - Number of faces removed.
+    """
+    slots = [slot for slot, material in enumerate(mesh.materials) if material in materials]
+    if not slots or len(mesh.faces) < 2:
+        return 0
+
+    verts, corners, starts, sizes, uvs = mesh.arrays()
+    face_materials = np.array(mesh.face_materials, dtype=np.int64)
+    quads = np.flatnonzero((sizes == 4) & np.isin(face_materials, slots))
+    if len(quads) < 2:
+        return 0
+
+    quad_corners = starts[quads][:, None] + np.arange(4)
+    points = verts[corners[quad_corners]]
+    quad_uvs = uvs[quad_corners]
+
+    # Corners in the plane frame of their quad
+    normals, axis_a, axis_b = quad_planes(points)
+    a = np.einsum('qkc,qc->qk', points, axis_a)
+    b = np.einsum('qkc,qc->qk', points, axis_b)
+    depth = np.einsum('qkc,qc->qk', points, normals)
+
+    # Planar rectangles with edges along the plane axes
+    along_a = np.abs(np.roll(b, -1, axis=1) - b) < EPSILON
+    along_b = np.abs(np.roll(a, -1, axis=1) - a) < EPSILON
+    alternating = (along_a != along_b).all(axis=1) & (along_a[:, 0] != along_a[:, 1])
+    valid = (
+        (np.abs(normals).sum(axis=1) > 0) & (np.ptp(depth, axis=1) < EPSILON)
+        & alternating & (along_a[:, 0] == along_a[:, 2])
+    )
+    if valid.sum() < 2:
+        return 0
+    quads, a, b, depth, quad_uvs = quads[valid], a[valid], b[valid], depth[valid, 0], quad_uvs[valid]
+    normals, axis_a, axis_b = normals[valid], axis_a[valid], axis_b[valid]
+
+    # UV = (a, b) @ mapping + offset, solved from three corners and checked on the fourth
+    system = np.stack((a[:, :3], b[:, :3], np.ones((len(quads), 3))), axis=2)
+    solution = np.linalg.solve(system, quad_uvs[:, :3])
+    mapping, offset = solution[:, :2], solution[:, 2]
+    predicted = np.einsum('qk,qu->qku', a, mapping[:, 0]) + np.einsum('qk,qu->qku', b, mapping[:, 1]) + offset[:, None]
+    affine = np.abs(predicted - quad_uvs).max(axis=(1, 2)) < EPSILON
+
+    # Quads that can merge share every key column; offsets only matter up to whole repeats
+    keys = np.column_stack((
+        face_materials[quads], _rounded(normals), _rounded(depth), _rounded(mapping.reshape(-1, 4)),
+        _rounded(_rounded(offset) % 1.0) % 1.0,
+    ))
+    keys[~affine, 0] = -1 - np.arange((~affine).sum())  # Never grouped
+    _, group_of = np.unique(keys, axis=0, return_inverse=True)
+    group_of = group_of.reshape(-1)
+
+    removed_quads = []
+    new_verts, new_uvs, new_materials = [], [], []
+    for group in np.flatnonzero(np.bincount(group_of) > 1):
+        members = np.flatnonzero(group_of == group)
+        # Grid lines through every quad edge; rectangles reuse the quads' own coordinates
+        a_edges = np.concatenate((a[members].min(axis=1), a[members].max(axis=1)))
+        b_edges = np.concatenate((b[members].min(axis=1), b[members].max(axis=1)))
+        a_keys, a_lines = np.unique(_rounded(a_edges), return_index=True)
+        b_keys, b_lines = np.unique(_rounded(b_edges), return_index=True)
+        grid_a, grid_b = a_edges[a_lines], b_edges[b_lines]
+
+        covered = np.zeros((len(grid_a) - 1, len(grid_b) - 1), dtype=bool)
+        a_index = np.searchsorted(a_keys, _rounded(a_edges)).reshape(2, -1)
+        b_index = np.searchsorted(b_keys, _rounded(b_edges)).reshape(2, -1)
+        for i0, i1, j0, j1 in zip(a_index[0], a_index[1], b_index[0], b_index[1]):
+            covered[i0:i1, j0:j1] = True
+
+        rectangles = greedy_rectangles(covered)
+        if len(rectangles) >= len(members):
+            continue
+
+        first = members[0]
+        for i0, i1, j0, j1 in rectangles:
+            # Counter-clockwise in the plane frame, so the face keeps its normal
+            plane = np.array([
+                (grid_a[i0], grid_b[j0]), (grid_a[i1], grid_b[j0]),
+                (grid_a[i1], grid_b[j1]), (grid_a[i0], grid_b[j1]),
+            ])
+            new_verts.append(
+                plane[:, :1] * axis_a[first] + plane[:, 1:] * axis_b[first] + depth[first] * normals[first]
+            )
+            new_uvs.append(plane @ mapping[first] + offset[first])
+            new_materials.append(face_materials[quads[first]])
+        removed_quads.append(quads[members])
+
+    if not removed_quads:
+        return 0
+
+    keep = np.ones(len(sizes), dtype=bool)
+    keep[np.concatenate(removed_quads)] = False
+    keep_corners = np.repeat(keep, sizes)
+
+    all_corners = np.concatenate((corners[keep_corners], len(verts) + np.arange(4 * len(new_verts))))
+    used, all_corners = np.unique(all_corners, return_inverse=True)
+    all_verts = np.concatenate((verts, *new_verts))[used]
+    all_sizes = np.concatenate((sizes[keep], np.full(len(new_verts), 4)))
+    all_starts = np.zeros(len(all_sizes), dtype=np.int64)
+    np.cumsum(all_sizes[:-1], out=all_starts[1:])
+
+    mesh.set_arrays(all_verts, all_corners.reshape(-1), all_starts, np.concatenate((uvs[keep_corners], *new_uvs)))
+    mesh.face_materials = face_materials[keep].tolist() + [int(material) for material in new_materials]
+    return int(len(sizes) - len(all_sizes))
+
+
+def first_occurrence(rows):
+    """
+    Unique rows in order of first occurrence.
+
+    Returns:
+    - keep: Index of the first occurrence of every unique row.
+    - remap: Index of every row among the unique rows.
+    """
+    _, first, inverse = np.unique(rows, axis=0, return_index=True, return_inverse=True)
+    order = np.argsort(first)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    return first[order], rank[inverse.reshape(-1)]
+
+
+def fan_triangles(starts, sizes):
+    """
+    Fan triangulation of faces from their first corner.
+
+    Returns:
+    - Corner index triples of the triangles, face by face.
+    - Face of every triangle.
+    """
+    face_of = np.repeat(np.arange(len(sizes)), sizes)
+    offsets = np.arange(len(face_of)) - starts[face_of]
+    tips = np.flatnonzero(offsets >= 2)
+    return np.column_stack((starts[face_of[tips]], tips - 1, tips)), face_of[tips]
+
+
+def degenerate_triangles(positions, triangles):
+    """Triangles that repeat a vertex or have no area."""
+    points = positions[triangles]
+    areas = np.linalg.norm(np.cross(points[:, 1] - points[:, 0], points[:, 2] - points[:, 0]), axis=1)
+    repeated = (
+        (triangles[:, 0] == triangles[:, 1]) | (triangles[:, 1] == triangles[:, 2])
+        | (triangles[:, 2] == triangles[:, 0])
+    )
+    return repeated | (areas <= EPSILON ** 2)
+
+
+def weld_vertices(mesh):
+    """
+    Merge the vertices of a RoomMesh that share a position. UVs are stored per face corner,
+    as Blender stores them, so UV seams keep their UVs without vertices of their own.
+
+    Returns:
+    - Number of vertices removed.
+    """
+    verts, corners, starts, sizes, uvs = mesh.arrays()
+    if not len(verts):
+        return 0
+    keep, remap = first_occurrence(_rounded(verts))
+    mesh.set_arrays(verts[keep], remap[corners], starts, uvs)
+    return len(verts) - len(keep)
+
+
+def remove_degenerate_faces(mesh):
+    """
+    Drop collapsed edges from the faces of a RoomMesh, then the faces that are left with
+    fewer than three corners, visit a vertex twice or have no area, and the faces over the
+    same vertices and facing the same way as an earlier face (coincident faces once
+    welded). Faces back to back are both kept.
+
+    Returns:
+    - Number of faces removed.
+    """
+    verts, corners, starts, sizes, uvs = mesh.arrays()
+    if not len(sizes):
+        return 0
+
+    # Corners that repeat the vertex of the next corner
+    face_of = np.repeat(np.arange(len(sizes)), sizes)
+    offsets = np.arange(len(face_of)) - starts[face_of]
+    following = corners[starts[face_of] + (offsets + 1) % sizes[face_of]]
+    kept = corners != following
+    kept_faces = face_of[kept]
+    kept_sizes = np.bincount(kept_faces, minlength=len(sizes))
+
+    # Faces that still revisit a vertex
+    distinct = np.unique(np.column_stack((kept_faces, corners[kept])), axis=0)[:, 0]
+    revisiting = np.bincount(distinct, minlength=len(sizes)) < kept_sizes
+
+    # Twice the area of every face, from a fan around its first kept corner
+    points = verts[corners[kept]]
+    kept_starts = np.zeros(len(sizes), dtype=np.int64)
+    np.cumsum(kept_sizes[:-1], out=kept_starts[1:])
+    kept_offsets = np.arange(len(points)) - kept_starts[kept_faces]
+    first = points[kept_starts[kept_faces]]
+    following = points[kept_starts[kept_faces] + (kept_offsets + 1) % kept_sizes[kept_faces]]
+    cross = np.cross(points - first, following - first)
+    normals = np.column_stack([np.bincount(kept_faces, cross[:, axis], len(sizes)) for axis in range(3)])
+
+    valid = (kept_sizes >= 3) & ~revisiting & (np.linalg.norm(normals, axis=1) > EPSILON ** 2)
+
+    # Faces whose sorted vertices and facing repeat those of an earlier valid face
+    vertex_sets = np.full((len(sizes), kept_sizes.max()), -1, dtype=np.int64)
+    vertex_sets[kept_faces, kept_offsets] = corners[kept][np.lexsort((corners[kept], kept_faces))]
+    lengths = np.linalg.norm(normals, axis=1)
+    facing = _rounded(np.divide(normals, lengths[:, None], out=np.zeros_like(normals), where=lengths[:, None] > 0))
+    valid_faces = np.flatnonzero(valid)
+    _, first = np.unique(
+        np.column_stack((vertex_sets[valid_faces], facing[valid_faces])), axis=0, return_index=True,
+    )
+    valid[np.setdiff1d(valid_faces, valid_faces[first])] = False
+
+    if valid.all() and kept.all():
+        return 0
+
+    keep_corners = kept & valid[face_of]
+    new_sizes = kept_sizes[valid]
+    new_starts = np.zeros(len(new_sizes), dtype=np.int64)
+    np.cumsum(new_sizes[:-1], out=new_starts[1:])
+    mesh.set_arrays(verts, corners[keep_corners], new_starts, uvs[keep_corners])
+    mesh.face_materials = np.array(mesh.face_materials, dtype=np.int64)[valid].tolist()
+    return int(len(sizes) - len(new_sizes))
+
+
+def _vertex_score(position, remaining, cache_size):
+    """Forsyth score of a vertex at a cache position (-1 = not cached) with `remaining` triangles."""
+    if remaining == 0:
+        return -1.0
+    score = 0.0
+    if position >= 0:
+        if position < 3:
+            score = LAST_TRIANGLE_SCORE  # Used by the last triangle, whichever way it is entered
+        else:
+            score = (1.0 - (position - 3) / (cache_size - 3)) ** CACHE_DECAY_POWER
+    return score + VALENCE_BOOST_SCALE * remaining ** -VALENCE_BOOST_POWER
+
+
+def cache_order(triangles, cache_size=CACHE_SIZE):
+    """
+    Triangle order for the post-transform vertex cache, by Forsyth's greedy algorithm:
+    always emit the triangle whose vertices are most recently used or have the fewest
+    triangles left.
+
+    Parameters:
+    - triangles: T x 3 array of vertex indices.
+    - cache_size: Size of the modelled LRU cache.
+
+    Returns:
+    - Triangle indices in drawing order.
+    """
+    tri_list = np.asarray(triangles).tolist()
+    count = len(tri_list)
+    if not count:
+        return np.zeros(0, dtype=np.int64)
+
+    vertex_count = max(max(tri) for tri in tri_list) + 1
+    vertex_triangles = [[] for _ in range(vertex_count)]
+    for t, tri in enumerate(tri_list):
+        for v in tri:
+            vertex_triangles[v].append(t)
+
+    remaining = [len(tris) for tris in vertex_triangles]
+    vertex_score = [_vertex_score(-1, r, cache_size) for r in remaining]
+    triangle_score = [sum(vertex_score[v] for v in tri) for tri in tri_list]
+    emitted = [False] * count
+
+    # Best-first candidates for when no cached vertex has triangles left. Entries are
+    # (-score, triangle) and go stale when the score changes; those are skipped.
+    candidates = [(-score, t) for t, score in enumerate(triangle_score)]
+    heapq.heapify(candidates)
+
+    order = []
+    cache = []
+    best = max(range(count), key=triangle_score.__getitem__)
+    while best >= 0:
+        order.append(best)
+        emitted[best] = True
+        tri = tri_list[best]
+        for v in tri:
+            remaining[v] -= 1
+            vertex_triangles[v].remove(best)
+
+        # Move the triangle's vertices to the front of the cache
+        cache = tri + [v for v in cache if v not in tri]
+        evicted = cache[cache_size:]
+        cache = cache[:cache_size]
+        for v in evicted:
+            vertex_score[v] = _vertex_score(-1, remaining[v], cache_size)
+        for position, v in enumerate(cache):
+            vertex_score[v] = _vertex_score(position, remaining[v], cache_size)
+
+        # Only triangles of cached vertices are candidates for the next one
+        best, best_score = -1, -1.0
+        for v in evicted:
+            for t in vertex_triangles[v]:
+                score = triangle_score[t] = sum(vertex_score[w] for w in tri_list[t])
+                heapq.heappush(candidates, (-score, t))
+        for v in cache:
+            for t in vertex_triangles[v]:
+                score = triangle_score[t] = sum(vertex_score[w] for w in tri_list[t])
+                heapq.heappush(candidates, (-score, t))
+                if score > best_score:
+                    best, best_score = t, score
+
+        # Highest score left, lowest index first on ties
+        while best < 0 and candidates:
+            score, t = heapq.heappop(candidates)
+            if not emitted[t] and -score == triangle_score[t]:
+                best = t
+
+    return np.array(order, dtype=np.int64)
+
+
+def fetch_order(indices, vertex_count):
+    """
+    Vertex order by first use in an index buffer, so vertices are fetched front to back.
+    Unused vertices go last.
+
+    Returns:
+    - order: Old index of every new vertex.
+    - remap: New index of every old vertex.
+    """
+    first_use = np.full(vertex_count, len(indices))
+    np.minimum.at(first_use, indices, np.arange(len(indices)))
+    order = np.argsort(first_use, kind='stable')
+    remap = np.empty_like(order)
+    remap[order] = np.arange(vertex_count)
+    return order, remap
+
+
+def optimize_face_order(mesh):
+    """
+    Reorder the faces of a RoomMesh by cache_order and its vertices by fetch_order,
+    dropping unused vertices.
+    """
+    verts, corners, starts, sizes, uvs = mesh.arrays()
+    if not len(sizes):
+        return
+
+    triangles, triangle_faces = fan_triangles(starts, sizes)
+    drawn = triangle_faces[cache_order(corners[triangles])]
+    _, first = np.unique(drawn, return_index=True)
+    faces = drawn[np.sort(first)]
+    faces = np.concatenate((faces, np.setdiff1d(np.arange(len(sizes)), faces)))  # Faces without triangles
+
+    new_sizes = sizes[faces]
+    new_starts = np.zeros(len(faces), dtype=np.int64)
+    np.cumsum(new_sizes[:-1], out=new_starts[1:])
+    source = np.repeat(starts[faces] - new_starts, new_sizes) + np.arange(len(corners))
+
+    order, remap = fetch_order(corners[source], len(verts))
+    order = order[:len(np.unique(corners))]  # Vertices no face uses are dropped
+    mesh.set_arrays(verts[order], remap[corners[source]], new_starts, uvs[source])
+    mesh.face_materials = np.array(mesh.face_materials, dtype=np.int64)[faces].tolist()
+
+
+def optimize_mesh(mesh):
+    """
+    Weld, drop degenerate faces and reorder a RoomMesh for the vertex cache and fetch.
+
+    Returns:
+    - Number of vertices and of faces removed.
+    """
+    welded = weld_vertices(mesh)
+    removed = remove_degenerate_faces(mesh)
+    optimize_face_order(mesh)
+    return welded, removed
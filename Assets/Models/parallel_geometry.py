@@ -0,0 +1,241 @@
+"""
+Dungeon geometry generated in parallel, one part of the layout per task.
+
+A layout is split into independent parts, per room or per story, and room_geometry's
+`dungeon_meshes` runs on each part in a process pool. Every door and column goes with
+the room it is in, and doorways outside any room go with their story (or together in a
+part of their own). Each part therefore builds exactly the objects it would build as
+part of the whole layout. All parts share the whole layout's transform, and the result
+is reassembled in dungeon_meshes' order, with the same Room_<x>_<y> names:
+
+    python parallel_geometry.py                   # Time every layout in the current folder, per room
+    python parallel_geometry.py --split-stories   # ... per story
+    python parallel_geometry.py --optimize        # ... with welded, cache-ordered meshes
+    python parallel_geometry.py --mesh-cache      # ... rebuilding only changed parts (see mesh_cache.py)
+
+`layout_part_meshes` yields the parts one at a time instead, for exporters that write
+each part before the next is built (see glb_export.py).
+
+The workers only use room_geometry, never bpy. The number of processes defaults to the
+DUNGEON_JOBS environment variable, then one per core.
+"""
+import glob
+import json
+import os
+import sys
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from mesh_cache import MeshCache
+from pipeline_log import StageTimer, flush, get_logger
+from room_geometry import DOORWAY_TYPES, dungeon_matrix, dungeon_meshes, load_assets, room_location
+from room_lookup import TileRoomMap
+
+log = get_logger('parallel_geometry')
+
+# Parts a layout can be split into
+SPLITS = ('room', 'story')
+
+# Tasks per process when there are many small parts, so that no process idles at the end
+TASKS_PER_PROCESS = 4
+
+
+def is_doorway(door):
+    """Whether dungeon_meshes places a doorway for `door`."""
+    return door.get('type') in DOORWAY_TYPES or (door['x'] == 0 and door['y'] == 0)
+
+
+def split_layout(data, split='room'):
+    """
+    Split a layout into parts that dungeon_meshes can build independently.
+
+    Parameters:
+    - data: Layout dict, as read from its JSON file.
+    - split: 'room' for one part per room, 'story' for one part per story.
+
+    Returns:
+    - List of layout dicts, each with the rects, doors and columns of one part. Their
+      transform has to come from the whole layout (see `layout_matrix`).
+    """
+    if split not in SPLITS:
+        raise ValueError(f"Unknown split {split!r}, expected one of {', '.join(SPLITS)}.")
+
+    tile_map = TileRoomMap(data['rects'])
+    parts = {}
+
+    def part(key):
+        if key not in parts:
+            parts[key] = dict(data, rects=[], doors=[], columns=[])
+        return parts[key]
+
+    def room_key(rect):
+        return (rect['x'], rect['y']) if split == 'room' else rect.get('story', 0)
+
+    for rect in data['rects']:
+        part(room_key(rect))['rects'].append(rect)
+
+    for door in data.get('doors', []):
+        rect = tile_map.room_at(door['x'], door['y'])
+        if rect is not None:
+            part(room_key(rect))['doors'].append(door)
+        elif split == 'story':
+            part(door.get('story', 0))['doors'].append(door)
+        else:
+            part('outside')['doors'].append(door)
+
+    # Columns outside any room are never built
+    for column in data.get('columns', []):
+        rect = tile_map.room_at(column['x'], column['y'])
+        if rect is not None:
+            part(room_key(rect))['columns'].append(column)
+
+    return list(parts.values())
+
+
+def layout_matrix(data, scale_factor=1.28):
+    """dungeon_matrix of a whole layout, with the origin dungeon_meshes gives Room_0_0."""
+    tile_map = TileRoomMap(data['rects'])
+    origin = None
+    for rect in data['rects']:
+        if (rect['x'], rect['y']) != (0, 0):
+            continue
+
+        # Rotundas and rooms left to their doorways keep their objects at the world origin
+        origin = room_location(rect)
+        if rect.get('rotunda') or any(
+            is_doorway(door) and tile_map.room_at(door['x'], door['y']) is rect for door in data.get('doors', [])
+        ):
+            origin = (0.0, 0.0, 0.0)
+    return dungeon_matrix(origin, scale_factor=scale_factor)
+
+
+def part_meshes(part, assets, matrix, merge_quads, optimize):
+    """dungeon_meshes of one part, in a worker process."""
+    meshes = dungeon_meshes(part, assets, matrix=matrix, merge_quads=merge_quads, optimize=optimize)
+    flush()
+    return meshes
+
+
+def layout_part_meshes(data, assets=None, split='room', processes=None, scale_factor=1.28,
+                       merge_quads=False, optimize=False, executor=None, cache=None):
+    """
+    Geometry of a dungeon layout, one part at a time, so that a caller can write each part
+    and let it go before the later ones are built. Takes the arguments of
+    parallel_dungeon_meshes.
+
+    Yields:
+    - Dict of object name -> RoomMesh of every part, in the order of split_layout. With a
+      process pool, at most `processes` * TASKS_PER_PROCESS parts are built ahead.
+    """
+    if assets is None:
+        assets = load_assets()
+    processes = processes or int(os.environ.get('DUNGEON_JOBS', 0)) or os.cpu_count() or 1
+
+    parts = split_layout(data, split)
+    matrix = layout_matrix(data, scale_factor)
+    if cache is not None:
+        keys = cache.part_keys(parts, assets, matrix, merge_quads, optimize)
+    else:
+        keys = [None] * len(parts)
+
+    own_executor = executor is None and processes > 1 and len(parts) > 1
+    if own_executor:
+        executor = ProcessPoolExecutor(processes)
+    ahead = processes * TASKS_PER_PROCESS
+    pending = deque()  # (cache key of a part to store, or None; its meshes or their future)
+    rebuilt = 0
+    try:
+        for key, part in zip(keys, parts):
+            meshes = cache.load(key) if key is not None else None
+            if meshes is not None:
+                pending.append((None, meshes))
+                continue
+
+            rebuilt += 1
+            if executor is None:
+                pending.append((key, part_meshes(part, assets, matrix, merge_quads, optimize)))
+            else:
+                pending.append((key, executor.submit(part_meshes, part, assets, matrix, merge_quads, optimize)))
+            while len(pending) > ahead:
+                yield finish_part(pending.popleft(), cache)
+        while pending:
+            yield finish_part(pending.popleft(), cache)
+    finally:
+        if own_executor:
+            executor.shutdown(cancel_futures=True)
+
+    log.debug("Built %s parts, %s of them rebuilt.", len(parts), rebuilt)
+
+
+def finish_part(entry, cache):
+    """Meshes of a pending part of layout_part_meshes, stored in the cache if they are new."""
+    key, meshes = entry
+    if isinstance(meshes, Future):
+        meshes = meshes.result()
+    if key is not None:
+        cache.save(key, meshes)
+    return meshes
+
+
+def parallel_dungeon_meshes(data, assets=None, timer=None, split='room', processes=None, scale_factor=1.28,
+                            merge_quads=False, optimize=False, executor=None, cache=None):
+    """
+    Geometry of a whole dungeon layout, built in parallel. Takes and returns the values of
+    room_geometry.dungeon_meshes.
+
+    Parameters:
+    - split: 'room' or 'story' (see split_layout).
+    - processes: Size of the process pool (default = DUNGEON_JOBS, then one per core). With
+      1 and no `executor`, the parts are built in this process.
+    - executor: Process pool to reuse across layouts (default = a new one for this layout).
+    - cache: MeshCache to read unchanged parts from and store built ones in (default = none).
+    """
+    if timer is None:
+        timer = StageTimer(log, 'geometry')
+
+    built = {}
+    for meshes in layout_part_meshes(
+        data, assets, split, processes, scale_factor, merge_quads, optimize, executor, cache,
+    ):
+        built.update(meshes)
+    timer.lap('parts')
+
+    # Rooms, doorways and columns in the order dungeon_meshes returns them
+    names = [f"Room_{rect['x']}_{rect['y']}" for rect in data['rects']]
+    names += [f"Doorway_{door['x']}_{door['y']}" for door in data.get('doors', [])]
+    names += [f"Column_{column['x']}_{column['y']}" for column in data.get('columns', [])]
+    meshes = {name: built[name] for name in names if name in built}
+    timer.lap('assemble')
+    return meshes
+
+
+def main():
+    split = 'story' if '--split-stories' in sys.argv[1:] else 'room'
+    merge_quads = '--merge-quads' in sys.argv[1:]
+    optimize = '--optimize' in sys.argv[1:]
+    cache = MeshCache() if '--mesh-cache' in sys.argv[1:] else None
+    assets = load_assets()
+    processes = int(os.environ.get('DUNGEON_JOBS', 0)) or os.cpu_count() or 1
+    with ProcessPoolExecutor(processes) as executor:
+        for json_file in sorted(glob.glob('*.json')):
+            timer = StageTimer(log, json_file)
+            with open(json_file, 'r') as f:
+                data = json.load(f)
+            timer.lap('load')
+
+            meshes = parallel_dungeon_meshes(
+                data, assets, timer, split, processes, merge_quads=merge_quads, optimize=optimize, executor=executor,
+                cache=cache,
+            )
+            timer.summary(
+                objects=len(meshes),
+                vertices=sum(len(mesh.verts) for mesh in meshes.values()),
+                faces=sum(len(mesh.faces) for mesh in meshes.values()),
+            )
+    if cache is not None:
+        cache.prune()
+    flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+import logging
+import os
+import sys
+import time
+from contextlib import contextmanager
+from logging.handlers import MemoryHandler
+
+# Verbosity names accepted in DUNGEON_LOG_LEVEL
+LEVELS = {
+    'quiet': logging.WARNING,  # Only warnings and errors
+    'info': logging.INFO,      # One summary line per file
+    'debug': logging.DEBUG,    # Every room, door and column the scripts touch
+}
+
+# Records are held in memory and written in batches; warnings flush immediately
+BUFFER_CAPACITY = 4096
+
+_handler = None
+
+
+def configure(level=None, stream=None):
+    """
+    Set up the shared "dungeon" logger once per process.
+
+    Parameters:
+    - level: 'quiet', 'info' or 'debug'. Defaults to the DUNGEON_LOG_LEVEL environment
+      variable, then 'info'.
+    - stream: Output stream (default = sys.stdout).
+    """
+    global _handler
+
+    level = level or os.environ.get('DUNGEON_LOG_LEVEL', 'info')
+    if level not in LEVELS:
+        raise ValueError(f"Unknown log level {level!r}, expected one of {', '.join(LEVELS)}.")
+
+    root = logging.getLogger('dungeon')
+    root.setLevel(LEVELS[level])
+    root.propagate = False
+
+    if _handler is None:
+        target = logging.StreamHandler(stream or sys.stdout)
+        target.setFormatter(logging.Formatter('%(message)s'))
+        _handler = MemoryHandler(BUFFER_CAPACITY, flushLevel=logging.WARNING, target=target)
+        root.addHandler(_handler)
+
+    return root
+
+
+def get_logger(name):
+    """
+    Logger for one pipeline script, e.g. get_logger('add-stories').
+
+    Use %-style arguments (log.debug("Room at (%s, %s)", x, y)) rather than f-strings so
+    that disabled levels never format their message.
+    """
+    if _handler is None:
+        configure()
+    return logging.getLogger(f'dungeon.{name}')
+
+
+def flush():
+    """Write out any buffered records."""
+    if _handler is not None:
+        _handler.flush()
+
+
+def memory_usage():
+    """
+    Resident memory of the process in bytes, as (current, peak). The peak counts from the
+    last reset_peak_memory on Linux and from the start of the process elsewhere. Either is
+    0 where the platform does not report it (current needs /proc, peak /proc or the
+    resource module).
+    """
+    current = 0
+    try:
+        with open('/proc/self/statm') as f:
+            current = int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        pass
+
+    peak = 0
+    try:
+        with open('/proc/self/status') as f:
+            peak = next(int(line.split()[1]) * 1024 for line in f if line.startswith('VmHWM:'))
+    except (OSError, ValueError, StopIteration):
+        try:
+            import resource
+        except ImportError:  # Windows
+            pass
+        else:
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            peak *= 1 if sys.platform == 'darwin' else 1024  # Bytes on macOS, kilobytes elsewhere
+
+    return current, peak
+
+
+def reset_peak_memory():
+    """
+    Restart the peak of memory_usage from the current resident memory.
+
+    Returns:
+    - False where the platform only keeps the peak of the whole process (anything but Linux).
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        return False
+    return True
+
+
+class StageTimer:
+    """
+    Accumulates wall-clock durations of the named stages of one file.
+
+    Usage:
+        timer = StageTimer(log, filename)
+        with timer.stage('stories'):
+            ...
+        timer.lap('export')  # Time since the previous stage or lap ended
+        timer.summary()
+
+    With `memory`, the summary also has the resident memory at the end, its change over the
+    file and the file's peak.
+    """
+
+    def __init__(self, logger, label, memory=False):
+        self.logger = logger
+        self.label = label
+        self.durations = {}
+        self.memory = memory
+        if memory:
+            self.memory_start = memory_usage()[0]
+            self.file_peak = reset_peak_memory()
+        self.started = self.last = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.last = time.perf_counter()
+            self.durations[name] = self.durations.get(name, 0.0) + self.last - start
+
+    def lap(self, name):
+        """Charge the time since the previous stage or lap ended to `name`."""
+        now = time.perf_counter()
+        self.durations[name] = self.durations.get(name, 0.0) + now - self.last
+        self.last = now
+
+    def summary(self, **counts):
+        """Log one line with every stage's duration and the total, then flush the buffer."""
+        total = time.perf_counter() - self.started
+        parts = [f"{name} {seconds * 1000:.1f} ms" for name, seconds in self.durations.items()]
+        parts += [f"{count} {name}" for name, count in counts.items()]
+        if self.memory:
+            current, peak = memory_usage()
+            if current:
+                parts.append(f"rss {current / 2 ** 20:.0f} MB ({(current - self.memory_start) / 2 ** 20:+.0f} MB)")
+            if peak:
+                # Without a per-file peak, say that it is the process's
+                parts.append(f"{'peak' if self.file_peak else 'process peak'} {peak / 2 ** 20:.0f} MB")
+        self.logger.info("%s: %s, total %.1f ms", self.label, ", ".join(parts), total * 1000)
+        flush()
+        return total
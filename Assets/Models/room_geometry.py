@@ -0,0 +1,1512 @@
+"""
+Blender-free dungeon geometry.
+
+`dungeon_meshes` turns a layout into one RoomMesh per Blender object: every room, every
+doorway outside a room and every column. Coordinates follow convert_json_to_blend.py: one
+unit per tile, z = -story, scaled by 1.28 with the origin of Room_0_0 at the world origin.
+Materials are referred to by name; convert_json_to_blend.py maps them to Blender materials.
+
+Tileset walls and doorways come from FBX files that only Blender can read. Blender runs
+write each imported asset to an .npz sidecar in a .sidecars folder next to its FBX file
+(see Asset), and `load_assets` reads those back, so this module produces the same geometry
+without Blender. The sidecars of the assets in this folder are committed:
+
+    python room_geometry.py                  # Time every layout in the current folder
+    python room_geometry.py --merge-quads    # The same with coplanar quads merged
+    python room_geometry.py --optimize       # ... with welded, cache-ordered meshes
+    python room_geometry.py --share-meshes   # ... counting identical meshes once
+"""
+import glob
+import hashlib
+import itertools
+import json
+import math
+import os
+import sys
+from collections import OrderedDict
+
+import numpy as np
+
+from mesh_optimize import merge_coplanar_quads, optimize_mesh
+from pipeline_log import StageTimer, flush, get_logger
+from room_lookup import TileRoomMap
+from wall_segments import room_segments, room_walls
+
+log = get_logger('room_geometry')
+
+# Names of the materials created per file
+FLOOR_MATERIAL = "FloorMaterial"
+WALL_MATERIAL = "WallMaterial"
+CEILING_MATERIAL = "CeilingMaterial"
+COLUMN_MATERIAL = "ColumnMaterial"
+
+COLUMN_RADIUS = 0.125  # Radius of the hexagonal columns (half the thickness)
+
+# Materials whose textures repeat once per unit, so their quads can be merged
+TILED_MATERIALS = (FLOOR_MATERIAL, WALL_MATERIAL, CEILING_MATERIAL)
+
+# Imported assets, looked up in the current folder
+TILESET_WALL_FBX = "Tileset01-Wall00.fbx"
+DOORWAY_FBX = "doorway.fbx"
+
+# Folder of the asset sidecars, next to the FBX files; Unity does not import folders starting with a dot
+SIDECAR_DIRECTORY = '.sidecars'
+
+# Door types that get a doorway
+DOORWAY_TYPES = [1, 2, 4, 6, 7]
+
+# Corners of bpy.ops.mesh.primitive_plane_add(size=1) in the order of its face
+PLANE_CORNERS = ((-0.5, -0.5), (0.5, -0.5), (0.5, 0.5), (-0.5, 0.5))
+
+# Blender's default UVs for a quad in a newly added UV map
+DEFAULT_QUAD_UVS = ((0.0, 0.0), (1.0, 0.0), (1.0, 1.0), (0.0, 1.0))
+
+# Shapes kept by the template cache (see TemplateCache)
+TEMPLATE_CACHE_SIZE = 256
+
+
+class Asset:
+    """
+    Geometry of an imported FBX asset as arrays: vertices, face corners with their first
+    corner and count per face (see face_arrays), corner UVs, a material index per face, the
+    names of its materials and the scale of the imported object.
+    """
+
+    def __init__(self, verts, corners, starts, sizes, uvs, material_indices, materials, scale):
+        self.verts = verts
+        self.corners = corners
+        self.starts = starts
+        self.sizes = sizes
+        self.uvs = uvs
+        self.material_indices = material_indices
+        self.materials = materials
+        self.scale = scale
+
+    def save(self, path):
+        """Write the asset to an .npz file."""
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        np.savez(
+            path, verts=self.verts, corners=self.corners, starts=self.starts, sizes=self.sizes,
+            uvs=self.uvs, material_indices=self.material_indices,
+            materials=np.array(self.materials, dtype=str), scale=np.array(self.scale),
+        )
+
+    @classmethod
+    def load(cls, path):
+        """Read an asset written by `save`."""
+        with np.load(path) as data:
+            return cls(
+                data['verts'], data['corners'], data['starts'], data['sizes'], data['uvs'],
+                data['material_indices'], data['materials'].tolist(), tuple(data['scale'].tolist()),
+            )
+
+
+def sidecar_path(fbx_path):
+    """Path of the .npz sidecar of an FBX file."""
+    directory, filename = os.path.split(fbx_path)
+    return os.path.join(directory, SIDECAR_DIRECTORY, os.path.splitext(filename)[0] + '.npz')
+
+
+def load_assets(directory='.'):
+    """
+    Assets from the sidecars of TILESET_WALL_FBX and DOORWAY_FBX in `directory`. An FBX
+    file without its sidecar raises FileNotFoundError rather than silently building the
+    dungeon without that asset.
+
+    Returns:
+    - Dict with 'wall' and 'doorway', each an Asset, or None if the folder has no such FBX
+      file (Blender runs then do without it too).
+    """
+    assets = {}
+    for key, filename in (('wall', TILESET_WALL_FBX), ('doorway', DOORWAY_FBX)):
+        fbx_path = os.path.join(directory, filename)
+        path = sidecar_path(fbx_path)
+        if os.path.exists(path):
+            assets[key] = Asset.load(path)
+        elif os.path.exists(fbx_path):
+            raise FileNotFoundError(
+                f"{path} not found. Only Blender can read {filename}; run "
+                f"`blender -b -P convert_json_to_blend.py` in {os.path.abspath(directory)} once to write it."
+            )
+        else:
+            assets[key] = None
+    return assets
+
+
+class RoomMesh:
+    """
+    Geometry of one object (a room, a column or a doorway outside any room), collected as
+    plain vertex, face, UV and material arrays.
+
+    Pieces are added in layout coordinates. `location` is the origin the joined room object
+    used to get from its first merged part; the dungeon transform moves Room_0_0's to the
+    world origin. Materials are names (see FLOOR_MATERIAL and Asset.materials).
+    """
+
+    def __init__(self, location=(0.0, 0.0, 0.0)):
+        self.location = location
+        self.verts = []
+        self.faces = []
+        self.uvs = []  # One (u, v) per face corner, in face order
+        self.face_materials = []
+        self.materials = []
+
+    def add_material(self, material):
+        """Slot index of `material`, adding a slot the first time it is used."""
+        if material not in self.materials:
+            self.materials.append(material)
+        return self.materials.index(material)
+
+    def add(self, verts, faces, uvs, material):
+        """
+        Add one piece of geometry.
+
+        Parameters:
+        - verts: World-space (x, y, z) vertices of the piece.
+        - faces: Tuples of indices into `verts`.
+        - uvs: (u, v) of every face corner, in the order of `faces`.
+        - material: Material of every face of the piece.
+        """
+        start = len(self.verts)
+        self.verts.extend(verts)
+        self.faces.extend(tuple(start + i for i in face) for face in faces)
+        self.uvs.extend(uvs)
+        self.face_materials.extend([self.add_material(material)] * len(faces))
+
+    def add_plane(self, location, width, height, material, orientation='floor', flip=False,
+                  flip_uv=True, uv_offset_x=0.0, uv_offset_y=0.0):
+        """
+        Add the equivalent of a scaled primitive_plane_add plane with add_uvs applied.
+
+        Parameters:
+        - location: World position of the plane's center.
+        - width, height: Plane size along its local X and Y axes.
+        - material: Material of the plane.
+        - orientation: 'floor' (horizontal), 'x' (wall along X, rotated 90 degrees about X)
+          or 'y' (wall along Y, additionally rotated 90 degrees about Z).
+        - flip: Reverse the winding, as flip_normals did.
+        - flip_uv, uv_offset_x, uv_offset_y: As in add_uvs.
+        """
+        local = [(corner_x * width, corner_y * height) for corner_x, corner_y in PLANE_CORNERS]
+        uvs = [planar_uv(local_x, local_y, location, flip_uv, uv_offset_x, uv_offset_y) for local_x, local_y in local]
+
+        x, y, z = location
+        if orientation == 'x':
+            verts = [(x + local_x, y, z + local_y) for local_x, local_y in local]
+        elif orientation == 'y':
+            verts = [(x, y + local_x, z + local_y) for local_x, local_y in local]
+        else:
+            verts = [(x + local_x, y + local_y, z) for local_x, local_y in local]
+
+        face = (0, 1, 2, 3)
+        if flip:
+            face, uvs = flipped(face), flipped(uvs)
+        self.add(verts, [face], uvs, material)
+
+    def add_asset(self, asset, matrix):
+        """
+        Add a copy of an imported asset placed by `matrix`, as joining an object with that
+        transform into the room would.
+
+        Parameters:
+        - asset: Asset to copy.
+        - matrix: 4x4 object transform of the copy (see placement_matrix).
+        """
+        verts = asset.verts @ matrix[:3, :3].T + matrix[:3, 3]
+        corners, uvs = asset.corners, asset.uvs
+
+        # A mirroring transform turns the faces inside out unless their winding is reversed
+        if np.linalg.det(matrix[:3, :3]) < 0:
+            order = flip_corners(asset.starts, asset.sizes, np.ones(len(asset.sizes), dtype=bool))
+            corners, uvs = corners[order], uvs[order]
+
+        slots = [self.add_material(material) for material in asset.materials] or [self.add_material(None)]
+        self.faces.extend(split_faces(corners + len(self.verts), asset.starts))
+        self.verts.extend(map(tuple, verts.tolist()))
+        self.uvs.extend(map(tuple, uvs.tolist()))
+        self.face_materials.extend(np.array(slots)[asset.material_indices].tolist())
+
+    def add_template(self, template, offset):
+        """
+        Add a copy of a Template moved by `offset` (an (x, y, z) translation).
+        """
+        ox, oy, oz = offset
+        start = len(self.verts)
+        self.verts.extend([(x + ox, y + oy, z + oz) for x, y, z in template.verts])
+        self.faces.extend([tuple([start + i for i in face]) for face in template.faces])
+        if template.uv_offsets is None:
+            self.uvs.extend(template.uvs)
+        else:
+            self.uvs.extend([
+                (u + du_x * ox + du_y * oy + du_z * oz, v + dv_x * ox + dv_y * oy + dv_z * oz)
+                for (u, v), (du_x, du_y, du_z, dv_x, dv_y, dv_z) in zip(template.uvs, template.uv_offsets)
+            ])
+        slots = [self.add_material(material) for material in template.materials]
+        self.face_materials.extend([slots[i] for i in template.face_materials])
+
+    def arrays(self):
+        """
+        Vertices, face corners (see face_arrays) and corner UVs as NumPy arrays, for the
+        kernels that rework a whole room at once.
+        """
+        corners, starts, sizes = face_arrays(self.faces)
+        verts = np.array(self.verts, dtype=np.float64).reshape(-1, 3)
+        uvs = np.array(self.uvs, dtype=np.float64).reshape(-1, 2)
+        return verts, corners, starts, sizes, uvs
+
+    def set_arrays(self, verts, corners, starts, uvs):
+        """
+        Replace the geometry with arrays laid out like those of `arrays`. Callers that change
+        the number of faces also replace `face_materials`.
+        """
+        self.verts = list(map(tuple, verts.tolist()))
+        self.faces = split_faces(corners, starts)
+        self.uvs = list(map(tuple, uvs.tolist()))
+
+    def transform(self, matrix):
+        """Apply a 4x4 matrix (see dungeon_matrix) to every vertex."""
+        verts = np.array(self.verts, dtype=np.float64).reshape(-1, 3)
+        self.verts = list(map(tuple, (verts @ matrix[:3, :3].T + matrix[:3, 3]).tolist()))
+
+    def buffers(self):
+        """
+        The mesh as flat NumPy buffers, in the layout Blender's foreach_set takes.
+
+        Returns:
+        - Dict with `vertices` (N x 3 float32), `corners` (vertex index of every face corner,
+          int32), `face_starts` and `face_sizes` (first corner and corner count of every face,
+          int32), `uvs` (one row per corner, float32), `material_ids` (int32 per face) and
+          `materials` (material names by ID).
+        """
+        verts, corners, starts, sizes, uvs = self.arrays()
+        return {
+            'vertices': verts.astype(np.float32),
+            'corners': corners.astype(np.int32),
+            'face_starts': starts.astype(np.int32),
+            'face_sizes': sizes.astype(np.int32),
+            'uvs': uvs.astype(np.float32),
+            'material_ids': np.array(self.face_materials, dtype=np.int32),
+            'materials': list(self.materials),
+        }
+
+def planar_uv(local_x, local_y, location, flip_uv=True, uv_offset_x=0.0, uv_offset_y=0.0):
+    """UV that add_uvs gives a local-space vertex of an object placed at `location`."""
+    u = local_x - location[0] + uv_offset_x
+    v = local_y - location[1] + uv_offset_y
+    return (1.0 - u if flip_uv else u, v)
+
+
+def flipped(corners):
+    """Corners of a face with its winding reversed, starting from the same corner."""
+    return (corners[0],) + tuple(reversed(corners[1:]))
+
+
+def face_arrays(faces):
+    """
+    Flat corner vertex indices, first corner and corner count of every face, as NumPy arrays.
+    """
+    sizes = np.fromiter((len(face) for face in faces), dtype=np.int64, count=len(faces))
+    starts = np.zeros(len(faces), dtype=np.int64)
+    np.cumsum(sizes[:-1], out=starts[1:])
+    corners = np.fromiter(itertools.chain.from_iterable(faces), dtype=np.int64, count=int(sizes.sum()))
+    return corners, starts, sizes
+
+
+def split_faces(corners, starts):
+    """Faces as tuples of vertex indices, the inverse of face_arrays."""
+    if not len(starts):
+        return []
+    return [tuple(face.tolist()) for face in np.split(corners, starts[1:])]
+
+
+def corner_offsets(starts, sizes):
+    """Face of every corner and the corner's position within that face."""
+    face_of = np.repeat(np.arange(len(sizes)), sizes)
+    return face_of, np.arange(len(face_of)) - starts[face_of]
+
+
+def face_normals(verts, corners, starts, sizes):
+    """Unnormalized Newell normals of all faces, pointing the way Blender's polygon normals do."""
+    if not len(sizes):
+        return np.zeros((0, 3))
+
+    # Pair every corner with the next one of its face
+    face_of, offsets = corner_offsets(starts, sizes)
+    following = corners[starts[face_of] + (offsets + 1) % sizes[face_of]]
+    difference = verts[corners] - verts[following]
+    total = verts[corners] + verts[following]
+    terms = np.column_stack((
+        difference[:, 1] * total[:, 2],
+        difference[:, 2] * total[:, 0],
+        difference[:, 0] * total[:, 1],
+    ))
+    return np.add.reduceat(terms, starts)
+
+
+def flip_corners(starts, sizes, flip):
+    """
+    Corner order that reverses the winding of the faces selected by the boolean array `flip`,
+    keeping their first corner as polygon.flip() does.
+    """
+    face_of, offsets = corner_offsets(starts, sizes)
+    reversed_offsets = (sizes[face_of] - offsets) % sizes[face_of]
+    return starts[face_of] + np.where(flip[face_of], reversed_offsets, offsets)
+
+
+def pyramid_uvs(verts, faces, texture_unit_size=1):
+    """
+    UVs that add_uvs_pyramid gives a mesh: X/Z for vertical faces, X/Y for the others.
+    """
+    verts = np.array(verts, dtype=np.float64)
+    corners, starts, sizes = face_arrays(faces)
+    vertical = np.repeat(face_normals(verts, corners, starts, sizes)[:, 2] == 0, sizes)
+    points = verts[corners]
+    uvs = np.column_stack((points[:, 0], np.where(vertical, points[:, 2], points[:, 1]))) / texture_unit_size
+    return list(map(tuple, uvs.tolist()))
+
+
+def placement_matrix(location, angle, scale=(1.0, 1.0, 1.0)):
+    """4x4 transform of an object at `location`, rotated `angle` radians about Z and scaled."""
+    cos, sin = math.cos(angle), math.sin(angle)
+    return np.array([
+        [cos * scale[0], -sin * scale[1], 0.0, location[0]],
+        [sin * scale[0], cos * scale[1], 0.0, location[1]],
+        [0.0, 0.0, scale[2], location[2]],
+        [0.0, 0.0, 0.0, 1.0],
+    ])
+
+
+class Template:
+    """
+    Geometry of a shape built at the origin, to be copied anywhere by RoomMesh.add_template.
+
+    UVs that follow the world position (like planar floor and ceiling UVs) move with the
+    copy: `uv_offsets` holds the change of every corner's (u, v) per unit of X, Y and Z
+    offset as (du/dx, du/dy, du/dz, dv/dx, dv/dy, dv/dz), or is None if no UV moves.
+    Everything is kept as tuples, which copy faster than small NumPy arrays.
+    """
+
+    # Offsets the shape is built at to find out how its UVs move; Z goes down, as stories do
+    PROBES = ((1.0, 0.0, 0.0), (0.0, 1.0, 0.0), (0.0, 0.0, -1.0))
+
+    def __init__(self, build):
+        """
+        Parameters:
+        - build: Function (mesh, x, y, z) adding the shape placed at (x, y, z) to a RoomMesh.
+        """
+        origin = RoomMesh()
+        build(origin, 0.0, 0.0, 0.0)
+        self.verts = origin.verts
+        self.faces = origin.faces
+        self.uvs = origin.uvs
+        self.face_materials = origin.face_materials
+        self.materials = origin.materials
+
+        verts = np.array(self.verts, dtype=np.float64).reshape(-1, 3)
+        uvs = np.array(self.uvs, dtype=np.float64).reshape(-1, 2)
+        uv_offsets = np.zeros((len(uvs), 2, 3))
+        for axis, probe in enumerate(self.PROBES):
+            moved = RoomMesh()
+            build(moved, *probe)
+            if not np.allclose(np.array(moved.verts).reshape(-1, 3) - probe, verts):
+                raise ValueError("Template shape changes with its position.")
+            uv_offsets[:, :, axis] = (np.array(moved.uvs).reshape(-1, 2) - uvs) / probe[axis]
+
+        uv_offsets = np.round(uv_offsets, 9) + 0.0  # Exact unit steps for planar UVs
+        self.uv_offsets = list(map(tuple, uv_offsets.reshape(-1, 6).tolist())) if uv_offsets.any() else None
+
+
+class TemplateCache:
+    """
+    Least recently used Templates by shape key. Rooms repeat the same few sizes, so their
+    rotunda quadrants, vaults and columns are built once and copied after that.
+    """
+
+    def __init__(self, size=TEMPLATE_CACHE_SIZE):
+        self.size = size
+        self.templates = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def template(self, key, build):
+        """Template for `key`, made with `build` (see Template) if it is not cached."""
+        template = self.templates.get(key)
+        if template is None:
+            self.misses += 1
+            template = self.templates[key] = Template(build)
+            if len(self.templates) > self.size:
+                self.templates.popitem(last=False)
+        else:
+            self.hits += 1
+            self.templates.move_to_end(key)
+        return template
+
+
+# Templates shared by every layout of the session
+TEMPLATES = TemplateCache()
+
+
+def add_template(mesh, key, offset, build):
+    """
+    Add the shape `build` makes (see Template) to `mesh` at `offset`, from TEMPLATES.
+
+    `key` must hold every parameter of the shape except its position.
+    """
+    mesh.add_template(TEMPLATES.template(key, build), offset)
+
+
+def create_floor(mesh, x, y, w, h, floor_material, story=0):
+    """Add a floor to `mesh` and adjust its Z-position based on the story."""
+    z_offset = -abs(story)  # Move down based on the story
+    mesh.add_plane((x + w / 2, y + h / 2, z_offset), w, h, floor_material)
+
+def create_circle_quadrant(mesh, x, y, radius, quadrant=1, floor_material=None, wall_material=None, levels=1, story=0):
+    """
+    Add a circular quadrant floor with its walls to `mesh`.
+
+    Parameters:
+    - mesh: RoomMesh of the room.
+    - x, y: Bottom-left position.
+    - radius: Radius of the quadrant.
+    - quadrant: Quadrant number (1-4).
+    - floor_material: Material for the floor.
+    - wall_material: Material for the walls.
+    - levels: Number of vertical levels for walls.
+    - story: The story (floor level) of the quadrant.
+    """
+    segment_length = 1.0
+    arc_length = (math.pi / 2) * radius
+    segments = max(1, int(arc_length / segment_length))
+
+    angle_offset = math.pi / 2
+    angle_start = (quadrant - 1) * angle_offset
+    angle_end = quadrant * angle_offset
+
+    # Adjust Z-offset based on story
+    z_offset = -abs(story)
+
+    # Create the floor of the quadrant
+    verts = [(x, y, z_offset)]
+    verts += [(x + math.cos(angle_start + angle_offset * i / segments) * radius, 
+               y + math.sin(angle_start + angle_offset * i / segments) * radius, z_offset) 
+              for i in range(segments + 1)]
+    mesh.add(verts, [tuple(range(len(verts)))], [planar_uv(vx, vy, (0, 0, 0)) for vx, vy, _ in verts], floor_material)
+
+    # Create the walls for the quadrant
+    for i in range(1, len(verts) - 1):
+        start_vert = verts[i]
+        end_vert = verts[i + 1]
+        create_vertical_face(mesh, start_vert, end_vert, wall_material, levels, story)
+
+def create_vertical_face(mesh, start_vert, end_vert, wall_material=None, levels=1, story=0):
+    """
+    Adds vertical faces (walls) with height adjustment based on story and levels to `mesh`.
+
+    Parameters:
+    - mesh: RoomMesh of the room.
+    - start_vert: Starting vertex of the wall.
+    - end_vert: Ending vertex of the wall.
+    - wall_material: Material to apply to the walls.
+    - levels: Number of vertical levels to create (default = 1).
+    - story: The story (floor level) of the walls, used to adjust Z-position.
+    """
+    width = math.sqrt((end_vert[0] - start_vert[0]) ** 2 + (end_vert[1] - start_vert[1]) ** 2)
+    height = 0.5  # Base height for UV scaling
+
+    # Default quad UVs stretched along the wall, as add_rotunda_uvs did
+    uvs = [(u * width, v / height * 0.5) for u, v in DEFAULT_QUAD_UVS]
+
+    for level in range(levels + 1):
+        z_offset = -abs(story) + level  # Adjust Z-position based on story and level
+
+        # Define vertices for the wall
+        verts = [
+            (start_vert[0], start_vert[1], z_offset),
+            (end_vert[0], end_vert[1], z_offset),
+            (end_vert[0], end_vert[1], z_offset + 1),
+            (start_vert[0], start_vert[1], z_offset + 1)
+        ]
+
+        # Rotunda walls face inwards
+        mesh.add(verts, [flipped((0, 1, 2, 3))], flipped(uvs), wall_material)
+
+def create_rotunda_quadrants(mesh, rect, floor_material=None, wall_material=None):
+    """
+    Add a rotunda's circular quadrant floors and walls to `mesh`.
+
+    Parameters:
+    - mesh: RoomMesh of the room.
+    - rect: Rect dictionary containing position (x, y), size (w, h), and story.
+    - floor_material: Material for floors.
+    - wall_material: Material for walls.
+    """
+    x, y, w, h = rect['x'], rect['y'], rect['w'], rect['h']
+    radius = (min(w, h) - 1) / 2
+    offset = h / 2 - 0.5
+    story = rect.get('story', 0)
+    levels = rect.get('ceiling', 1)  # Default to 1 level if not specified
+
+    # Create the quadrants
+    for quadrant, center_x, center_y in (
+        (1, x + w - offset, y + h - offset),
+        (2, x + offset, y + h - offset),
+        (3, x + offset, y + offset),
+        (4, x + w - offset, y + offset),
+    ):
+        add_template(
+            mesh, ('circle_quadrant', radius, quadrant, floor_material, wall_material, levels),
+            (center_x, center_y, -abs(story)),
+            lambda part, px, py, pz: create_circle_quadrant(
+                part, px, py, radius, quadrant=quadrant,
+                floor_material=floor_material, wall_material=wall_material, levels=levels, story=-pz
+            ),
+        )
+
+def create_rotunda_plus(mesh, x, y, w, h, floor_material, story=0):
+    """
+    Adds a plus-shaped floor layout for the rotunda to `mesh`, adjusting for the story level.
+
+    Parameters:
+    - mesh: RoomMesh of the room.
+    - x, y: Bottom-left position of the rotunda.
+    - w, h: Width and height of the rotunda.
+    - floor_material: Material to apply to the floor.
+    - story: The story (floor level) of the rotunda.
+    """
+    center_x = x + w / 2
+    center_y = y + h / 2
+    z_offset = -abs(story)  # Adjust Z-position for the story
+
+    # Create horizontal arms of the plus
+    for i in range(w):
+        mesh.add_plane((x + i + 0.5, center_y, z_offset), 1, 1, floor_material)
+
+    # Create vertical arms of the plus
+    for j in range(h):
+        mesh.add_plane((center_x, y + j + 0.5, z_offset), 1, 1, floor_material)
+
+def create_wall(mesh, x, y, dir_x, dir_y, rect_x, rect_y, rect_w, rect_h, wall_material, story=0, level=0, tileset_wall=None):
+    """
+    Add a wall to `mesh`, replacing it with an imported model if the room is 1xN, Nx1, or 1x1.
+
+    Imported walls keep the materials of the asset, procedural walls use `wall_material`.
+
+    Parameters:
+    - mesh: RoomMesh of the room.
+    - x, y: Wall position.
+    - dir_x, dir_y: Wall direction.
+    - rect_x, rect_y, rect_w, rect_h: Room dimensions.
+    - wall_material: Wall material.
+    - story: Floor level.
+    - level: Wall height level.
+    - tileset_wall: Asset of the tileset wall, or None to create 1xN walls procedurally too.
+    """
+    height_offset = -abs(story) + level  # Adjust Z-position
+
+    # Detect all single-width and single-height rooms, including 1x1
+    is_1xN = rect_w == 1 or rect_h == 1  
+
+    if is_1xN:
+        if tileset_wall is not None:
+            # Set correct position to match manual wall placement
+            if dir_x == 1 and dir_y == 0:  # West-facing
+                location = (x + 0.5, y, height_offset)
+                angle = math.radians(0)
+                if y == rect_y:
+                    angle = math.radians(180)
+            elif dir_x == 0 and dir_y == 1:  # North-facing
+                location = (x, y + 0.5, height_offset)
+                angle = math.radians(90)
+                if x != rect_x:
+                    angle = -math.radians(90)
+            elif dir_x == -1 and dir_y == 0:  # East-facing
+                location = (x - 0.5, y, height_offset)
+                angle = 0
+            elif dir_x == 0 and dir_y == -1:  # South-facing
+                location = (x, y - 0.5, height_offset)
+                angle = -math.radians(90)
+
+            mesh.add_asset(tileset_wall, placement_matrix(location, angle, tileset_wall.scale))
+            return
+
+        log.warning("%s not found. Falling back to default wall creation.", TILESET_WALL_FBX)
+
+    # Regular walls (Procedural generation)
+    z = 0.5 + height_offset
+    if dir_x == 1 and dir_y == 0:  # West-facing wall
+        flip = y == rect_y  # If this is the westmost side
+        mesh.add_plane((x + 0.5, y, z), 1, 1, wall_material, orientation='x',
+                       flip=flip, flip_uv=not flip, uv_offset_x=-0.5)
+    elif dir_x == 0 and dir_y == 1:  # North-facing wall
+        flip = x != rect_x  # If this is not the leftmost side
+        mesh.add_plane((x, y + 0.5, z), 1, 1, wall_material, orientation='y',
+                       flip=flip, flip_uv=not flip)
+    elif dir_x == -1 and dir_y == 0:  # East-facing wall
+        mesh.add_plane((x - 0.5, y, z), 1, 1, wall_material, orientation='x', flip_uv=False)
+    elif dir_x == 0 and dir_y == -1:  # South-facing wall
+        mesh.add_plane((x, y - 0.5, z), 1, 1, wall_material, orientation='y', flip_uv=False)
+
+def create_wall_segment(mesh, segment, rect_x, rect_y, wall_material, story=0):
+    """
+    Add one procedural wall plane for a straight run of walls (see wall_segments.py) to `mesh`.
+
+    The plane is stretched over the segment's length and level range. Its UVs repeat once
+    per unit with the same phase as a row of create_wall planes, so the texture looks the
+    same while the room gets two triangles per run instead of per unit wall.
+
+    Parameters:
+    - mesh: RoomMesh of the room.
+    - segment: Wall segment with `x`, `y`, `dir`, `length` and `levels`.
+    - rect_x, rect_y: Room position.
+    - wall_material: Wall material.
+    - story: Floor level.
+    """
+    x, y = segment['x'], segment['y']
+    dir_x, dir_y = segment['dir']['x'], segment['dir']['y']
+    length = segment['length']
+    low, high = segment['levels']
+    levels = high - low + 1
+    z = levels / 2 - abs(story) + low  # Adjust Z-position
+
+    if dir_x == 1 and dir_y == 0:  # West-facing wall
+        flip = y == rect_y  # If this is the westmost side
+        mesh.add_plane((x + length / 2, y, z), length, levels, wall_material, orientation='x',
+                       flip=flip, flip_uv=not flip, uv_offset_x=-0.5, uv_offset_y=(levels - 1) / 2)
+    elif dir_x == 0 and dir_y == 1:  # North-facing wall
+        flip = x != rect_x  # If this is not the leftmost side
+        mesh.add_plane((x, y + length / 2, z), length, levels, wall_material, orientation='y',
+                       flip=flip, flip_uv=not flip, uv_offset_x=(length - 1) / 2, uv_offset_y=(levels + length) / 2)
+    elif dir_x == -1 and dir_y == 0:  # East-facing wall
+        mesh.add_plane((x - length / 2, y, z), length, levels, wall_material, orientation='x',
+                       flip_uv=False, uv_offset_x=0, uv_offset_y=(levels - 1) / 2)
+    elif dir_x == 0 and dir_y == -1:  # South-facing wall
+        mesh.add_plane((x, y - length / 2, z), length, levels, wall_material, orientation='y',
+                       flip_uv=False, uv_offset_x=(length - 1) / 2, uv_offset_y=(levels - length) / 2)
+    else:
+        log.warning("Skipped wall segment at (%s, %s) with unknown direction (%s, %s).", x, y, dir_x, dir_y)
+
+def create_doorway(mesh, x, y, dir_x, dir_y, doorway, story=0):
+    """
+    Places the doorway asset at (x, y).
+
+    Parameters:
+    - mesh: RoomMesh of the room the doorway belongs to, or None to create a separate one.
+    - x, y: Position of the doorway.
+    - dir_x, dir_y: Direction of the wall the doorway is part of.
+    - doorway: Asset of the doorway, or None if it is not available.
+    - story: The story (floor level) of the doorway, used to adjust the Z offset.
+
+    Returns:
+    - The separate doorway RoomMesh if one was created, otherwise None.
+    """
+    if doorway is None:
+        log.error("%s not found.", DOORWAY_FBX)
+        return None
+
+    # Calculate Z offset based on the story level
+    z_offset = -abs(story)
+    location = (x + 0.5, y + 0.5, z_offset)  # Adjust as needed
+
+    # Rotate based on direction
+    angle = 0
+    if dir_x == 1:  # West-facing wall
+        angle = math.radians(180)
+    elif dir_x == -1:  # East-facing wall
+        angle = 0
+    elif dir_y == 1:  # North-facing wall
+        angle = math.radians(90)
+    elif dir_y == -1:  # South-facing wall
+        angle = math.radians(-90)
+
+    # Doorways without a room get their own object, with its origin at the doorway
+    separate = None
+    if mesh is None:
+        mesh = separate = RoomMesh(location)
+    mesh.add_asset(doorway, placement_matrix(location, angle, doorway.scale))
+    return separate
+
+
+def keep_cardinal_walls(rect):
+    cardinal_walls = []
+    x, y, w, h = rect['x'], rect['y'], rect['w'], rect['h']
+    cardinal_positions = [
+        (x + w // 2, y),
+        (x + w // 2, y + h),
+        (x, y + h // 2),
+        (x + w, y + h // 2)
+    ]
+
+    for wall in room_walls(rect):
+        wall_pos = (wall['x'], wall['y'])
+        if wall_pos in cardinal_positions:
+            cardinal_walls.append(wall)
+
+    return cardinal_walls
+
+def create_truncated_pyramid_ceiling(mesh, x, y, w, h, room_ceiling_height, ceiling_material, top_scale=0.5, vaulted_ceiling_height=0.5, story=0):
+    """
+    Adds a truncated pyramid ceiling with a fixed height to minimize texture stretching to `mesh`.
+    
+    Parameters:
+    - mesh: RoomMesh of the room.
+    - x, y: Position of the room's bottom-left corner.
+    - w, h: Dimensions of the room.
+    - room_ceiling_height: Height of the room's ceiling (base of the pyramid).
+    - ceiling_material: Material to apply to the pyramid.
+    - top_scale: Ratio of the top's width/height to the base's width/height (default = 0.5).
+    - vaulted_ceiling_height: Fixed height for all vaulted ceilings (default = 0.5).
+    - story: The story (floor level) of the room, used to adjust the Z offset.
+    """
+    # Adjust vaulted_ceiling_height if either w or h is 1
+    if w == 1 or h == 1:
+        vaulted_ceiling_height = 0.25
+
+    # Calculate Z-offset based on story
+    z_offset = -abs(story)
+
+    # Base vertices (matching room's dimensions)
+    base_verts = [
+        (x, y, room_ceiling_height + z_offset),               # Bottom-left
+        (x + w, y, room_ceiling_height + z_offset),           # Bottom-right
+        (x + w, y + h, room_ceiling_height + z_offset),       # Top-right
+        (x, y + h, room_ceiling_height + z_offset)            # Top-left
+    ]
+    
+    # Top vertices (scaled down from base, fixed height for the top)
+    top_verts = [
+        (x + w * (1 - top_scale) / 2, y + h * (1 - top_scale) / 2, room_ceiling_height + vaulted_ceiling_height + z_offset),  # Bottom-left
+        (x + w * (1 + top_scale) / 2, y + h * (1 - top_scale) / 2, room_ceiling_height + vaulted_ceiling_height + z_offset),  # Bottom-right
+        (x + w * (1 + top_scale) / 2, y + h * (1 + top_scale) / 2, room_ceiling_height + vaulted_ceiling_height + z_offset),  # Top-right
+        (x + w * (1 - top_scale) / 2, y + h * (1 + top_scale) / 2, room_ceiling_height + vaulted_ceiling_height + z_offset)   # Top-left
+    ]
+    
+    # Combine vertices
+    verts = base_verts + top_verts
+    
+    # Faces (connect base and top vertices, clockwise for inward normals)
+    faces = [
+        (0, 4, 5, 1),  # Bottom-right face
+        (1, 5, 6, 2),  # Top-right face
+        (2, 6, 7, 3),  # Top-left face
+        (3, 7, 4, 0),  # Bottom-left face
+        (7, 6, 5, 4)   # Top face (counter-clockwise for inward normals)
+    ]
+    
+    # Add the faces with consistent UV scaling
+    mesh.add(verts, faces, pyramid_uvs(verts, faces), ceiling_material)
+
+def create_ceiling(mesh, x, y, w, h, ceiling_height, ceiling_material, story=0):
+    """Add a downward-facing ceiling to `mesh` and adjust its Z-position based on the story."""
+    z_offset = -abs(story) + ceiling_height
+    mesh.add_plane((x + w / 2, y + h / 2, z_offset), w, h, ceiling_material, flip=True)
+
+def create_circle_quadrant_ceiling(mesh, x, y, radius, quadrant=1, ceiling_material=None, ceiling_height=1):
+    segment_length = 1.0
+    arc_length = (math.pi / 2) * radius
+    segments = max(1, int(arc_length / segment_length))
+
+    angle_offset = math.pi / 2
+    angle_start = (quadrant - 1) * angle_offset
+    angle_end = quadrant * angle_offset
+
+    verts = [(x, y, ceiling_height)]
+    verts += [(x + math.cos(angle_start + angle_offset * i / segments) * radius, 
+               y + math.sin(angle_start + angle_offset * i / segments) * radius, ceiling_height) 
+              for i in range(segments + 1)]
+    mesh.add(verts, [tuple(range(len(verts)))], [planar_uv(vx, vy, (0, 0, 0)) for vx, vy, _ in verts], ceiling_material)
+
+def create_truncated_circle_quadrant_ceiling(mesh, x, y, radius, quadrant=1, ceiling_material=None, room_ceiling_height=2.5, fixed_height=1.0):
+    """
+    Adds a truncated pyramid ceiling for a circle quadrant with inward-facing normals and specialized handling for 3x3, 4x4, and 5x5 rooms.
+    
+    Parameters:
+    - mesh: RoomMesh of the room.
+    - x, y: The origin of the quadrant.
+    - radius: The radius of the quadrant base.
+    - quadrant: Specifies which quadrant of the circle (1 to 4).
+    - ceiling_material: The material to apply.
+    - room_ceiling_height: Height of the room's ceiling (base of the pyramid).
+    - fixed_height: Fixed height for the top of the pyramid (default = 1.0).
+    """
+    segment_length = 1.0
+    arc_length = (math.pi / 2) * radius
+    segments = max(1, int(arc_length / segment_length))
+
+    angle_offset = math.pi / 2
+    angle_start = (quadrant - 1) * angle_offset
+    angle_end = quadrant * angle_offset
+
+    # Determine room size handling
+    is_small_room = radius == 1.0  # 3x3 rooms
+    #is_medium_room = radius == 2.0  # 4x4 rooms
+    is_large_room = radius >= 3.0  # 5x5 rooms
+
+    # Create base vertices (curve of the quadrant)
+    base_verts = [(x, y, room_ceiling_height)]  # Center point at the base
+    base_verts += [
+        (x + math.cos(angle_start + angle_offset * i / segments) * radius,
+         y + math.sin(angle_start + angle_offset * i / segments) * radius,
+         room_ceiling_height)
+        for i in range(segments + 1)
+    ]
+
+    # Create top vertices
+    if is_small_room:
+        # For 3x3 rooms, create a flat 1x1 square in the center
+        top_verts = [
+            (x + 0.5, y + 0.5, room_ceiling_height + fixed_height),  # Center of the flat square
+            (x + 0.5 + math.cos(angle_start) * 0.5, y + 0.5 + math.sin(angle_start) * 0.5, room_ceiling_height + fixed_height),
+            (x + 0.5 + math.cos(angle_end) * 0.5, y + 0.5 + math.sin(angle_end) * 0.5, room_ceiling_height + fixed_height)
+        ]
+    elif is_large_room:
+        # For 5x5 rooms, create a flat 4x4 square in the center
+        truncation_factor = 4 / (2 * radius)  # Scale down to fit a 4x4 square
+        top_verts = [(x, y, room_ceiling_height + fixed_height)]  # Center point at the top
+        top_verts += [
+            (x + math.cos(angle_start + angle_offset * i / segments) * radius * truncation_factor,
+             y + math.sin(angle_start + angle_offset * i / segments) * radius * truncation_factor,
+             room_ceiling_height + fixed_height)
+            for i in range(segments + 1)
+        ]
+    else:
+        # For 4x4 rooms (and others not explicitly handled), use the default technique
+        top_verts = [(x, y, room_ceiling_height + fixed_height)]  # Center point at the top
+        top_verts += [
+            (x + math.cos(angle_start + angle_offset * i / segments) * radius * 0.5,
+             y + math.sin(angle_start + angle_offset * i / segments) * radius * 0.5,
+             room_ceiling_height + fixed_height)
+            for i in range(segments + 1)
+        ]
+
+    # Combine vertices
+    verts = base_verts + top_verts
+
+    # Create faces
+    faces = []
+    base_offset = 0
+    top_offset = len(base_verts)
+
+    if is_small_room:
+        # Raise the center vertex
+        verts[base_offset] = (verts[base_offset][0],  # x-coordinate (unchanged)
+                              verts[base_offset][1],  # y-coordinate (unchanged)
+                              verts[base_offset][2] + fixed_height)  # z-coordinate (raised)
+
+        # For 3x3 rooms, connect the base to the small center square
+        for i in range(1, len(base_verts) - 1):
+            faces.append((i + 1, i, base_offset))  # Reverse winding order
+    else:
+        # For larger rooms, connect the base to the full top
+        for i in range(1, len(base_verts) - 1):
+            faces.append((top_offset + i + 1, top_offset + i, top_offset))  # Top triangle
+            faces.append((top_offset + i + 1, i + 1, i, top_offset + i))   # Side quadrilateral
+
+    # Add the faces with UVs
+    mesh.add(verts, faces, pyramid_uvs(verts, faces), ceiling_material)
+
+def create_rotunda_plus_ceiling(mesh, x, y, w, h, ceiling_material, ceiling_height):
+    """
+    Adds a plus-shaped ceiling with sloping arms that connect to the truncated circle quadrants to `mesh`.
+    
+    Parameters:
+    - mesh: RoomMesh of the room.
+    - x, y: Bottom-left corner of the room.
+    - w, h: Dimensions of the room.
+    - ceiling_material: Material to apply to the ceiling.
+    - ceiling_height: The final height at the center of the plus.
+    """
+    center_x = x + w / 2
+    center_y = y + h / 2
+    base_height = ceiling_height - 0.5  # Height of the edges
+    slope_height = ceiling_height      # Height at the center
+
+    # Create horizontal arms of the plus
+    for i in range(w):
+        start_x = x + i
+        end_x = start_x + 1
+        if i == 0:  # Westmost square
+            verts = [
+                (start_x, center_y - 0.5, base_height + 0.5),
+                (end_x, center_y - 0.5, slope_height + 0.5),
+                (end_x, center_y + 0.5, slope_height + 0.5),
+                (start_x, center_y + 0.5, base_height + 0.5),
+            ]
+        elif i == w - 1:  # Eastmost square
+            verts = [
+                (start_x, center_y - 0.5, slope_height + 0.5),
+                (end_x, center_y - 0.5, base_height + 0.5),
+                (end_x, center_y + 0.5, base_height + 0.5),
+                (start_x, center_y + 0.5, slope_height + 0.5),
+            ]
+        else:  # Flat squares in the middle
+            verts = [
+                (start_x, center_y - 0.5, base_height + 1),
+                (end_x, center_y - 0.5, base_height + 1),
+                (end_x, center_y + 0.5, base_height + 1),
+                (start_x, center_y + 0.5, base_height + 1),
+            ]
+        face = (3, 2, 1, 0)
+        mesh.add(verts, [face], [planar_uv(verts[k][0], verts[k][1], (0, 0, 0)) for k in face], ceiling_material)
+
+    # Create vertical arms of the plus
+    for j in range(h):
+        start_y = y + j
+        end_y = start_y + 1
+        if j == 0:  # Southmost square
+            verts = [
+                (center_x - 0.5, start_y, base_height + 0.5),
+                (center_x + 0.5, start_y, base_height + 0.5),
+                (center_x + 0.5, end_y, slope_height + 0.5),
+                (center_x - 0.5, end_y, slope_height + 0.5),
+            ]
+        elif j == h - 1:  # Northmost square
+            verts = [
+                (center_x - 0.5, start_y, slope_height + 0.5),
+                (center_x + 0.5, start_y, slope_height + 0.5),
+                (center_x + 0.5, end_y, base_height + 0.5),
+                (center_x - 0.5, end_y, base_height + 0.5),
+            ]
+        else:  # Flat squares in the middle
+            verts = [
+                (center_x - 0.5, start_y, base_height + 1),
+                (center_x + 0.5, start_y, base_height + 1),
+                (center_x + 0.5, end_y, base_height + 1),
+                (center_x - 0.5, end_y, base_height + 1),
+            ]
+        face = (3, 2, 1, 0)
+        mesh.add(verts, [face], [planar_uv(verts[k][0], verts[k][1], (0, 0, 0)) for k in face], ceiling_material)
+
+def add_rotunda_ceiling(mesh, rect, ceiling_material, story):
+    """
+    Adds a rotunda ceiling consisting of truncated circle quadrant ceilings and a central plus ceiling to `mesh`.
+
+    Parameters:
+    - mesh: RoomMesh of the room.
+    - rect: The dictionary containing room parameters (x, y, w, h, ceiling, story).
+    - ceiling_material: The material to be applied to the ceiling.
+    """
+    x, y, w, h = rect['x'], rect['y'], rect['w'], rect['h']
+    ceiling = rect.get('ceiling', 1)
+    story = rect.get('story', 0)
+    z_offset = -abs(story)  # Adjust Z-offset based on story
+
+    room_ceiling_height = ceiling + z_offset + 1  # Adjust height to account for story
+    fixed_height = 0.5
+
+    # Create truncated pyramid ceilings for circle quadrants
+    radius = (min(w, h) - 1) / 2
+
+    offset = h / 2 - 0.5
+    for quadrant, center_x, center_y in (
+        (1, x + w - offset, y + h - offset),
+        (2, x + offset, y + h - offset),
+        (3, x + offset, y + offset),
+        (4, x + w - offset, y + offset),
+    ):
+        add_template(
+            mesh, ('truncated_circle_quadrant_ceiling', radius, quadrant, ceiling_material, fixed_height),
+            (center_x, center_y, room_ceiling_height),
+            lambda part, px, py, pz: create_truncated_circle_quadrant_ceiling(
+                part, px, py, radius, quadrant=quadrant, ceiling_material=ceiling_material,
+                room_ceiling_height=pz, fixed_height=fixed_height
+            ),
+        )
+
+    # Cover the remaining part with a plus-shaped ceiling
+    add_template(
+        mesh, ('rotunda_plus_ceiling', w, h, ceiling_material), (x, y, room_ceiling_height),
+        lambda part, px, py, pz: create_rotunda_plus_ceiling(part, px, py, w, h, ceiling_material, pz),
+    )
+
+def ramp_drop(rect, direction, x, y):
+    """How far a ramp's geometry at (x, y) is lowered (1 Blender unit per story)."""
+    slope_amount = 1
+    if direction == "north":
+        return slope_amount * (y - rect['y']) / rect['h']
+    elif direction == "south":
+        return slope_amount * (rect['y'] + rect['h'] - y) / rect['h']
+    elif direction == "east":
+        return slope_amount * (x - rect['x']) / rect['w']
+    elif direction == "west":
+        return slope_amount * (rect['x'] + rect['w'] - x) / rect['w']
+    return 0
+
+
+def apply_ramp_slope(mesh, rect):
+    """
+    Apply a slope to the ramp's RoomMesh, adjusting all vertices (floor, walls, ceiling),
+    and ensure the normals face inwards toward the center of the mesh.
+    """
+    direction = rect.get('ramp_dir', 'north')  # Default to 'north' if not specified
+    verts, corners, starts, sizes, uvs = mesh.arrays()
+
+    # Apply the slope
+    verts[:, 2] -= ramp_drop(rect, direction, verts[:, 0], verts[:, 1])
+
+    # Recalculate normals programmatically to ensure they face the center of the mesh
+    corners, uvs = recalculate_inward_normals(verts, corners, starts, sizes, uvs)
+    mesh.set_arrays(verts, corners, starts, uvs)
+
+
+def adjust_wall_uvs(mesh, rect, direction):
+    """
+    Adjust UVs for walls in a room's RoomMesh based on their orientation.
+
+    Parameters:
+    - mesh: The RoomMesh of the ramp room.
+    - rect: Dictionary containing ramp parameters (x, y, w, h).
+    - direction: Ramp direction ('north', 'south', 'east', 'west').
+    """
+    log.debug("Adjusting UVs for walls in ramp at (%s, %s), direction: %s", rect['x'], rect['y'], direction)
+
+    verts, corners, starts, sizes, uvs = mesh.arrays()
+
+    # Identify wall faces by their normal orientation
+    normals = face_normals(verts, corners, starts, sizes)
+    lengths = np.linalg.norm(normals, axis=1)
+    is_wall = np.zeros(len(sizes), dtype=bool)
+    np.less(np.abs(normals[:, 2]), 0.7 * lengths, out=is_wall, where=lengths > 0)  # Walls are vertical (not horizontal floors/ceilings)
+
+    # Adjust the UVs by reversing the slope effect
+    wall_corners = np.repeat(is_wall, sizes)
+    points = verts[corners[wall_corners]]
+    uvs[wall_corners, 1] -= ramp_drop(rect, direction, points[:, 0], points[:, 1])
+    mesh.set_arrays(verts, corners, starts, uvs)
+
+    log.debug("UV adjustment completed for ramp at (%s, %s)", rect['x'], rect['y'])
+
+
+def recalculate_inward_normals(verts, corners, starts, sizes, uvs):
+    """
+    Reverse the winding of every face that faces away from the mesh's centroid.
+
+    Parameters:
+    - verts, corners, starts, sizes, uvs: Arrays of RoomMesh.arrays.
+
+    Returns:
+    - The reordered corners and UVs.
+    """
+    if not len(sizes):
+        return corners, uvs
+
+    # Calculate the centroid of the mesh and of every face
+    centroid = verts.mean(axis=0)
+    face_centers = np.add.reduceat(verts[corners], starts) / sizes[:, None]
+
+    # Flip the faces whose normal points outward (dot product < 0 means facing away)
+    normals = face_normals(verts, corners, starts, sizes)
+    flip = np.einsum('ij,ij->i', normals, centroid - face_centers) < 0
+    order = flip_corners(starts, sizes, flip)
+    return corners[order], uvs[order]
+
+
+def create_hexagonal_column(x, y, story, room_height, vaulted_ceiling_height=0, column_material=COLUMN_MATERIAL):
+    """
+    Creates an hexagonal column at the specified position and story, with height based on room height and vaulted ceiling.
+
+    The geometry and UVs are those of bpy.ops.mesh.primitive_cylinder_add(vertices=6) after
+    the old adjust_column_uvs: a ring of quads between two hexagonal caps. Side UVs wrap
+    once around the column with V scaled along its height, the caps are unwrapped as
+    circles in the lower half of the UV square.
+
+    Parameters:
+    - x, y: Coordinates of the column's position.
+    - story: The story (floor level) of the column, used to adjust the Z offset.
+    - room_height: The height of the room.
+    - vaulted_ceiling_height: Additional height if the room has a vaulted ceiling.
+    - column_material: The material to apply to the column.
+
+    Returns:
+    - RoomMesh of the column, with its origin at the column's center.
+    """
+    total_height = 1 + room_height + vaulted_ceiling_height  # Total column height
+    z_offset = -abs(story)  # Adjust Z-position based on story
+
+    location = (x, y, z_offset + total_height / 2)  # Centered vertically
+    column = RoomMesh(location)
+    add_template(
+        column, ('hexagonal_column', total_height, column_material), (x, y, z_offset),
+        lambda part, px, py, pz: add_hexagonal_column(part, px, py, pz, total_height, column_material),
+    )
+    log.debug("Created column at (%s, %s) with height %s.", x, y, total_height)
+    return column
+
+
+def layout_columns(data, tile_map=None):
+    """
+    The columns of a layout that are built, with the height of the room they stand in.
+
+    Parameters:
+    - data: Layout dict, as read from its JSON file.
+    - tile_map: TileRoomMap of the layout's rects (default = a new one).
+
+    Returns:
+    - List of (x, y, story, room_height, vaulted_ceiling_height), the arguments of
+      create_hexagonal_column. Columns outside any room are left out.
+    """
+    if tile_map is None:
+        tile_map = TileRoomMap(data['rects'])
+
+    columns = []
+    for column in data.get('columns', []):
+        x, y = column['x'], column['y']
+        story = column.get('story', 0)  # Default story is 0 if not specified
+
+        # Find the corresponding room for this column
+        room = tile_map.room_at(x, y)
+        if room:
+            room_height = room.get('ceiling', 1)  # Default room height if not provided
+            vaulted_ceiling_height = 0.5 if room.get('vault', 0) == 1 else 0  # Additional height for vaulted ceilings
+            columns.append((x, y, story, room_height, vaulted_ceiling_height))
+    return columns
+
+
+def add_hexagonal_column(mesh, x, y, z, total_height, column_material=COLUMN_MATERIAL):
+    """
+    Add the geometry of create_hexagonal_column to `mesh`.
+
+    Parameters:
+    - mesh: RoomMesh to add the column to.
+    - x, y, z: Center of the column's bottom.
+    - total_height: Height of the column.
+    - column_material: The material to apply to the column.
+    """
+    radius = COLUMN_RADIUS
+    segments = 6
+    center_z = z + total_height / 2
+
+    # Ring of vertices at the bottom (even) and top (odd), clockwise from +Y like Blender's
+    ring = [(math.sin(2 * math.pi * i / segments), math.cos(2 * math.pi * i / segments)) for i in range(segments)]
+    verts = []
+    for ring_x, ring_y in ring:
+        for local_z in (-total_height / 2, total_height / 2):
+            verts.append((x + ring_x * radius, y + ring_y * radius, center_z + local_z))
+
+    faces, uvs = [], []
+    bottom, top = -total_height / 2, total_height / 2
+    for i in range(segments):
+        j = (i + 1) % segments
+        faces.append((2 * i, 2 * i + 1, 2 * j + 1, 2 * j))
+
+        # Scale UV Y based on vertex height
+        for u, local_z in ((i, bottom), (i, top), (i + 1, top), (i + 1, bottom)):
+            uvs.append((1 - u / segments, local_z / total_height * 4))
+
+    # Caps facing up and down, starting from the corners Blender starts them from
+    top_cap = [1, 0] + list(reversed(range(2, segments)))
+    faces.append(tuple(2 * i + 1 for i in top_cap))
+    uvs.extend((0.25 + ring[i][0] * 0.24, 0.25 + ring[i][1] * 0.24) for i in top_cap)
+    faces.append(tuple(2 * i for i in range(segments)))
+    uvs.extend((0.75 + ring_x * 0.24, 0.25 + ring_y * 0.24) for ring_x, ring_y in ring)
+
+    mesh.add(verts, faces, uvs, column_material)
+
+
+def room_location(rect):
+    """
+    Origin of a room's object: the center of its floor, where the joined room object used
+    to get it from. Rotundas and rooms left to their doorways are at the world origin.
+    """
+    return (rect['x'] + rect['w'] / 2, rect['y'] + rect['h'] / 2, -abs(rect.get('story', 0)))
+
+
+def dungeon_matrix(origin, scale_factor=1.28):
+    """
+    Matrix that scales the whole dungeon and moves the origin of the room at (0,0) to the
+    world origin.
+
+    Parameters:
+    - origin: Location of the room at (0,0) in layout coordinates, or None if there is no
+      such room (the dungeon is then only scaled).
+    - scale_factor: The uniform scale factor to apply to the entire dungeon.
+    """
+    log.debug("Scaling dungeon by a factor of %s...", scale_factor)
+    matrix = np.diag([scale_factor, scale_factor, scale_factor, 1.0])
+
+    if origin is None:
+        log.warning("Room at (0, 0) not found. Skipping translation.")
+        return matrix
+
+    matrix[:3, 3] = [-c * scale_factor for c in origin]
+    log.debug("Translating the dungeon by %s to align (0,0) room with the origin.", tuple(matrix[:3, 3]))
+    return matrix
+
+
+def dungeon_meshes(data, assets=None, timer=None, scale_factor=1.28, merge_quads=False, optimize=False, matrix=None):
+    """
+    Geometry of a whole dungeon layout.
+
+    Parameters:
+    - data: Layout dict, as read from its JSON file.
+    - assets: Dict with the 'wall' and 'doorway' Assets (default = load_assets()).
+    - timer: StageTimer to charge the stages to (default = none).
+    - scale_factor: The uniform scale factor to apply to the entire dungeon.
+    - merge_quads: Merge coplanar floor, wall and ceiling quads of every room into larger
+      rectangles (see mesh_optimize.merge_coplanar_quads).
+    - optimize: Weld, drop degenerate faces and reorder every mesh for the vertex cache
+      (see mesh_optimize.optimize_mesh).
+    - matrix: Dungeon transform (default = dungeon_matrix with the origin of Room_0_0 and
+      `scale_factor`). Parts of a split layout pass that of the whole layout.
+
+    Returns:
+    - Dict of object name -> RoomMesh: Room_<x>_<y> for every room, then Doorway_<x>_<y>
+      for doorways outside any room and Column_<x>_<y> for columns, in final coordinates.
+    """
+    if assets is None:
+        assets = load_assets()
+    if timer is None:
+        timer = StageTimer(log, 'geometry')
+
+    room_meshes = {}
+
+    # Tile-to-room lookup shared by doorways, door joins and columns
+    tile_map = TileRoomMap(data['rects'])
+
+    # Step 1: Identify rooms that have doorways
+    rooms_with_doorways = set()
+    for door in data.get('doors', []):
+        if door.get('type') in DOORWAY_TYPES or (door['x'] == 0 and door['y'] == 0):  # Only consider valid door types
+            rect = tile_map.room_at(door['x'], door['y'])
+            if rect is not None:
+                rooms_with_doorways.add((rect['x'], rect['y']))
+
+    timer.lap('setup')
+
+    # Step 2: Collect the geometry of all rooms, ensuring a mesh exists even if a doorway is present
+    for rect in data['rects']:
+        room_coords = (rect['x'], rect['y'])
+        room_name = f"Room_{rect['x']}_{rect['y']}"
+        story = rect.get('story', 0)
+
+        # **Only create an empty mesh for rooms that have valid doorways**
+        if room_coords in rooms_with_doorways:
+            room_meshes[room_name] = RoomMesh()
+            continue  # Skip floor, walls, and ceiling creation
+
+        if 'rotunda' in rect and rect['rotunda']:
+            mesh = RoomMesh()
+            create_rotunda_quadrants(mesh, rect, floor_material=FLOOR_MATERIAL, wall_material=WALL_MATERIAL)
+            create_rotunda_plus(mesh, rect['x'], rect['y'], rect['w'], rect['h'], floor_material=FLOOR_MATERIAL, story=story)
+
+            # Only the walls in the middle of each side; the layout itself is left as it is
+            for wall in keep_cardinal_walls(rect):
+                create_wall(
+                    mesh, wall['x'], wall['y'], wall['dir']['x'], wall['dir']['y'],
+                    rect['x'], rect['y'], rect['w'], rect['h'], wall_material=WALL_MATERIAL,
+                    story=story, level=wall['level'], tileset_wall=assets['wall']
+                )
+
+        # Process as a standard room or ramp (flat at this stage)
+        else:
+            mesh = RoomMesh(room_location(rect))
+            create_floor(mesh, rect['x'], rect['y'], rect['w'], rect['h'], floor_material=FLOOR_MATERIAL, story=story)
+            if rect['w'] == 1 or rect['h'] == 1:
+                # Tileset walls are placed one unit at a time
+                for wall in room_walls(rect):
+                    create_wall(
+                        mesh, wall['x'], wall['y'], wall['dir']['x'], wall['dir']['y'],
+                        rect['x'], rect['y'], rect['w'], rect['h'], wall_material=WALL_MATERIAL,
+                        story=story, level=wall['level'], tileset_wall=assets['wall']
+                    )
+            else:
+                # Procedural walls get one plane per straight run
+                for segment in room_segments(rect):
+                    create_wall_segment(mesh, segment, rect['x'], rect['y'], wall_material=WALL_MATERIAL, story=story)
+
+        # Add ceiling to room
+        if 'rotunda' in rect and rect['rotunda']:
+            add_rotunda_ceiling(mesh, rect, CEILING_MATERIAL, story)
+        else:
+            # Check the "vault" key to determine the type of ceiling
+            if rect.get('vault', 0) == 1:  # Vaulted ceiling
+                w, h, room_ceiling_height = rect['w'], rect['h'], rect.get('ceiling', 1) + 1
+                add_template(
+                    mesh, ('truncated_pyramid_ceiling', w, h, room_ceiling_height, CEILING_MATERIAL),
+                    (rect['x'], rect['y'], -abs(story)),
+                    lambda part, px, py, pz: create_truncated_pyramid_ceiling(
+                        part, px, py, w, h, room_ceiling_height, CEILING_MATERIAL, story=-pz
+                    ),
+                )
+            else:  # Standard flat ceiling
+                create_ceiling(
+                    mesh, rect['x'], rect['y'], rect['w'], rect['h'], rect.get('ceiling', 1) + 1, CEILING_MATERIAL, story=story
+                )
+
+        room_meshes[room_name] = mesh
+
+    timer.lap('rooms')
+
+    # Apply slope to ramp rooms
+    for rect in data['rects']:
+        if rect['type'] == 'ramp':
+            room_name = f"Room_{rect['x']}_{rect['y']}"
+            ramp_mesh = room_meshes.get(room_name)
+            if ramp_mesh is not None and ramp_mesh.faces:  # Ramps left to their doorways have no geometry
+                log.debug("Applying slope and UVs to ramp: %s, Direction: %s", room_name, rect['ramp_dir'])
+
+                # Apply slope to the entire ramp
+                apply_ramp_slope(ramp_mesh, rect)
+
+                # Adjust UVs for walls in the room
+                adjust_wall_uvs(ramp_mesh, rect, rect['ramp_dir'])
+
+
+    timer.lap('ramps')
+
+    # Handle doors; doorways inside a room are added to its mesh, the others are separate
+    doorways = {}
+    for door in data.get('doors', []):
+        # Skip doors that don't meet the criteria
+        if not (door.get('type') in DOORWAY_TYPES or (door['x'] == 0 and door['y'] == 0)):
+            continue
+
+        # Retrieve the story from the door object
+        door_story = door.get('story', 0)  # Default to 0 if no story is assigned
+
+        room_mesh = None
+        rect = tile_map.room_at(door['x'], door['y'])
+        if rect is not None:
+            room_mesh = room_meshes.get(f"Room_{rect['x']}_{rect['y']}")
+
+        # Create the doorway if conditions are met
+        doorway = create_doorway(
+            room_mesh, door['x'], door['y'], door['dir']['x'], door['dir']['y'], assets['doorway'], story=door_story
+        )
+        if doorway is not None:
+            doorways[f"Doorway_{door['x']}_{door['y']}"] = doorway
+
+    timer.lap('doorways')
+
+    if merge_quads:
+        for room_name, mesh in room_meshes.items():
+            removed = merge_coplanar_quads(mesh, TILED_MATERIALS)
+            log.debug("Merged quads of %s: %s faces fewer.", room_name, removed)
+        timer.lap('merge')
+
+    # Create columns
+    columns = {}
+    for x, y, story, room_height, vaulted_ceiling_height in layout_columns(data, tile_map):
+        columns[f"Column_{x}_{y}"] = create_hexagonal_column(x, y, story, room_height, vaulted_ceiling_height, COLUMN_MATERIAL)
+
+    timer.lap('columns')
+    log.debug("Template cache: %s hits, %s misses.", TEMPLATES.hits, TEMPLATES.misses)
+
+    # Scale the entire dungeon and move the room at (0,0) to the origin
+    if matrix is None:
+        origin_room = room_meshes.get("Room_0_0")
+        matrix = dungeon_matrix(origin_room.location if origin_room else None, scale_factor=scale_factor)
+    meshes = {**room_meshes, **doorways, **columns}
+    for mesh in meshes.values():
+        mesh.transform(matrix)
+
+    timer.lap('transform')
+
+    if optimize:
+        for name, mesh in meshes.items():
+            welded, removed = optimize_mesh(mesh)
+            log.debug("Optimized %s: %s vertices and %s faces fewer.", name, welded, removed)
+        timer.lap('optimize')
+
+    return meshes
+
+
+def geometry_key(mesh, origin):
+    """
+    Hash of a RoomMesh's geometry relative to `origin`: vertices, faces, materials and UVs
+    up to whole texture repeats per face (rooms one tile apart have UVs one repeat apart).
+    """
+    verts, corners, starts, sizes, uvs = mesh.arrays()
+    uvs = np.round(uvs, 5)
+    if len(sizes):
+        # Shift each face by whole repeats so that its lowest UV lies in [0, 1); the UVs
+        # within a face keep their spacing, so a face spanning a seam stays distinct
+        offsets = np.floor(np.minimum.reduceat(uvs, starts, axis=0))
+        uvs = uvs - np.repeat(offsets, sizes, axis=0)
+    digest = hashlib.sha1()
+    for array in (
+        np.round(verts - origin, 5) + 0.0, corners, sizes,
+        np.round(uvs, 5) + 0.0, np.array(mesh.face_materials, dtype=np.int64),
+    ):
+        digest.update(np.ascontiguousarray(array).tobytes())
+    digest.update(repr(mesh.materials).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def local_mesh(mesh):
+    """
+    A RoomMesh around the center of its bounding box.
+
+    Returns:
+    - Geometry key of the mesh around that center (see geometry_key).
+    - The center, as an (x, y, z) tuple.
+    - RoomMesh with the vertices moved by minus the center, sharing the faces, UVs and
+      materials of `mesh`.
+    """
+    verts = np.array(mesh.verts, dtype=np.float64).reshape(-1, 3)
+    origin = (verts.min(axis=0) + verts.max(axis=0)) / 2 if len(verts) else np.zeros(3)
+    key = geometry_key(mesh, origin)
+
+    local = RoomMesh(tuple(origin.tolist()))
+    local.verts = list(map(tuple, (verts - origin).tolist()))
+    local.faces = mesh.faces
+    local.uvs = mesh.uvs
+    local.face_materials = mesh.face_materials
+    local.materials = mesh.materials
+    return key, local.location, local
+
+
+def shared_meshes(meshes):
+    """
+    Find objects with identical geometry, so they can share one mesh.
+
+    Every object gets its origin at the center of its bounding box, and objects whose
+    geometry is the same around that origin (see local_mesh) use the mesh of the first one.
+
+    Parameters:
+    - meshes: Dict of object name -> RoomMesh in final coordinates, as dungeon_meshes returns.
+
+    Returns:
+    - Dict of object name -> (mesh name, (x, y, z) location of the object).
+    - Dict of mesh name -> RoomMesh around its own origin, named after its first object.
+    """
+    objects = {}
+    shared = {}
+    first_objects = {}  # Geometry key -> mesh name
+    for name, mesh in meshes.items():
+        key, origin, local = local_mesh(mesh)
+        if key not in first_objects:
+            first_objects[key] = name
+            shared[name] = local
+        objects[name] = (first_objects[key], origin)
+
+    log.debug("%s objects share %s meshes.", len(objects), len(shared))
+    return objects, shared
+
+
+def main():
+    merge_quads = '--merge-quads' in sys.argv[1:]
+    optimize = '--optimize' in sys.argv[1:]
+    share_meshes = '--share-meshes' in sys.argv[1:]
+    assets = load_assets()
+    for json_file in sorted(glob.glob('*.json')):
+        timer = StageTimer(log, json_file)
+        with open(json_file, 'r') as f:
+            data = json.load(f)
+        timer.lap('load')
+
+        meshes = dungeon_meshes(data, assets, timer, merge_quads=merge_quads, optimize=optimize)
+        objects = len(meshes)
+        if share_meshes:
+            _, meshes = shared_meshes(meshes)
+            timer.lap('share')
+        timer.summary(
+            objects=objects,
+            meshes=len(meshes),
+            vertices=sum(len(mesh.verts) for mesh in meshes.values()),
+            faces=sum(len(mesh.faces) for mesh in meshes.values()),
+        )
+    flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+import math
+
+
+class TileRoomMap:
+    """
+    Tile-to-room lookup table built once from a layout's `rects`.
+
+    Every tile covered by a room maps to that room's index, so finding the room that
+    contains a door, column or note is a single dictionary lookup instead of a scan
+    over all rects. Points with float coordinates (column positions, `notes[].pos`)
+    resolve to the tile they fall in, matching the `x <= px < x + w` test used before.
+    """
+
+    def __init__(self, rects):
+        self.rects = rects
+        self.tiles = {}
+        for room_index, rect in enumerate(rects):
+            for tile_x in range(rect['x'], rect['x'] + rect['w']):
+                for tile_y in range(rect['y'], rect['y'] + rect['h']):
+                    # The first rect in layout order wins, as with a linear scan
+                    self.tiles.setdefault((tile_x, tile_y), room_index)
+
+    def room_index_at(self, x, y):
+        """Index of the room containing the point (x, y), or None if it is outside every room."""
+        return self.tiles.get((math.floor(x), math.floor(y)))
+
+    def room_at(self, x, y):
+        """The rect containing the point (x, y), or None if it is outside every room."""
+        room_index = self.room_index_at(x, y)
+        return None if room_index is None else self.rects[room_index]
@@ -0,0 +1,111 @@
+"""
+Compact run-length wall format.
+
+add-walls.py normally stores one dict per unit wall and level:
+
+    {"x": 3, "y": 5, "dir": {"x": 1, "y": 0}, "level": 0}
+
+With `--compact` it stores straight runs instead, under the room's `wall_segments` key:
+
+    {"x": 3, "y": 5, "dir": {"x": 1, "y": 0}, "length": 4, "levels": [0, 2]}
+
+A segment covers `length` unit walls starting at (x, y) and stepping along `dir`, on every
+level from levels[0] to levels[1] inclusive. The readers accept either format through
+`room_walls` (unit walls) and `room_segments` (runs).
+"""
+
+
+def merge_walls(walls):
+    """
+    Merge unit walls into straight segments with a shared level range.
+
+    Parameters:
+    - walls: List of unit wall dicts with `x`, `y`, `dir` and `level`.
+
+    Returns:
+    - List of segment dicts, in order of the first unit wall of each segment.
+    """
+    # Levels present at every unit wall position, in order of first appearance
+    levels_at = {}
+    for wall in walls:
+        key = (wall['x'], wall['y'], wall['dir']['x'], wall['dir']['y'])
+        levels_at.setdefault(key, []).append(wall['level'])
+
+    segments = []
+    open_ends = {}  # (next x, next y, dir x, dir y, lowest level, highest level) -> segment
+    for (x, y, dir_x, dir_y), levels in levels_at.items():
+        levels.sort()
+        start = 0
+        for i in range(1, len(levels) + 1):
+            if i < len(levels) and levels[i] == levels[i - 1] + 1:
+                continue
+
+            # Contiguous run of levels[start:i]; extend the segment ending here if there is one
+            low, high = levels[start], levels[i - 1]
+            segment = open_ends.pop((x, y, dir_x, dir_y, low, high), None)
+            if segment is None:
+                segment = {"x": x, "y": y, "dir": {"x": dir_x, "y": dir_y}, "length": 0, "levels": [low, high]}
+                segments.append(segment)
+            segment['length'] += 1
+            open_ends[(x + dir_x, y + dir_y, dir_x, dir_y, low, high)] = segment
+            start = i
+
+    return segments
+
+
+def expand_segments(segments, room):
+    """
+    Expand segments back into unit walls, in the order generate_walls emits them.
+
+    Parameters:
+    - segments: List of segment dicts.
+    - room: Room rectangle the segments belong to, used to order the sides.
+
+    Returns:
+    - List of unit wall dicts, identical to the walls the segments were merged from.
+    """
+    def side(wall):
+        # Top, bottom, left, right, then anything off the room's outline
+        if wall['dir']['x'] == 1:
+            return 0 if wall['y'] == room['y'] else 1 if wall['y'] == room['y'] + room['h'] else 4
+        return 2 if wall['x'] == room['x'] else 3 if wall['x'] == room['x'] + room['w'] else 4
+
+    walls = []
+    for segment in segments:
+        dir_x, dir_y = segment['dir']['x'], segment['dir']['y']
+        low, high = segment['levels']
+        for level in range(low, high + 1):
+            for i in range(segment['length']):
+                walls.append({"x": segment['x'] + i * dir_x, "y": segment['y'] + i * dir_y, "dir": {"x": dir_x, "y": dir_y}, "level": level})
+
+    walls.sort(key=lambda wall: (wall['level'], side(wall), wall['x'] + wall['y']))
+    return walls
+
+
+def room_walls(room):
+    """Unit walls of a room in either format (empty if it has none)."""
+    if 'wall_segments' in room:
+        return expand_segments(room['wall_segments'], room)
+    return room.get('walls', [])
+
+
+def room_segments(room):
+    """Wall segments of a room in either format (empty if it has none)."""
+    if 'wall_segments' in room:
+        return room['wall_segments']
+    return merge_walls(room.get('walls', []))
+
+
+def compact_walls(rooms):
+    """
+    Replace every room's unit `walls` with `wall_segments`.
+
+    Returns:
+    - Total number of segments written.
+    """
+    total = 0
+    for room in rooms:
+        if 'walls' in room:
+            room['wall_segments'] = merge_walls(room.pop('walls'))
+            total += len(room['wall_segments'])
+    return total
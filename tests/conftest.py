@@ -0,0 +1,37 @@
+"""
+Shared fixtures for the tests of the layout scripts in Assets/Models.
+
+The tests live outside Assets so that Unity does not import them. They use the layouts
+and asset sidecars bundled next to the scripts, so Blender is not needed.
+"""
+import copy
+import glob
+import json
+import os
+import sys
+
+import pytest
+
+MODELS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Assets', 'Models')
+sys.path.insert(0, MODELS)
+
+# Layouts in the Models folder itself; DesecratedTemple holds many more of the same kind
+LAYOUTS = sorted(glob.glob(os.path.join(MODELS, '*.json')))
+
+
+def read_layout(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+@pytest.fixture(params=LAYOUTS, ids=os.path.basename)
+def layout(request):
+    """One bundled layout dict, fresh for every test."""
+    return copy.deepcopy(read_layout(request.param))
+
+
+@pytest.fixture(scope='session')
+def assets():
+    from room_geometry import load_assets
+
+    return load_assets(MODELS)
@@ -0,0 +1,69 @@
+"""
+add-stories.py runs when it is loaded, so every test runs the script on files in a
+temporary folder. Ramps picked at random always take the first candidate, so a full run
+and an incremental one can be compared.
+"""
+import copy
+import json
+import os
+import random
+import runpy
+import sys
+
+import pytest
+
+from conftest import MODELS
+
+SCRIPT = os.path.join(MODELS, 'add-stories.py')
+ANNOTATIONS = ('type', 'story', 'ramp_dir', 'ramp_info')
+
+
+@pytest.fixture(autouse=True)
+def first_candidate(monkeypatch):
+    monkeypatch.setattr(random, 'choice', lambda candidates: candidates[0])
+
+
+def unannotated(layout):
+    layout = copy.deepcopy(layout)
+    for rect in layout['rects']:
+        for key in ANNOTATIONS:
+            rect.pop(key, None)
+    for item in layout.get('doors', []) + layout.get('columns', []):
+        item.pop('story', None)
+    return layout
+
+
+def add_stories(folder, monkeypatch, layout, previous=None):
+    """Run add-stories.py on `layout` in `folder`, incrementally if `previous` is given."""
+    folder.mkdir()
+    monkeypatch.chdir(folder)
+    with open('edited.json', 'w') as f:
+        json.dump(layout, f)
+    argv = [SCRIPT]
+    if previous is not None:
+        with open('previous.txt', 'w') as f:  # Not a .json, so only the edited file is annotated
+            json.dump(previous, f)
+        argv += ['--incremental', 'previous.txt', 'edited.json']
+    monkeypatch.setattr(sys, 'argv', argv)
+    runpy.run_path(SCRIPT, run_name='__main__')
+    with open('edited.json') as f:
+        return json.load(f)
+
+
+def test_unchanged_layout_keeps_its_annotations(layout, monkeypatch, tmp_path):
+    annotated = add_stories(tmp_path / 'full', monkeypatch, unannotated(layout))
+    assert add_stories(tmp_path / 'incremental', monkeypatch, unannotated(layout), annotated) == annotated
+
+
+def test_incremental_update_matches_a_full_run(layout, monkeypatch, tmp_path):
+    layout = unannotated(layout)
+    previous = add_stories(tmp_path / 'previous', monkeypatch, layout)
+
+    # Remove a few rooms, one at a time; the entrance at (0, 0) has to stay
+    candidates = [i for i, rect in enumerate(layout['rects']) if (rect['x'], rect['y']) != (0, 0)]
+    for i in candidates[::max(1, len(candidates) // 4)]:
+        edited = copy.deepcopy(layout)
+        del edited['rects'][i]
+        full = add_stories(tmp_path / f'full{i}', monkeypatch, edited)
+        incremental = add_stories(tmp_path / f'incremental{i}', monkeypatch, edited, previous)
+        assert incremental == full, f"room {i} removed"
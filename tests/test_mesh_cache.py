@@ -0,0 +1,62 @@
+import copy
+
+import numpy as np
+
+from mesh_cache import MeshCache
+from parallel_geometry import layout_matrix, parallel_dungeon_meshes, split_layout
+from room_geometry import RoomMesh, dungeon_meshes, geometry_key
+
+
+def part_keys(layout, assets, **options):
+    return MeshCache('unused').part_keys(split_layout(layout), assets, layout_matrix(layout), **options)
+
+
+def test_keys_are_stable_and_follow_options(layout, assets):
+    keys = part_keys(layout, assets)
+
+    assert keys == part_keys(copy.deepcopy(layout), assets)
+    assert len(set(keys)) == len(keys)
+    assert set(keys).isdisjoint(part_keys(layout, assets, optimize=True))
+    assert set(keys).isdisjoint(part_keys(layout, assets, merge_quads=True))
+
+
+def test_editing_a_room_changes_only_its_key(layout, assets):
+    keys = part_keys(layout, assets)
+    parts = split_layout(layout)
+    # A room away from Room_0_0, which sets every room's transform
+    index = next(i for i, part in enumerate(parts) if part['rects'] and (part['rects'][0]['x'], part['rects'][0]['y']) != (0, 0))
+    room = parts[index]['rects'][0]
+
+    edited = copy.deepcopy(layout)
+    next(rect for rect in edited['rects'] if rect['x'] == room['x'] and rect['y'] == room['y'])['ceiling'] = 1
+    edited_keys = part_keys(edited, assets)
+
+    assert [i for i, (key, edited_key) in enumerate(zip(keys, edited_keys)) if key != edited_key] == [index]
+
+
+def test_cached_build_matches_a_fresh_one(layout, assets, tmp_path):
+    cache = MeshCache(str(tmp_path))
+    fresh = dungeon_meshes(copy.deepcopy(layout), assets)
+
+    for _ in range(2):  # Built, then read back
+        meshes = parallel_dungeon_meshes(copy.deepcopy(layout), assets, processes=1, cache=cache)
+        assert list(meshes) == list(fresh)
+        for name, mesh in fresh.items():
+            assert np.allclose(meshes[name].verts, mesh.verts), name
+            assert meshes[name].faces == mesh.faces, name
+    assert cache.hits == cache.misses > 0
+
+
+def triangle(uvs):
+    mesh = RoomMesh((0, 0, 0))
+    mesh.add([(0, 0, 0), (1, 0, 0), (1, 1, 0)], [(0, 1, 2)], uvs, 'floor')
+    return mesh
+
+
+def test_geometry_key_ignores_whole_texture_repeats_per_face():
+    key = geometry_key(triangle([(0.9, 1.1), (1.9, 1.1), (1.9, 2.1)]), (0, 0, 0))
+
+    assert key == geometry_key(triangle([(2.9, 0.1), (3.9, 0.1), (3.9, 1.1)]), (0, 0, 0))
+    # Wrapping corners one by one would give these UVs the same key
+    assert key != geometry_key(triangle([(0.9, 0.1), (0.9, 0.1), (0.9, 0.1)]), (0, 0, 0))
+    assert key != geometry_key(triangle([(0.9, 1.1), (1.9, 1.1), (1.9, 2.1)]), (1, 0, 0))
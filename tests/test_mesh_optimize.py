@@ -0,0 +1,83 @@
+import copy
+
+import numpy as np
+
+from mesh_optimize import cache_order, fetch_order, greedy_rectangles, optimize_mesh, weld_vertices
+from room_geometry import RoomMesh, dungeon_meshes
+
+
+def test_optimize_mesh_never_adds_vertices_or_faces(layout, assets):
+    plain = dungeon_meshes(copy.deepcopy(layout), assets)
+    optimized = dungeon_meshes(copy.deepcopy(layout), assets, optimize=True)
+
+    assert optimized.keys() == plain.keys()
+    for name, mesh in plain.items():
+        assert len(optimized[name].verts) <= len(mesh.verts), name
+        assert len(optimized[name].faces) <= len(mesh.faces), name
+    assert sum(len(mesh.verts) for mesh in optimized.values()) < sum(len(mesh.verts) for mesh in plain.values())
+
+
+def test_merge_quads_never_adds_faces(layout, assets):
+    plain = dungeon_meshes(copy.deepcopy(layout), assets)
+    merged = dungeon_meshes(copy.deepcopy(layout), assets, merge_quads=True)
+
+    for name, mesh in plain.items():
+        assert len(merged[name].faces) <= len(mesh.faces), name
+
+
+def grid_mesh():
+    """Two unit quads sharing an edge, each with its own four vertices."""
+    mesh = RoomMesh((0, 0, 0))
+    for x in (0, 1):
+        mesh.add(
+            [(x, 0, 0), (x + 1, 0, 0), (x + 1, 1, 0), (x, 1, 0)], [(0, 1, 2, 3)],
+            [(0, 0), (1, 0), (1, 1), (0, 1)], 'floor',
+        )
+    return mesh
+
+
+def test_weld_vertices_merges_shared_positions_and_keeps_corner_uvs():
+    mesh = grid_mesh()
+    uvs = list(mesh.uvs)
+
+    assert weld_vertices(mesh) == 2
+    assert len(mesh.verts) == 6
+    assert mesh.uvs == uvs
+    assert len(set(mesh.faces[0]) & set(mesh.faces[1])) == 2
+
+
+def test_optimize_mesh_keeps_the_surface():
+    mesh = grid_mesh()
+    before = sorted(tuple(sorted(mesh.verts[v] for v in face)) for face in mesh.faces)
+
+    optimize_mesh(mesh)
+    after = sorted(tuple(sorted(mesh.verts[v] for v in face)) for face in mesh.faces)
+    assert after == before
+
+
+def test_greedy_rectangles_cover_each_cell_once():
+    rng = np.random.default_rng(0)
+    for _ in range(20):
+        grid = rng.random((7, 9)) < 0.7
+        covered = np.zeros(grid.shape, dtype=int)
+        for i0, i1, j0, j1 in greedy_rectangles(grid):
+            covered[i0:i1, j0:j1] += 1
+        assert (covered == grid).all()
+
+
+def test_greedy_rectangles_merge_a_full_grid():
+    assert greedy_rectangles(np.ones((3, 4), dtype=bool)) == [(0, 3, 0, 4)]
+
+
+def test_cache_order_is_a_permutation():
+    rng = np.random.default_rng(1)
+    triangles = rng.integers(0, 40, size=(100, 3))
+    order = cache_order(triangles)
+    assert sorted(order.tolist()) == list(range(len(triangles)))
+    assert len(cache_order(np.zeros((0, 3), dtype=np.int64))) == 0
+
+
+def test_fetch_order_follows_first_use():
+    order, remap = fetch_order(np.array([3, 1, 3, 0]), 5)
+    assert order.tolist() == [3, 1, 0, 2, 4]
+    assert remap[order].tolist() == list(range(5))
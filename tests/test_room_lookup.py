@@ -0,0 +1,39 @@
+from room_lookup import TileRoomMap
+
+
+def linear_scan(rects, x, y):
+    """Index of the first rect containing (x, y), the lookup TileRoomMap replaces."""
+    for room_index, rect in enumerate(rects):
+        if rect['x'] <= x < rect['x'] + rect['w'] and rect['y'] <= y < rect['y'] + rect['h']:
+            return room_index
+    return None
+
+
+def test_lookup_matches_a_linear_scan(layout):
+    rects = layout['rects']
+    tile_map = TileRoomMap(rects)
+
+    points = [(door['x'], door['y']) for door in layout.get('doors', [])]
+    points += [(column['x'], column['y']) for column in layout.get('columns', [])]
+    points += [(note['pos']['x'], note['pos']['y']) for note in layout.get('notes', []) if 'pos' in note]
+    assert points
+    for x, y in points:
+        room_index = linear_scan(rects, x, y)
+        assert tile_map.room_index_at(x, y) == room_index
+        assert tile_map.room_at(x, y) is (None if room_index is None else rects[room_index])
+
+
+def test_points_between_tiles_and_outside():
+    rects = [{'x': 0, 'y': 0, 'w': 2, 'h': 1}, {'x': 2, 'y': 0, 'w': 1, 'h': 3}]
+    tile_map = TileRoomMap(rects)
+
+    assert tile_map.room_index_at(1.99, 0.5) == 0
+    assert tile_map.room_index_at(2.0, 0.5) == 1
+    assert tile_map.room_index_at(2.5, 2.99) == 1
+    assert tile_map.room_index_at(-0.01, 0) is None
+    assert tile_map.room_at(3, 0) is None
+
+
+def test_first_rect_wins_where_rects_overlap():
+    rects = [{'x': 0, 'y': 0, 'w': 2, 'h': 2}, {'x': 1, 'y': 1, 'w': 2, 'h': 2}]
+    assert TileRoomMap(rects).room_index_at(1, 1) == 0
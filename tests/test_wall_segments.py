@@ -0,0 +1,79 @@
+import copy
+
+import numpy as np
+import pytest
+
+from room_geometry import RoomMesh, create_wall, create_wall_segment, dungeon_meshes
+from wall_segments import compact_walls, expand_segments, merge_walls, room_segments, room_walls
+
+
+def test_segments_expand_back_to_the_walls(layout):
+    for room in layout['rects']:
+        walls = room.get('walls', [])
+        assert expand_segments(merge_walls(walls), room) == walls
+
+
+def test_segments_are_shorter(layout):
+    walls = sum(len(room.get('walls', [])) for room in layout['rects'])
+    segments = sum(len(room_segments(room)) for room in layout['rects'])
+    assert 0 < segments < walls
+
+
+def test_compact_walls_builds_the_same_meshes(layout, assets):
+    compacted = copy.deepcopy(layout)
+    compact_walls(compacted['rects'])
+
+    assert all('walls' not in room for room in compacted['rects'])
+    assert [room_walls(room) for room in compacted['rects']] == [room.get('walls', []) for room in layout['rects']]
+
+    plain = dungeon_meshes(layout, assets)
+    compact = dungeon_meshes(compacted, assets)
+    for name, mesh in plain.items():
+        assert compact[name].verts == mesh.verts, name
+        assert compact[name].uvs == mesh.uvs, name
+
+
+def face_uv_map(mesh, face_index):
+    """Corner positions of a face and the affine map from position to UV fitted to them."""
+    start = sum(len(face) for face in mesh.faces[:face_index])
+    face = mesh.faces[face_index]
+    points = np.array([mesh.verts[v] for v in face])
+    uvs = np.array(mesh.uvs[start:start + len(face)])
+    uv_map, *_ = np.linalg.lstsq(np.c_[points, np.ones(len(points))], uvs, rcond=None)
+    return points, uvs, uv_map
+
+
+def normal(points):
+    return np.cross(points[1] - points[0], points[2] - points[0])
+
+
+@pytest.mark.parametrize('direction', [(1, 0), (0, 1), (-1, 0), (0, -1)])
+@pytest.mark.parametrize('story', [0, -1])
+@pytest.mark.parametrize('levels', [(0, 0), (0, 2), (1, 3)])
+@pytest.mark.parametrize('length', [1, 4])
+def test_segment_matches_its_unit_walls(direction, story, levels, length):
+    x, y = 5, 7
+    dir_x, dir_y = direction
+    low, high = levels
+    segment = {"x": x, "y": y, "dir": {"x": dir_x, "y": dir_y}, "length": length, "levels": [low, high]}
+
+    for rect_x, rect_y in ((x, y), (x - 1, y - 1)):
+        merged = RoomMesh((0, 0, 0))
+        create_wall_segment(merged, segment, rect_x, rect_y, 'wall', story)
+        units = RoomMesh((0, 0, 0))
+        for level in range(low, high + 1):
+            for i in range(length):
+                create_wall(units, x + i * dir_x, y + i * dir_y, dir_x, dir_y, rect_x, rect_y, 9, 9, 'wall', story, level)
+
+        assert len(merged.faces) == 1
+        points, _, uv_map = face_uv_map(merged, 0)
+        unit_points = np.array(units.verts)
+        assert np.allclose(points.min(axis=0), unit_points.min(axis=0))
+        assert np.allclose(points.max(axis=0), unit_points.max(axis=0))
+
+        # Same facing, and the same texture phase at every unit wall corner
+        for face_index in range(len(units.faces)):
+            corners, corner_uvs, _ = face_uv_map(units, face_index)
+            assert np.dot(normal(points), normal(corners)) > 0
+            offset = np.c_[corners, np.ones(len(corners))] @ uv_map - corner_uvs
+            assert np.allclose((offset + 0.5) % 1.0 - 0.5, 0.0, atol=1e-6)